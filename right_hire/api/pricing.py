@@ -0,0 +1,8 @@
+import frappe
+
+from right_hire.right_hire.pricing import quote_matrix
+
+@frappe.whitelist()
+def bulk_quote(cells, include_availability=0):
+    """Price a matrix of (rate_plan or vehicle_category, pickup, return, extras) cells in one call"""
+    return quote_matrix(frappe.parse_json(cells), include_availability=include_availability)
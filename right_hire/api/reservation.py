@@ -1,6 +1,8 @@
 import frappe
 from frappe import _
 
+from right_hire.right_hire.allocation import allocate_reservations_for_day
+
 @frappe.whitelist()
 def create_reservation(customer, pickup_datetime, return_datetime, rate_plan, 
                        branch, vehicle=None, driver=None, extras=None):
@@ -29,3 +31,9 @@ def create_reservation(customer, pickup_datetime, return_datetime, rate_plan,
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Create Reservation Failed")
         return {"error": str(e)}
+
+@frappe.whitelist()
+def allocate_day(pickup_date, branch=None, dry_run=0):
+    """Assign all unallocated Smart reservations picking up on a day as one batch"""
+    frappe.only_for(("Fleet Manager", "Right Hire Admin", "System Manager"))
+    return allocate_reservations_for_day(pickup_date, branch=branch, dry_run=dry_run)
@@ -1,6 +1,15 @@
 import frappe
 from frappe import _
 
+from right_hire.right_hire import status_counts
+from right_hire.right_hire.availability import (
+    VEHICLE_SEARCH_FIELDS,
+    get_availability_grid,
+    get_available_vehicles,
+    get_vehicle_occupancy,
+)
+from right_hire.right_hire.status_counts import STATUS_FIELDS
+
 @frappe.whitelist()
 def check_availability(vehicle, start_datetime, end_datetime):
     """Check if a vehicle is available for booking"""
@@ -27,13 +36,23 @@ def search_available_vehicles(start_datetime, end_datetime, branch=None, make=No
     if model:
         filters["model"] = model
     
-    vehicles = frappe.get_all("Vehicle", filters=filters,
-        fields=["name", "make", "model", "year", "plate_no", "color", "transmission", "fuel_type"])
-    
-    available = []
-    for vehicle in vehicles:
-        vehicle_doc = frappe.get_doc("Vehicle", vehicle.name)
-        if vehicle_doc.check_availability(start_datetime, end_datetime):
-            available.append(vehicle)
-    
-    return available
+    return get_available_vehicles(start_datetime, end_datetime, filters=filters,
+        fields=VEHICLE_SEARCH_FIELDS)
+
+@frappe.whitelist()
+def get_vehicle_calendar(vehicle, start_datetime, end_datetime):
+    """Bookings holding a vehicle within a period, for the calendar view"""
+    return get_vehicle_occupancy([vehicle], start_datetime, end_datetime)
+
+@frappe.whitelist()
+def get_fleet_availability_grid(branch, from_date, to_date):
+    """Run-length encoded vehicles x days availability board for a branch"""
+    return get_availability_grid(branch, from_date, to_date)
+
+@frappe.whitelist()
+def get_status_counts(doctype="Vehicle", branch=None):
+    """Per-status counts for dashboards, served from the status counters"""
+    if doctype not in STATUS_FIELDS:
+        frappe.throw(_("Status counts are not kept for {0}").format(doctype))
+    frappe.has_permission(doctype, throw=True)
+    return status_counts.get_status_counts(doctype, branch or None)
@@ -0,0 +1,99 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+"""Benchmark the smart allocation engine on a synthetic fleet.
+
+Pure in-memory run, no database access:
+
+    bench --site <site> execute right_hire.benchmarks.allocation.run \
+        --kwargs "{'vehicles': 3000, 'reservations': 3000}"
+"""
+
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from right_hire.right_hire.allocation import AllocationEngine
+
+MAKES = {
+    "Toyota": ["Corolla", "Camry", "Land Cruiser"],
+    "Nissan": ["Sunny", "Patrol"],
+    "Kia": ["Picanto", "Sportage"],
+}
+
+
+def run(vehicles=3000, reservations=3000, existing=3000, branches=3, seed=42):
+    """Allocate a day's reservations on a fleet with existing bookings and print timings."""
+    vehicles, reservations, existing, branches = int(vehicles), int(reservations), int(existing), int(branches)
+    rng = random.Random(seed)
+    day = datetime(2025, 1, 15)
+
+    fleet = make_fleet(rng, vehicles, branches)
+    bookings = make_bookings(rng, fleet, existing, day)
+    batch = make_reservations(rng, reservations, branches, day)
+
+    t0 = time.perf_counter()
+    engine = AllocationEngine(fleet, bookings)
+    t1 = time.perf_counter()
+    results = engine.assign_batch(batch)
+    t2 = time.perf_counter()
+
+    assigned = sum(1 for vehicle, _cost in results.values() if vehicle)
+    summary = {
+        "vehicles": vehicles,
+        "reservations": reservations,
+        "existing_bookings": existing,
+        "assigned": assigned,
+        "unassigned": reservations - assigned,
+        "load_ms": round((t1 - t0) * 1000, 1),
+        "allocate_ms": round((t2 - t1) * 1000, 1),
+        "per_reservation_us": round((t2 - t1) * 1_000_000 / max(reservations, 1), 1),
+    }
+
+    for key, value in summary.items():
+        print(f"{key:<22} {value}")
+    return summary
+
+
+def make_fleet(rng, count, branches):
+    fleet = []
+    for i in range(count):
+        make = rng.choice(list(MAKES))
+        fleet.append({
+            "name": f"VEH-{i:05d}",
+            "branch": f"Branch {i % branches}",
+            "make": make,
+            "model": rng.choice(MAKES[make]),
+            "odometer": rng.randint(0, 150_000),
+            "next_service_due": date(2025, 1, 1) + timedelta(days=rng.randint(0, 120)),
+        })
+    return fleet
+
+
+def make_bookings(rng, fleet, count, day):
+    """Non-overlapping existing bookings spread around the allocation day."""
+    cursor = {v["name"]: day - timedelta(days=20) for v in fleet}
+    bookings = []
+    for _ in range(count):
+        vehicle = rng.choice(fleet)["name"]
+        start = cursor[vehicle] + timedelta(hours=rng.randint(0, 96))
+        end = start + timedelta(hours=rng.randint(24, 240))
+        cursor[vehicle] = end
+        bookings.append({"vehicle": vehicle, "start": start, "end": end})
+    return bookings
+
+
+def make_reservations(rng, count, branches, day):
+    batch = []
+    for i in range(count):
+        pickup = day + timedelta(minutes=rng.randint(0, 23 * 60))
+        make = rng.choice(list(MAKES)) if rng.random() < 0.3 else None
+        batch.append({
+            "name": f"RES-{i:05d}",
+            "branch": f"Branch {i % branches}",
+            "preferred_make": make,
+            "preferred_model": None,
+            "pickup_datetime": pickup,
+            "return_datetime": pickup + timedelta(hours=rng.randint(24, 24 * 14)),
+        })
+    return batch
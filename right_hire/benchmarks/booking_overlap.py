@@ -0,0 +1,164 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+"""Benchmark the booking overlap predicate.
+
+Compares the legacy three-way OR predicate with the half-open
+`start < :end AND end > :start` form, with and without the
+(vehicle, status, start, end) composite index.
+
+Runs against a scratch table seeded with synthetic agreements, so real data
+is never touched:
+
+    bench --site <site> execute right_hire.benchmarks.booking_overlap.run \
+        --kwargs "{'rows': 1000000}"
+"""
+
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import frappe
+
+SCRATCH_TABLE = "__rh_bench_rental_agreement"
+INDEX_NAME = "vehicle_status_period"
+STATUSES = ("Draft", "Active", "Due for Return", "Returned", "Closed", "Cancelled")
+HOLDING_STATUSES = ("Draft", "Active", "Due for Return", "Returned")
+
+LEGACY_QUERY = f"""
+    SELECT name FROM `{SCRATCH_TABLE}`
+    WHERE vehicle = %(vehicle)s
+      AND agreement_status NOT IN ('Cancelled', 'Closed')
+      AND (
+            (start_datetime <= %(start)s AND end_datetime >= %(start)s)
+         OR (start_datetime <= %(end)s AND end_datetime >= %(end)s)
+         OR (start_datetime >= %(start)s AND end_datetime <= %(end)s)
+      )
+"""
+
+SARGABLE_QUERY = f"""
+    SELECT name FROM `{SCRATCH_TABLE}`
+    WHERE vehicle = %(vehicle)s
+      AND agreement_status IN %(statuses)s
+      AND start_datetime < %(end)s
+      AND end_datetime > %(start)s
+"""
+
+
+def run(rows=1_000_000, vehicles=2000, probes=200, batch_size=10_000, keep_table=False, seed=42):
+    """Seed the scratch table, time both predicates before and after indexing and print a summary."""
+    rows, vehicles, probes = int(rows), int(vehicles), int(probes)
+    rng = random.Random(seed)
+    origin = datetime(2023, 1, 1)
+    span_days = 730
+
+    create_scratch_table()
+    try:
+        seed_agreements(rng, rows, vehicles, origin, span_days, int(batch_size))
+        probe_params = make_probes(rng, probes, vehicles, origin, span_days)
+
+        results = {
+            "legacy_no_index": measure(LEGACY_QUERY, probe_params),
+            "sargable_no_index": measure(SARGABLE_QUERY, probe_params),
+        }
+
+        frappe.db.sql_ddl(
+            f"ALTER TABLE `{SCRATCH_TABLE}` ADD INDEX `{INDEX_NAME}`"
+            " (vehicle, agreement_status, start_datetime, end_datetime)"
+        )
+
+        results["legacy_indexed"] = measure(LEGACY_QUERY, probe_params)
+        results["sargable_indexed"] = measure(SARGABLE_QUERY, probe_params)
+
+        plans = {
+            "legacy": explain(LEGACY_QUERY, probe_params[0]),
+            "sargable": explain(SARGABLE_QUERY, probe_params[0]),
+        }
+    finally:
+        if not int(keep_table):
+            frappe.db.sql_ddl(f"DROP TABLE IF EXISTS `{SCRATCH_TABLE}`")
+
+    print_summary(rows, probes, results, plans)
+    return {"results": results, "plans": plans}
+
+
+def create_scratch_table():
+    frappe.db.sql_ddl(f"DROP TABLE IF EXISTS `{SCRATCH_TABLE}`")
+    frappe.db.sql_ddl(f"""
+        CREATE TABLE `{SCRATCH_TABLE}` (
+            name VARCHAR(140) NOT NULL PRIMARY KEY,
+            vehicle VARCHAR(140),
+            agreement_status VARCHAR(140),
+            start_datetime DATETIME(6),
+            end_datetime DATETIME(6)
+        ) ENGINE=InnoDB
+    """)
+
+
+def seed_agreements(rng, rows, vehicles, origin, span_days, batch_size):
+    """Insert `rows` synthetic agreements of 1-30 days spread over `vehicles`."""
+    for offset in range(0, rows, batch_size):
+        values = []
+        for i in range(offset, min(offset + batch_size, rows)):
+            start = origin + timedelta(minutes=rng.randrange(span_days * 24 * 60))
+            end = start + timedelta(hours=rng.randint(24, 30 * 24))
+            values.append((
+                f"BENCH-{i:08d}",
+                f"VEH-{rng.randrange(vehicles):05d}",
+                rng.choice(STATUSES),
+                start,
+                end,
+            ))
+
+        placeholders = ", ".join(["(%s, %s, %s, %s, %s)"] * len(values))
+        frappe.db.sql(
+            f"INSERT INTO `{SCRATCH_TABLE}` (name, vehicle, agreement_status, start_datetime, end_datetime)"
+            f" VALUES {placeholders}",
+            [v for row in values for v in row],
+        )
+        frappe.db.commit()
+
+
+def make_probes(rng, probes, vehicles, origin, span_days):
+    params = []
+    for _ in range(probes):
+        start = origin + timedelta(days=rng.randrange(span_days))
+        params.append({
+            "vehicle": f"VEH-{rng.randrange(vehicles):05d}",
+            "start": start,
+            "end": start + timedelta(days=rng.randint(1, 14)),
+            "statuses": HOLDING_STATUSES,
+        })
+    return params
+
+
+def measure(query, probe_params):
+    timings = []
+    for params in probe_params:
+        t0 = time.perf_counter()
+        frappe.db.sql(query, params)
+        timings.append((time.perf_counter() - t0) * 1000)
+
+    timings.sort()
+    return {
+        "mean_ms": round(statistics.mean(timings), 3),
+        "p50_ms": round(timings[len(timings) // 2], 3),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 3),
+    }
+
+
+def explain(query, params):
+    return frappe.db.sql(f"EXPLAIN {query}", params, as_dict=True)
+
+
+def print_summary(rows, probes, results, plans):
+    print(f"Booking overlap benchmark: {rows} agreements, {probes} probes")
+    print("{:<20} {:>10} {:>10} {:>10}".format("variant", "mean ms", "p50 ms", "p95 ms"))
+    for variant, r in results.items():
+        print("{:<20} {:>10} {:>10} {:>10}".format(variant, r["mean_ms"], r["p50_ms"], r["p95_ms"]))
+
+    for variant, plan in plans.items():
+        print(f"\nEXPLAIN ({variant}, indexed):")
+        for row in plan:
+            print("  type={type} key={key} rows={rows} extra={Extra}".format(**row))
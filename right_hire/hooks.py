@@ -29,7 +29,8 @@ app_include_js = [
 	"/assets/right_hire/js/reservation.js",
 	"/assets/right_hire/js/vehicle.js",
 	"/assets/right_hire/js/navbar_back_button.js",
-	"/assets/right_hire/js/track_recents.js"
+	"/assets/right_hire/js/track_recents.js",
+	"/assets/right_hire/js/report_cache.js"
 ]
 
 # include js in doctype views
@@ -48,18 +49,35 @@ notification_config = "right_hire.notifications.get_notification_config"
 
 # Document Events
 doc_events = {
+    "*": {
+        "on_change": [
+            "right_hire.right_hire.report_cache.invalidate_for_doc",
+            "right_hire.right_hire.status_counts.update_status_counts"
+        ],
+        "on_trash": [
+            "right_hire.right_hire.report_cache.invalidate_for_doc",
+            "right_hire.right_hire.status_counts.update_status_counts"
+        ]
+    },
     "Vehicle": {
         "validate": "right_hire.right_hire.doctype.vehicle.vehicle.validate_vehicle",
         "on_update": "right_hire.right_hire.doctype.vehicle.vehicle.on_vehicle_update"
     },
     "Rental Agreement": {
         "validate": "right_hire.right_hire.doctype.rental_agreement.rental_agreement.validate_agreement",
+        "on_update": "right_hire.right_hire.doctype.rental_agreement.rental_agreement.on_agreement_update",
+        "on_update_after_submit": "right_hire.right_hire.doctype.rental_agreement.rental_agreement.on_agreement_update",
         "on_submit": "right_hire.right_hire.doctype.rental_agreement.rental_agreement.on_agreement_submit",
-        "on_cancel": "right_hire.right_hire.doctype.rental_agreement.rental_agreement.on_agreement_cancel"
+        "on_cancel": "right_hire.right_hire.doctype.rental_agreement.rental_agreement.on_agreement_cancel",
+        "on_trash": "right_hire.right_hire.doctype.rental_agreement.rental_agreement.on_agreement_trash"
     },
     "Reservation": {
         "validate": "right_hire.right_hire.doctype.reservation.reservation.validate_reservation",
-        "on_update": "right_hire.right_hire.doctype.reservation.reservation.check_conflicts"
+        "on_update": [
+            "right_hire.right_hire.doctype.reservation.reservation.check_conflicts",
+            "right_hire.right_hire.doctype.reservation.reservation.on_reservation_update"
+        ],
+        "on_trash": "right_hire.right_hire.doctype.reservation.reservation.on_reservation_trash"
     }
 }
 
@@ -67,22 +85,31 @@ doc_events = {
 scheduler_events = {
     "hourly": [
         "right_hire.tasks.hourly.check_reservation_conflicts",
-        "right_hire.tasks.hourly.check_overdue_returns"
+        "right_hire.tasks.hourly.check_overdue_returns",
+        "right_hire.tasks.hourly.reconcile_status_counts",
+        "right_hire.tasks.hourly.flush_vin_cache_hits"
     ],
     "daily": [
         "right_hire.tasks.daily.calculate_daily_utilization",
         "right_hire.tasks.daily.send_expiry_alerts",
-        "right_hire.tasks.daily.check_maintenance_due"
+        "right_hire.tasks.daily.check_maintenance_due",
+        "right_hire.tasks.daily.reconcile_availability_calendar",
+        "right_hire.tasks.daily.generate_lease_invoices"
     ],
     "weekly": [
         "right_hire.tasks.weekly.generate_utilization_report"
     ],
     "monthly": [
-        "right_hire.tasks.monthly.generate_lease_invoices",
         "right_hire.tasks.monthly.calculate_profitability"
     ]
 }
 
+# Job run history is pruned by Log Settings after this many days
+default_log_clearing_doctypes = {
+    "Right Hire Job Run": 90,
+    "VIN Decode Cache": 30
+}
+
 # Fixtures
 fixtures = [
     {"dt": "Custom Field", "filters": [["module", "=", "Right Hire"]]},
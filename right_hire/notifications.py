@@ -3,19 +3,20 @@
 
 import frappe
 
+from right_hire.right_hire.status_counts import get_status_counts
+
+OPEN_AGREEMENT_STATUSES = ("Active", "Due for Return")
+OPEN_RESERVATION_STATUSES = ("Confirmed",)
+OPEN_MAINTENANCE_JOB_STATUSES = ("Open", "Scheduled", "In Progress", "On Hold")
+
 def get_notification_config():
     """Return notification configuration"""
     return {
+        # Badge counts come from the status counters instead of a COUNT per doctype per user
         "for_doctype": {
-            "Rental Agreement": {
-                "status": "agreement_status"
-            },
-            "Reservation": {
-                "status": "reservation_status"
-            },
-            "Maintenance Job": {
-                "status": "job_status"
-            }
+            "Rental Agreement": "right_hire.notifications.get_open_agreement_count",
+            "Reservation": "right_hire.notifications.get_open_reservation_count",
+            "Maintenance Job": "right_hire.notifications.get_open_maintenance_job_count"
         },
         "targets": {
             "Rental Agreement": {
@@ -42,3 +43,13 @@ def get_notification_config():
             }
         }
     }
+
+
+def get_open_agreement_count():
+    return sum(get_status_counts("Rental Agreement", statuses=OPEN_AGREEMENT_STATUSES).values())
+
+def get_open_reservation_count():
+    return sum(get_status_counts("Reservation", statuses=OPEN_RESERVATION_STATUSES).values())
+
+def get_open_maintenance_job_count():
+    return sum(get_status_counts("Maintenance Job", statuses=OPEN_MAINTENANCE_JOB_STATUSES).values())
@@ -0,0 +1,9 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+from right_hire.setup.install import create_index
+
+
+def execute():
+    create_index("Reservation", "vehicle_status_period")
+    create_index("Rental Agreement", "vehicle_status_period")
@@ -0,0 +1,8 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+from right_hire.setup.install import create_index
+
+
+def execute():
+    create_index("Lease Schedule Line", "status_period_start")
@@ -0,0 +1,10 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+from right_hire.right_hire.availability import rebuild_vehicle_occupancy
+from right_hire.setup.install import create_index
+
+
+def execute():
+    create_index("Vehicle Occupancy", "vehicle_period")
+    rebuild_vehicle_occupancy()
@@ -0,0 +1,14 @@
+frappe.provide("right_hire.report_cache");
+
+// Cached Right Hire reports: "Refresh" drops the report's cached results and re-runs it
+right_hire.report_cache.setup = function(report) {
+	report.page.add_inner_button(__("Refresh"), function() {
+		frappe.call({
+			method: "right_hire.right_hire.report_cache.clear_report_cache",
+			args: { report_name: report.report_name },
+			callback: function() {
+				report.refresh();
+			}
+		});
+	});
+};
@@ -0,0 +1,151 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+"""Deduplicated admin alerts.
+
+Scheduled checks collect alerts and hand them to `dispatch_alerts` in one
+call. Alerts carrying a reference are recorded in the `Right Hire Alert`
+ledger keyed on (alert type, reference doctype, reference name, threshold),
+so the same expiring document is reported once rather than every day until
+it expires. A new threshold (e.g. a renewed expiry date) alerts again.
+
+Recipients are resolved once per call and Notification Logs are written with
+a single bulk insert, or as one digest entry per user when
+`right_hire_alert_digest` is set in site config.
+"""
+
+import frappe
+from frappe.utils import escape_html, now
+
+from right_hire.right_hire.bulk import bulk_upsert, get_existing_names
+
+ALERT_ROLE = "Right Hire Admin"
+NOTIFICATION_LOG_FIELDS = [
+    "name", "creation", "modified", "owner", "modified_by",
+    "subject", "email_content", "for_user", "type", "document_type", "document_name", "read",
+]
+
+
+def make_alert(alert_type, subject, message, reference_doctype=None, reference_name=None, threshold=None):
+    """Build an alert for `dispatch_alerts`."""
+    return frappe._dict(
+        alert_type=alert_type,
+        subject=subject,
+        message=message,
+        reference_doctype=reference_doctype,
+        reference_name=reference_name,
+        threshold=str(threshold) if threshold is not None else None,
+    )
+
+
+def get_alert_key(alert):
+    """Ledger key for an alert, or None if it has no reference to deduplicate on."""
+    if not (alert.reference_doctype and alert.reference_name):
+        return None
+    return "|".join([alert.alert_type, alert.reference_doctype, alert.reference_name, alert.threshold or ""])
+
+
+def get_alert_recipients():
+    """Enabled users holding the alert role."""
+    return frappe.db.sql_list(
+        """
+        SELECT DISTINCT hr.parent
+        FROM `tabHas Role` hr
+        INNER JOIN `tabUser` u ON u.name = hr.parent
+        WHERE hr.role = %s AND hr.parenttype = 'User' AND u.enabled = 1
+        """,
+        ALERT_ROLE,
+    )
+
+
+def dispatch_alerts(alerts, digest=None):
+    """Send the alerts not already in the ledger; returns how many were sent."""
+    pending = {}
+    for alert in alerts:
+        key = get_alert_key(alert)
+        # Unreferenced alerts are never deduplicated
+        pending.setdefault(key or frappe.generate_hash(length=12), (key, alert))
+
+    sent_keys = get_existing_names("Right Hire Alert", [key for key, _alert in pending.values() if key])
+    to_send = [(key, alert) for key, alert in pending.values() if key not in sent_keys]
+    if not to_send:
+        return 0
+
+    recipients = get_alert_recipients()
+    if not recipients:
+        # Not recorded in the ledger, so they go out once a recipient is configured
+        return 0
+
+    if digest is None:
+        digest = frappe.conf.get("right_hire_alert_digest")
+
+    if digest:
+        insert_digest_logs([alert for _key, alert in to_send], recipients)
+    else:
+        insert_notification_logs([alert for _key, alert in to_send], recipients)
+
+    for user in recipients:
+        frappe.publish_realtime("notification", after_commit=True, user=user)
+
+    timestamp = now()
+    bulk_upsert(
+        "Right Hire Alert",
+        [
+            {
+                "name": key,
+                "alert_key": key,
+                "alert_type": alert.alert_type,
+                "threshold": alert.threshold,
+                "sent_on": timestamp,
+                "recipients": len(recipients),
+                "reference_doctype": alert.reference_doctype,
+                "reference_name": alert.reference_name,
+                "subject": alert.subject,
+            }
+            for key, alert in to_send
+            if key
+        ],
+    )
+
+    return len(to_send)
+
+
+def insert_notification_logs(alerts, recipients):
+    """One Notification Log per alert per recipient, in a single bulk insert."""
+    timestamp = now()
+    frappe.db.bulk_insert(
+        "Notification Log",
+        fields=NOTIFICATION_LOG_FIELDS,
+        values=[
+            (
+                frappe.generate_hash(length=10), timestamp, timestamp, "Administrator", "Administrator",
+                alert.subject, alert.message, user, "Alert",
+                alert.reference_doctype, alert.reference_name, 0,
+            )
+            for alert in alerts
+            for user in recipients
+        ],
+    )
+
+
+def insert_digest_logs(alerts, recipients):
+    """One Notification Log per recipient listing every alert of the run."""
+    timestamp = now()
+    subject = f"{len(alerts)} Right Hire alerts"
+    content = "<ul>{}</ul>".format(
+        "".join(
+            f"<li><b>{escape_html(alert.subject)}</b>: {escape_html(alert.message)}</li>"
+            for alert in alerts
+        )
+    )
+    frappe.db.bulk_insert(
+        "Notification Log",
+        fields=NOTIFICATION_LOG_FIELDS,
+        values=[
+            (
+                frappe.generate_hash(length=10), timestamp, timestamp, "Administrator", "Administrator",
+                subject, content, user, "Alert", None, None, 0,
+            )
+            for user in recipients
+        ],
+    )
@@ -0,0 +1,344 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+"""Smart vehicle allocation.
+
+Scores every candidate vehicle for a reservation at once instead of taking the
+first free one. Lower cost is better; the cost blends:
+
+- gap fit: idle hours left between the new booking and its neighbours on the
+  vehicle (best fit keeps long empty stretches free for long bookings),
+- odometer balancing: prefer vehicles with lower mileage,
+- service: avoid vehicles whose next service falls during or just after the
+  rental.
+
+`AllocationEngine` is pure Python over preloaded data, so a whole day's
+reservations can be assigned together (longest first, each taking the cheapest
+feasible vehicle on a timeline that already includes earlier assignments) and
+the same engine can be benchmarked without a database.
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from datetime import timedelta
+
+import frappe
+from frappe.utils import add_days, cint, flt, get_datetime, getdate
+
+from right_hire.right_hire.availability import get_busy_vehicles, sync_vehicle_occupancy
+from right_hire.right_hire.report_cache import invalidate_doctypes
+from right_hire.right_hire.status_counts import refresh_status_counts
+
+GAP_HORIZON_HOURS = 48
+SERVICE_HORIZON_DAYS = 14
+# Sorts after any vehicle name, for bisecting (datetime, vehicle) lists
+MAX_NAME = "\U0010ffff"
+
+DEFAULT_WEIGHTS = {"gap": 0.6, "odometer": 0.25, "service": 0.15}
+
+CANDIDATE_FIELDS = ["name", "branch", "make", "model", "odometer", "next_service_due"]
+
+
+class AllocationEngine:
+    """Assigns reservations to vehicles on an in-memory booking timeline.
+
+    vehicles: iterable of dicts with name, branch, make, model, odometer, next_service_due
+    bookings: iterable of dicts with vehicle, start, end (existing occupancy)
+    """
+
+    def __init__(self, vehicles, bookings=(), weights=None, gap_horizon_hours=GAP_HORIZON_HOURS):
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.horizon = timedelta(hours=gap_horizon_hours)
+        self.vehicles = {v["name"]: frappe._dict(v) for v in vehicles}
+
+        odometers = [flt(v.odometer) for v in self.vehicles.values()]
+        self.min_odometer = min(odometers, default=0)
+        self.odometer_span = (max(odometers, default=0) - self.min_odometer) or 1
+
+        self._pools = {}
+        self._prune_assigned = False
+        self.by_branch = defaultdict(list)
+        for v in self.vehicles.values():
+            self.by_branch[v.branch].append(v.name)
+
+        # vehicle -> sorted [(start, end)], plus fleet-wide sorted starts/ends for neighbour lookups
+        self.timeline = defaultdict(list)
+        self.starts = []
+        self.ends = []
+        self.excluded = set()
+        for b in sorted(bookings, key=lambda b: (b["vehicle"], get_datetime(b["start"]))):
+            if b["vehicle"] in self.vehicles:
+                self._add(b["vehicle"], get_datetime(b["start"]), get_datetime(b["end"]), check=True)
+
+    def _add(self, vehicle, start, end, check=False):
+        slots = self.timeline[vehicle]
+        # Vehicles that already carry overlapping bookings cannot be reasoned about safely
+        if check and slots and slots[-1][1] > start:
+            self.excluded.add(vehicle)
+        insort(slots, (start, end))
+        insort(self.starts, (start, vehicle))
+        insort(self.ends, (end, vehicle))
+
+    def neighbours(self, vehicle, start, end):
+        """(feasible, previous booking end, next booking start) for the period on a vehicle."""
+        slots = self.timeline.get(vehicle) or []
+        idx = bisect_left(slots, (end,))
+        prev_end = slots[idx - 1][1] if idx else None
+        if prev_end and prev_end > start:
+            return False, None, None
+        next_start = slots[idx][0] if idx < len(slots) else None
+        return True, prev_end, next_start
+
+    def odometer_cost(self, vehicle):
+        return self.weights["odometer"] * (flt(self.vehicles[vehicle].odometer) - self.min_odometer) / self.odometer_span
+
+    def service_cost(self, vehicle, return_date):
+        next_service_due = self.vehicles[vehicle].next_service_due
+        if not next_service_due:
+            return 0
+
+        days_after = (getdate(next_service_due) - return_date).days
+        if days_after < 0:
+            return self.weights["service"]
+        if days_after < SERVICE_HORIZON_DAYS:
+            return self.weights["service"] * 0.5 * (SERVICE_HORIZON_DAYS - days_after) / SERVICE_HORIZON_DAYS
+        return 0
+
+    def gap_cost(self, start, end, prev_end, next_start):
+        horizon = self.horizon.total_seconds()
+        before = min((start - prev_end).total_seconds(), horizon) if prev_end else horizon
+        after = min((next_start - end).total_seconds(), horizon) if next_start else horizon
+        return self.weights["gap"] * (before + after) / (2 * horizon)
+
+    def candidate_pool(self, reservation):
+        """(set, [(odometer cost, vehicle)] ascending) of vehicles matching the reservation's preferences."""
+        key = (reservation.get("branch"), reservation.get("preferred_make"), reservation.get("preferred_model"))
+        if key not in self._pools:
+            branch, make, model = key
+            names = self.by_branch.get(branch, []) if branch else list(self.vehicles)
+            ordered = sorted(
+                (self.odometer_cost(name), name)
+                for name in names
+                if name not in self.excluded
+                and (not make or self.vehicles[name].make == make)
+                and (not model or self.vehicles[name].model == model)
+            )
+            self._pools[key] = ({name for _cost, name in ordered}, ordered)
+        return self._pools[key]
+
+    def best_vehicle(self, reservation):
+        """Cheapest feasible vehicle for a reservation, as (vehicle, cost) or (None, None)."""
+        start = get_datetime(reservation["pickup_datetime"])
+        end = get_datetime(reservation["return_datetime"])
+        return_date = end.date()
+        pool, ordered = self.candidate_pool(reservation)
+        best_vehicle, best_cost = None, None
+
+        # Near candidates: a booking ends within the horizon before pickup or starts within it after return
+        near = {
+            v for _end, v in self.ends[
+                bisect_right(self.ends, (start - self.horizon, MAX_NAME)):bisect_right(self.ends, (start, MAX_NAME))
+            ]
+        }
+        near.update(
+            v for _start, v in self.starts[
+                bisect_left(self.starts, (end,)):bisect_left(self.starts, (end + self.horizon,))
+            ]
+        )
+        for vehicle in near & pool:
+            feasible, prev_end, next_start = self.neighbours(vehicle, start, end)
+            if not feasible:
+                continue
+            cost = (
+                self.gap_cost(start, end, prev_end, next_start)
+                + self.odometer_cost(vehicle)
+                + self.service_cost(vehicle, return_date)
+            )
+            if best_cost is None or cost < best_cost:
+                best_vehicle, best_cost = vehicle, cost
+
+        # Far candidates have a saturated gap cost, so walk them in odometer order
+        # and stop once no remaining vehicle can beat the best found
+        gap_weight = self.weights["gap"]
+        timeline = self.timeline
+        for odometer_cost, vehicle in ordered:
+            if best_cost is not None and gap_weight + odometer_cost >= best_cost:
+                break
+            if vehicle in near:
+                continue
+            slots = timeline.get(vehicle)
+            if slots:
+                idx = bisect_left(slots, (end,))
+                if idx and slots[idx - 1][1] > start:
+                    continue
+            cost = gap_weight + odometer_cost + self.service_cost(vehicle, return_date)
+            if best_cost is None or cost < best_cost:
+                best_vehicle, best_cost = vehicle, cost
+
+        return best_vehicle, best_cost
+
+    def assign(self, reservation):
+        vehicle, cost = self.best_vehicle(reservation)
+        if vehicle:
+            self._add(vehicle, get_datetime(reservation["pickup_datetime"]), get_datetime(reservation["return_datetime"]))
+            if self._prune_assigned:
+                self._drop_from_far_walk(vehicle)
+        return vehicle, cost
+
+    def _drop_from_far_walk(self, vehicle):
+        key = (self.odometer_cost(vehicle), vehicle)
+        for _pool, ordered in self._pools.values():
+            idx = bisect_left(ordered, key)
+            if idx < len(ordered) and ordered[idx] == key:
+                del ordered[idx]
+
+    def assign_batch(self, reservations):
+        """Assign reservations longest-first; returns {reservation name: (vehicle, cost)}."""
+        ordered = sorted(
+            reservations,
+            key=lambda r: get_datetime(r["return_datetime"]) - get_datetime(r["pickup_datetime"]),
+            reverse=True,
+        )
+
+        # When every pickup falls within one gap horizon, a vehicle assigned in this
+        # batch can only fit another batch reservation as a near candidate, so it can
+        # leave the far walk for good.
+        pickups = [get_datetime(r["pickup_datetime"]) for r in reservations]
+        self._prune_assigned = bool(pickups) and max(pickups) - min(pickups) <= self.horizon
+        try:
+            return {r["name"]: self.assign(r) for r in ordered}
+        finally:
+            self._prune_assigned = False
+
+
+def build_engine(filters, start_datetime, end_datetime, weights=None):
+    """Load candidate vehicles matching `filters` and their bookings around the period."""
+    filters = dict(filters)
+    filters.setdefault("availability_status", 1)
+    vehicles = frappe.get_all("Vehicle", filters=filters, fields=CANDIDATE_FIELDS)
+
+    horizon = timedelta(hours=GAP_HORIZON_HOURS)
+    bookings = []
+    if vehicles:
+        bookings = frappe.db.sql(
+            """
+            SELECT vehicle, start_datetime AS start, end_datetime AS end
+            FROM `tabVehicle Occupancy`
+            WHERE vehicle IN %(vehicles)s
+              AND start_datetime < %(end)s
+              AND end_datetime > %(start)s
+            """,
+            {
+                "vehicles": tuple(v.name for v in vehicles),
+                "start": get_datetime(start_datetime) - horizon,
+                "end": get_datetime(end_datetime) + horizon,
+            },
+            as_dict=True,
+        )
+
+    return AllocationEngine(vehicles, bookings, weights=weights)
+
+
+def allocate_reservation(reservation):
+    """Best vehicle for a single reservation document (or dict), or None."""
+    filters = {"status": "Available", "branch": reservation.get("branch")}
+    if reservation.get("preferred_make"):
+        filters["make"] = reservation.get("preferred_make")
+    if reservation.get("preferred_model"):
+        filters["model"] = reservation.get("preferred_model")
+
+    engine = build_engine(filters, reservation.get("pickup_datetime"), reservation.get("return_datetime"))
+    vehicle, _cost = engine.best_vehicle(reservation)
+    return vehicle
+
+
+def allocate_reservations_for_day(pickup_date=None, branch=None, dry_run=False):
+    """Assign all unallocated Smart reservations picking up on a day as one batch."""
+    day_start = get_datetime(getdate(pickup_date))
+    day_end = add_days(day_start, 1)
+
+    filters = [
+        ["reservation_status", "=", "Confirmed"],
+        ["allocation_mode", "=", "Smart"],
+        ["vehicle", "is", "not set"],
+        ["pickup_datetime", ">=", day_start],
+        ["pickup_datetime", "<", day_end],
+    ]
+    if branch:
+        filters.append(["branch", "=", branch])
+
+    reservations = frappe.get_all(
+        "Reservation",
+        filters=filters,
+        fields=["name", "branch", "preferred_make", "preferred_model", "pickup_datetime", "return_datetime"],
+    )
+    if not reservations:
+        return {"assigned": {}, "unassigned": []}
+
+    vehicle_filters = {"status": "Available", "branch": ["in", list({r.branch for r in reservations})]}
+    engine = build_engine(
+        vehicle_filters,
+        min(get_datetime(r.pickup_datetime) for r in reservations),
+        max(get_datetime(r.return_datetime) for r in reservations),
+    )
+    results = engine.assign_batch(reservations)
+
+    assigned = {name: vehicle for name, (vehicle, _cost) in results.items() if vehicle}
+    unassigned = [name for name, (vehicle, _cost) in results.items() if not vehicle]
+
+    if not cint(dry_run):
+        for name in write_allocations(assigned, {r.name: r for r in reservations}):
+            del assigned[name]
+            unassigned.append(name)
+
+    return {"assigned": assigned, "unassigned": sorted(unassigned)}
+
+
+def write_allocations(assigned, reservations):
+    """Write a batch's {reservation: vehicle} assignments; returns the reservations left unwritten.
+
+    The assigned vehicles and the reservations are locked first, so
+    overlapping batch runs wait for each other. Each assignment is then
+    checked again against the occupancy calendar, dropping any that clash
+    with an allocation committed after the engine was built.
+    """
+    if not assigned:
+        return []
+
+    frappe.db.sql(
+        "SELECT name FROM `tabVehicle` WHERE name IN %(vehicles)s ORDER BY name FOR UPDATE",
+        {"vehicles": tuple(set(assigned.values()))},
+    )
+    unallocated = set(frappe.db.sql_list(
+        """
+        SELECT name FROM `tabReservation`
+        WHERE name IN %(names)s
+          AND reservation_status = 'Confirmed'
+          AND IFNULL(vehicle, '') = ''
+        FOR UPDATE
+        """,
+        {"names": tuple(assigned)},
+    ))
+
+    skipped = []
+    for name, vehicle in assigned.items():
+        r = reservations[name]
+        if name not in unallocated or get_busy_vehicles([vehicle], r.pickup_datetime, r.return_datetime):
+            skipped.append(name)
+            continue
+
+        frappe.db.set_value("Reservation", name, {"vehicle": vehicle, "reservation_status": "Allocated"})
+        sync_vehicle_occupancy(frappe._dict(
+            doctype="Reservation",
+            name=name,
+            docstatus=0,
+            vehicle=vehicle,
+            reservation_status="Allocated",
+            pickup_datetime=r.pickup_datetime,
+            return_datetime=r.return_datetime,
+        ))
+
+    # set_value bypasses doc events, so report caches and status counters are dropped here
+    invalidate_doctypes(["Reservation"])
+    refresh_status_counts(["Reservation"])
+    return skipped
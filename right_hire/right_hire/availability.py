@@ -0,0 +1,442 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+"""Set-based fleet availability.
+
+Answers "which of these vehicles are free between start and end" for a whole
+candidate set with a constant number of queries, instead of loading every
+Vehicle document and running its own overlap queries.
+
+Bookings are mirrored into `Vehicle Occupancy`, a small interval table kept
+current by the Reservation / Rental Agreement doc events and rebuilt nightly,
+so availability questions never have to scan the transactional tables.
+"""
+
+import heapq
+from bisect import bisect_left
+from datetime import timedelta
+
+import frappe
+from frappe import _
+from frappe.utils import add_days, date_diff, flt, get_datetime, getdate
+
+# Statuses in which a Reservation / Rental Agreement holds its vehicle.
+# Listed positively (rather than NOT IN the released ones) so the
+# (vehicle, status, start, end) composite index can be range-scanned.
+HOLDING_RESERVATION_STATUSES = ("Draft", "Confirmed", "Allocated", "Converted")
+HOLDING_AGREEMENT_STATUSES = ("Draft", "Active", "Due for Return", "Returned")
+
+# Where each booking doctype keeps its status and period
+OCCUPANCY_SOURCES = {
+    "Reservation": frappe._dict(
+        status_field="reservation_status",
+        start_field="pickup_datetime",
+        end_field="return_datetime",
+        holding_statuses=HOLDING_RESERVATION_STATUSES,
+    ),
+    "Rental Agreement": frappe._dict(
+        status_field="agreement_status",
+        start_field="start_datetime",
+        end_field="end_datetime",
+        holding_statuses=HOLDING_AGREEMENT_STATUSES,
+    ),
+}
+
+# Availability grid cell states; when several apply to a day the highest priority wins
+GRID_STATES = {
+    "A": "Available",
+    "R": "Reserved",
+    "H": "On Hire",
+    "M": "Maintenance",
+    "W": "Workshop",
+}
+GRID_STATE_PRIORITY = {"A": 0, "R": 1, "H": 2, "M": 3, "W": 4}
+GRID_MAX_DAYS = 366
+
+# Workshop movement / maintenance job statuses in which a block without an end date is still running
+OPEN_BLOCK_STATUSES = ("In Transit", "In Progress")
+
+VEHICLE_SEARCH_FIELDS = ["name", "make", "model", "year", "plate_no", "color", "transmission", "fuel_type"]
+
+
+def get_busy_vehicles(vehicles, start_datetime, end_datetime):
+    """Return the subset of `vehicles` booked by a Reservation or Rental Agreement in the period."""
+    vehicles = tuple(set(vehicles or []))
+    if not vehicles:
+        return set()
+
+    # Half-open overlap: booking.start < period.end AND booking.end > period.start
+    busy = frappe.db.sql(
+        """
+        SELECT DISTINCT vehicle
+        FROM `tabVehicle Occupancy`
+        WHERE vehicle IN %(vehicles)s
+          AND start_datetime < %(end)s
+          AND end_datetime > %(start)s
+        """,
+        {"vehicles": vehicles, "start": start_datetime, "end": end_datetime},
+    )
+
+    return {row[0] for row in busy}
+
+
+def filter_available_vehicles(vehicles, start_datetime, end_datetime):
+    """Bulk check: return the names from `vehicles` that are free for the period, in input order."""
+    vehicles = list(vehicles or [])
+    busy = get_busy_vehicles(vehicles, start_datetime, end_datetime)
+    return [name for name in vehicles if name not in busy]
+
+
+def get_available_vehicles(start_datetime, end_datetime, filters=None, fields=None, order_by=None):
+    """Fetch candidate vehicles matching `filters` and drop those booked in the period.
+
+    Runs two queries regardless of fleet size: one for the candidates and one
+    over the Vehicle Occupancy calendar for the whole set.
+    """
+    filters = dict(filters or {})
+    filters.setdefault("availability_status", 1)
+
+    fields = list(fields or ["name"])
+    if "name" not in fields:
+        fields.insert(0, "name")
+
+    candidates = frappe.get_all("Vehicle", filters=filters, fields=fields, order_by=order_by)
+    busy = get_busy_vehicles([v.name for v in candidates], start_datetime, end_datetime)
+
+    return [v for v in candidates if v.name not in busy]
+
+
+def count_available_vehicles(filters, windows):
+    """Number of vehicles matching `filters` free in each (start, end) window.
+
+    Two queries for any number of windows: the candidates, and every booking
+    touching the span of all windows. Returns {window: count}.
+    """
+    filters = dict(filters or {})
+    filters.setdefault("availability_status", 1)
+    windows = list(windows)
+
+    candidates = frappe.get_all("Vehicle", filters=filters, pluck="name")
+    if not candidates or not windows:
+        return {window: len(candidates) for window in windows}
+
+    bookings = frappe.db.sql(
+        """
+        SELECT vehicle, start_datetime, end_datetime
+        FROM `tabVehicle Occupancy`
+        WHERE vehicle IN %(vehicles)s
+          AND start_datetime < %(end)s
+          AND end_datetime > %(start)s
+        ORDER BY vehicle, start_datetime
+        """,
+        {
+            "vehicles": tuple(candidates),
+            "start": min(start for start, _end in windows),
+            "end": max(end for _start, end in windows),
+        },
+    )
+
+    # Per booked vehicle: sorted starts and the running max of ends, so one
+    # bisect tells whether any booking overlaps a window
+    timelines = {}
+    for vehicle, start, end in bookings:
+        starts, max_ends = timelines.setdefault(vehicle, ([], []))
+        starts.append(get_datetime(start))
+        end = get_datetime(end)
+        max_ends.append(max(max_ends[-1], end) if max_ends else end)
+
+    counts = {}
+    for window in windows:
+        start, end = get_datetime(window[0]), get_datetime(window[1])
+        busy = 0
+        for starts, max_ends in timelines.values():
+            idx = bisect_left(starts, end)
+            if idx and max_ends[idx - 1] > start:
+                busy += 1
+        counts[window] = len(candidates) - busy
+
+    return counts
+
+
+def is_vehicle_available(vehicle, start_datetime, end_datetime):
+    """Single-vehicle convenience wrapper around the bulk check."""
+    return not get_busy_vehicles([vehicle], start_datetime, end_datetime)
+
+
+def find_overlaps(bookings):
+    """Sweep-line pass over one vehicle's bookings.
+
+    `bookings` must be sorted by `start` and each item needs `start` and `end`.
+    Intervals are half-open, so a booking that starts exactly when another
+    ends does not conflict. Returns every overlapping (earlier, later) pair
+    in O(n log n + k).
+    """
+    active = []
+    pairs = []
+
+    for idx, booking in enumerate(bookings):
+        # Drop bookings that ended at or before this one's start
+        while active and active[0][0] <= booking.start:
+            heapq.heappop(active)
+
+        for _end, other_idx in active:
+            pairs.append((bookings[other_idx], booking))
+
+        heapq.heappush(active, (booking.end, idx))
+
+    return pairs
+
+
+def get_vehicle_occupancy(vehicles, start_datetime, end_datetime):
+    """Bookings overlapping the period for the given vehicles, ordered by vehicle and start."""
+    vehicles = tuple(set(vehicles or []))
+    if not vehicles:
+        return []
+
+    return frappe.db.sql(
+        """
+        SELECT vehicle, reference_doctype, reference_name, status,
+            start_datetime, end_datetime
+        FROM `tabVehicle Occupancy`
+        WHERE vehicle IN %(vehicles)s
+          AND start_datetime < %(end)s
+          AND end_datetime > %(start)s
+        ORDER BY vehicle, start_datetime
+        """,
+        {"vehicles": vehicles, "start": start_datetime, "end": end_datetime},
+        as_dict=True,
+    )
+
+
+def sync_vehicle_occupancy(doc):
+    """Mirror one Reservation / Rental Agreement into the occupancy calendar."""
+    source = OCCUPANCY_SOURCES[doc.doctype]
+    name = f"{doc.doctype}:{doc.name}"
+
+    start = doc.get(source.start_field)
+    end = doc.get(source.end_field)
+    status = doc.get(source.status_field)
+    holds_vehicle = (
+        doc.get("vehicle")
+        and doc.docstatus < 2
+        and status in source.holding_statuses
+        and start
+        and end
+    )
+
+    if not holds_vehicle:
+        frappe.db.delete("Vehicle Occupancy", {"name": name})
+        return
+
+    timestamp = frappe.utils.now()
+    frappe.db.sql(
+        """
+        INSERT INTO `tabVehicle Occupancy`
+            (name, creation, modified, owner, modified_by, docstatus,
+             vehicle, status, start_datetime, end_datetime,
+             reference_doctype, reference_name)
+        VALUES
+            (%(name)s, %(now)s, %(now)s, %(user)s, %(user)s, 0,
+             %(vehicle)s, %(status)s, %(start)s, %(end)s,
+             %(reference_doctype)s, %(reference_name)s)
+        ON DUPLICATE KEY UPDATE
+            vehicle = VALUES(vehicle),
+            status = VALUES(status),
+            start_datetime = VALUES(start_datetime),
+            end_datetime = VALUES(end_datetime),
+            modified = VALUES(modified),
+            modified_by = VALUES(modified_by)
+        """,
+        {
+            "name": name,
+            "now": timestamp,
+            "user": frappe.session.user,
+            "vehicle": doc.vehicle,
+            "status": status,
+            "start": start,
+            "end": end,
+            "reference_doctype": doc.doctype,
+            "reference_name": doc.name,
+        },
+    )
+
+
+def remove_vehicle_occupancy(doc):
+    """Drop a deleted booking from the occupancy calendar."""
+    frappe.db.delete("Vehicle Occupancy", {"name": f"{doc.doctype}:{doc.name}"})
+
+
+def rebuild_vehicle_occupancy():
+    """Rebuild the whole occupancy calendar from Reservation and Rental Agreement.
+
+    Returns the number of rows written.
+    """
+    frappe.db.sql("DELETE FROM `tabVehicle Occupancy`")
+
+    for doctype, source in OCCUPANCY_SOURCES.items():
+        frappe.db.sql(
+            f"""
+            INSERT INTO `tabVehicle Occupancy`
+                (name, creation, modified, owner, modified_by, docstatus,
+                 vehicle, status, start_datetime, end_datetime,
+                 reference_doctype, reference_name)
+            SELECT
+                CONCAT(%(doctype)s, ':', name), %(now)s, %(now)s, 'Administrator', 'Administrator', 0,
+                vehicle, {source.status_field}, {source.start_field}, {source.end_field},
+                %(doctype)s, name
+            FROM `tab{doctype}`
+            WHERE IFNULL(vehicle, '') != ''
+              AND docstatus < 2
+              AND {source.status_field} IN %(statuses)s
+              AND {source.start_field} IS NOT NULL
+              AND {source.end_field} IS NOT NULL
+            """,
+            {"doctype": doctype, "now": frappe.utils.now(), "statuses": source.holding_statuses},
+        )
+
+    return frappe.db.count("Vehicle Occupancy")
+
+
+def get_availability_grid(branch, from_date, to_date):
+    """Vehicles x days availability board for a branch.
+
+    Every booking, workshop movement and maintenance job overlapping the range
+    is fetched in two queries and painted onto per-vehicle day arrays, which
+    are returned run-length encoded as `[[state, days], ...]`.
+    """
+    from_date, to_date = getdate(from_date), getdate(to_date)
+    days = date_diff(to_date, from_date) + 1
+    if days < 1:
+        frappe.throw(_("To Date must be on or after From Date"))
+    if days > GRID_MAX_DAYS:
+        frappe.throw(_("Availability grid is limited to {0} days").format(GRID_MAX_DAYS))
+
+    vehicles = frappe.get_all(
+        "Vehicle",
+        filters={"branch": branch, "status": ["!=", "Deactivated"]},
+        fields=["name", "plate_no", "make", "model", "status"],
+        order_by="plate_no asc",
+    )
+
+    grid = {v.name: ["A"] * days for v in vehicles}
+    range_start = get_datetime(from_date)
+    range_end = get_datetime(add_days(to_date, 1))
+
+    for block in get_grid_blocks(list(grid), range_start, range_end):
+        cells = grid[block.vehicle]
+        first = max(0, date_diff(block.start, from_date))
+        # End is exclusive: a block ending at midnight does not touch that day
+        end = get_datetime(block.end)
+        last = min(days - 1, date_diff(end, from_date) - (1 if end == get_datetime(getdate(end)) else 0))
+
+        for day in range(first, last + 1):
+            if GRID_STATE_PRIORITY[block.state] > GRID_STATE_PRIORITY[cells[day]]:
+                cells[day] = block.state
+
+    return {
+        "branch": branch,
+        "from_date": from_date,
+        "to_date": to_date,
+        "days": days,
+        "legend": GRID_STATES,
+        "vehicles": [
+            {
+                "vehicle": v.name,
+                "plate_no": v.plate_no,
+                "make": v.make,
+                "model": v.model,
+                "status": v.status,
+                "cells": run_length_encode(grid[v.name]),
+            }
+            for v in vehicles
+        ],
+    }
+
+
+def get_grid_blocks(vehicles, range_start, range_end):
+    """All occupancy blocks for `vehicles` overlapping the range, tagged with a grid state."""
+    if not vehicles:
+        return []
+
+    bookings = frappe.db.sql(
+        """
+        SELECT vehicle,
+            IF(reference_doctype = 'Rental Agreement', 'H', 'R') AS state,
+            start_datetime AS start, end_datetime AS end
+        FROM `tabVehicle Occupancy`
+        WHERE vehicle IN %(vehicles)s
+          AND start_datetime < %(end)s
+          AND end_datetime > %(start)s
+        """,
+        {"vehicles": tuple(vehicles), "start": range_start, "end": range_end},
+        as_dict=True,
+    )
+    return bookings + get_off_rent_blocks(vehicles, range_start, range_end)
+
+
+def get_off_rent_blocks(vehicles, range_start, range_end):
+    """Workshop movements ('W') and maintenance jobs ('M') of `vehicles` overlapping the range.
+
+    Shared by the availability grid and utilization snapshots. A block ends at
+    its recorded end, else after the hours worked on it; only one still in
+    progress runs to the end of the range. Rows with no known end (not
+    started, or finished without an end) are left out.
+    """
+    if not vehicles:
+        return []
+
+    rows = frappe.db.sql(
+        """
+        SELECT vehicle, 'W' AS state, movement_status AS status,
+            movement_date AS start, completed_date AS end, 0 AS hours
+        FROM `tabVehicle Movement`
+        WHERE vehicle IN %(vehicles)s
+          AND movement_type = 'Workshop'
+          AND movement_status != 'Cancelled'
+          AND movement_date < %(end)s
+          AND (completed_date IS NULL OR completed_date > %(start)s)
+        UNION ALL
+        SELECT vehicle, 'M' AS state, job_status AS status,
+            IFNULL(start_datetime, IFNULL(open_datetime, job_date)) AS start,
+            close_datetime AS end,
+            IF(downtime_hours > 0, downtime_hours, actual_hours) AS hours
+        FROM `tabMaintenance Job`
+        WHERE vehicle IN %(vehicles)s
+          AND job_status NOT IN ('Cancelled', 'Open')
+          AND IFNULL(start_datetime, IFNULL(open_datetime, job_date)) < %(end)s
+          AND (close_datetime IS NULL OR close_datetime > %(start)s)
+        """,
+        {"vehicles": tuple(vehicles), "start": range_start, "end": range_end},
+        as_dict=True,
+    )
+
+    blocks = []
+    range_start = get_datetime(range_start)
+    for row in rows:
+        row.start = get_datetime(row.start)
+        row.end = get_block_end(row, range_end)
+        if row.end and row.end > max(row.start, range_start):
+            blocks.append(row)
+    return blocks
+
+
+def get_block_end(block, range_end):
+    """End of a workshop / maintenance block, or None when it is unknown."""
+    if block.end:
+        return get_datetime(block.end)
+    if flt(block.hours) > 0:
+        return block.start + timedelta(hours=flt(block.hours))
+    if block.status in OPEN_BLOCK_STATUSES:
+        return get_datetime(range_end)
+    return None
+
+
+def run_length_encode(cells):
+    """["A", "A", "H"] -> [["A", 2], ["H", 1]]"""
+    runs = []
+    for cell in cells:
+        if runs and runs[-1][0] == cell:
+            runs[-1][1] += 1
+        else:
+            runs.append([cell, 1])
+    return runs
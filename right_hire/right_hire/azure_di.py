@@ -1,7 +1,9 @@
-import os, re, json, time, requests
+import os, re, json, time
 import frappe
 from frappe.utils.file_manager import get_file_path
 
+from right_hire.right_hire.integrations import get_credential, request
+
 API_VERSION = "2024-11-30"
 MODEL_ID    = "prebuilt-idDocument"
 MODEL_READ  = "prebuilt-idDocument"
@@ -129,8 +131,7 @@ def create_customer_from_scan(file_url: str, use_urlsource: int = 0, set_docname
     return {"name": created_name, "doc_type": doc_type, "customer_name": customer_name}
 
 def _cfg():
-    sc = frappe.get_site_config()
-    return sc.get("azure_di_endpoint"), sc.get("azure_di_key")
+    return get_credential("azure_di_endpoint"), get_credential("azure_di_key")
 
 def _post_analyze(endpoint, key, model, *, url_source=None, file_bytes=None, overload=None):
     base = f"{endpoint}/documentintelligence/documentModels/{model}:analyze"
@@ -140,10 +141,10 @@ def _post_analyze(endpoint, key, model, *, url_source=None, file_bytes=None, ove
     headers = {"Ocp-Apim-Subscription-Key": key}
     if url_source:
         headers["Content-Type"] = "application/json"
-        r = requests.post(base, params=params, headers=headers, json={"urlSource": url_source}, timeout=60)
+        r = request("azure_di", "analyze", "POST", base, params=params, headers=headers, json={"urlSource": url_source})
     else:
         headers["Content-Type"] = "application/octet-stream"
-        r = requests.post(base, params=params, headers=headers, data=file_bytes, timeout=60)
+        r = request("azure_di", "analyze", "POST", base, params=params, headers=headers, data=file_bytes)
     r.raise_for_status()
     op_loc = r.headers.get("Operation-Location")
     if not op_loc:
@@ -154,7 +155,7 @@ def _poll(op_location, key, timeout_s=90):
     headers = {"Ocp-Apim-Subscription-Key": key}
     t0 = time.time()
     while True:
-        rr = requests.get(op_location, headers=headers, timeout=60)
+        rr = request("azure_di", "poll", "GET", op_location, headers=headers)
         rr.raise_for_status()
         j = rr.json()
         st = j.get("status")
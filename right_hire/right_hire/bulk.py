@@ -0,0 +1,98 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+"""Set-based writes for jobs that produce one row per vehicle / day.
+
+Saving documents one at a time runs validate, hooks and version tracking for
+every row. Derived tables (snapshots, ledgers, caches) don't need any of that,
+so these helpers write them with multi-row INSERT ... ON DUPLICATE KEY UPDATE.
+Bulk-created documents use `bulk_insert`, which never updates an existing row.
+"""
+
+import frappe
+
+from right_hire.right_hire.report_cache import invalidate_doctypes
+from right_hire.right_hire.status_counts import refresh_status_counts
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def bulk_upsert(doctype, rows, update_fields=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Insert or update `rows` (dicts that each carry a `name`) in chunks.
+
+    Standard columns (creation, modified, owner, ...) are filled in; on a
+    duplicate name only `update_fields` (default: every non-key field in the
+    rows) and `modified` / `modified_by` are overwritten.
+
+    Returns {"inserted": n, "updated": n}, split on which names existed before.
+    """
+    rows = list(rows)
+    if not rows:
+        return {"inserted": 0, "updated": 0}
+
+    fields = [f for f in rows[0] if f != "name"]
+    update_fields = list(update_fields or fields)
+    existing = get_existing_names(doctype, [row["name"] for row in rows])
+
+    update_sql = ", ".join(
+        f"`{column}` = VALUES(`{column}`)" for column in (*update_fields, "modified", "modified_by")
+    )
+    insert_rows(doctype, rows, f"ON DUPLICATE KEY UPDATE {update_sql}", chunk_size)
+    return {"inserted": len(rows) - len(existing), "updated": len(existing)}
+
+
+def bulk_insert(doctype, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Insert new `rows` (dicts that each carry a `name`) in chunks, never overwriting.
+
+    For documents rather than derived rows: a row that collides with an
+    existing name or unique key raises a duplicate entry error instead of
+    updating the other record. Returns the number of rows inserted.
+    """
+    rows = list(rows)
+    if rows:
+        insert_rows(doctype, rows, "", chunk_size)
+    return len(rows)
+
+
+def insert_rows(doctype, rows, on_duplicate_sql, chunk_size):
+    fields = [f for f in rows[0] if f != "name"]
+    timestamp = frappe.utils.now()
+    user = frappe.session.user
+    columns = ["name", "creation", "modified", "owner", "modified_by", "docstatus", *fields]
+    column_sql = ", ".join(f"`{column}`" for column in columns)
+    placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+
+    for offset in range(0, len(rows), chunk_size):
+        chunk = rows[offset : offset + chunk_size]
+        values = []
+        for row in chunk:
+            values.extend([row["name"], timestamp, timestamp, user, user, 0])
+            values.extend(row.get(field) for field in fields)
+
+        frappe.db.sql(
+            f"""
+            INSERT INTO `tab{doctype}` ({column_sql})
+            VALUES {", ".join([placeholders] * len(chunk))}
+            {on_duplicate_sql}
+            """,
+            values,
+        )
+
+    # Bypasses doc events, so report caches and status counters for this doctype are dropped here
+    invalidate_doctypes([doctype])
+    refresh_status_counts([doctype])
+
+
+def get_existing_names(doctype, names, chunk_size=DEFAULT_CHUNK_SIZE):
+    """The subset of `names` that already exist in `doctype`."""
+    names = list(names)
+    existing = set()
+    for offset in range(0, len(names), chunk_size):
+        existing.update(
+            frappe.get_all(
+                doctype,
+                filters={"name": ["in", names[offset : offset + chunk_size]]},
+                pluck="name",
+            )
+        )
+    return existing
@@ -0,0 +1,16 @@
+// Copyright (c) 2025, Right Hire and contributors
+// For license information, please see license.txt
+
+frappe.provide("frappe.dashboards.chart_sources");
+
+frappe.dashboards.chart_sources["Fleet Status Overview"] = {
+	method: "right_hire.right_hire.dashboard_chart_source.fleet_status_overview.fleet_status_overview.get",
+	filters: [
+		{
+			fieldname: "branch",
+			label: __("Branch"),
+			fieldtype: "Link",
+			options: "Branch",
+		},
+	],
+};
@@ -0,0 +1,32 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+import json
+
+import frappe
+from frappe import _
+
+from right_hire.right_hire.status_counts import get_status_counts
+
+
+@frappe.whitelist()
+@frappe.read_only()
+def get(chart_name=None, chart=None, no_cache=None, filters=None, from_date=None,
+        to_date=None, timespan=None, time_interval=None, heatmap_year=None):
+    """Vehicles by status, from the status counters."""
+    frappe.has_permission("Vehicle", throw=True)
+
+    if isinstance(filters, str):
+        filters = json.loads(filters)
+    filters = frappe._dict(filters or {})
+
+    counts = {
+        status: count
+        for status, count in sorted(get_status_counts("Vehicle", filters.get("branch") or None).items())
+        if status != "Deactivated"
+    }
+
+    return {
+        "labels": [_(status) for status in counts],
+        "datasets": [{"name": _("Vehicles"), "values": list(counts.values())}],
+    }
@@ -3,6 +3,15 @@
 
 import frappe
 from frappe.model.document import Document
+from frappe.utils import now_datetime
 
 class MaintenanceJob(Document):
-    pass
+    def validate(self):
+        self.set_status_times()
+
+    def set_status_times(self):
+        """Stamp start and close times on status changes, bounding the job's downtime block"""
+        if self.job_status == "In Progress" and not self.start_datetime:
+            self.start_datetime = now_datetime()
+        if self.job_status == "Completed" and not self.close_datetime:
+            self.close_datetime = now_datetime()
@@ -4,5 +4,15 @@
 import frappe
 from frappe.model.document import Document
 
+from right_hire.right_hire.pricing import clear_rate_plan_pricing
+
 class RatePlan(Document):
-    pass
+    def on_update(self):
+        clear_rate_plan_pricing(self.name)
+
+    def on_trash(self):
+        clear_rate_plan_pricing(self.name)
+
+    def after_rename(self, old, new, merge=False):
+        clear_rate_plan_pricing(old)
+        clear_rate_plan_pricing(new)
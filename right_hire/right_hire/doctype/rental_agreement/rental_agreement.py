@@ -2,6 +2,10 @@ import frappe
 from frappe.model.document import Document
 from frappe.utils import flt, get_datetime, now, getdate
 
+from right_hire.right_hire.availability import remove_vehicle_occupancy, sync_vehicle_occupancy
+from right_hire.right_hire.pricing import get_rate_plan_pricing
+from right_hire.right_hire.revenue import update_revenue_cube
+
 
 class RentalAgreement(Document):
     def validate(self):
@@ -74,30 +78,22 @@ class RentalAgreement(Document):
         self.discount_amount = flt(self.discount_amount or 0)
         self.tax_amount = flt(self.tax_amount or 0)
 
+        pricing = get_rate_plan_pricing(self.rate_plan)
+
         # Calculate KM driven and overage
         if self.odometer_in is not None and self.odometer_out is not None:
             self.km_driven = flt(self.odometer_in) - flt(self.odometer_out)
             free_km = flt(self.free_km or 0)
             if self.km_driven > free_km:
                 self.overage_km = self.km_driven - free_km
-                if self.rate_plan:
-                    rate_plan = frappe.get_doc("Rate Plan", self.rate_plan)
-                    self.overage_amount = flt(self.overage_km) * flt(
-                        getattr(rate_plan, "overage_per_km", 0)
-                    )
+                if pricing:
+                    self.overage_amount = flt(self.overage_km) * pricing.overage_per_km
 
         # Calculate rental amount
-        if self.rate_plan and self.base_rate:
-            rate_plan = frappe.get_doc("Rate Plan", self.rate_plan)
-            days = flt(self.actual_days) or flt(self.planned_days)
-            if rate_plan.rate_type == "Daily":
-                self.rental_amount = flt(self.base_rate) * days
-            elif rate_plan.rate_type == "Weekly":
-                self.rental_amount = flt(self.base_rate) * (days / 7)
-            elif rate_plan.rate_type == "Monthly":
-                self.rental_amount = flt(self.base_rate) * (days / 30)
-            else:
-                self.rental_amount = 0
+        if pricing and self.base_rate:
+            # Bill the actual period once returned, otherwise the planned one
+            end = self.actual_return_datetime if flt(self.actual_days) else self.end_datetime
+            self.rental_amount = pricing.rental_amount(self.start_datetime, end, base_rate=flt(self.base_rate))
 
         # Charges total (safe if no child rows)
         charges_total = sum(flt(charge.amount) for charge in (self.charges or []))
@@ -165,6 +161,9 @@ class RentalAgreement(Document):
             # Document already submitted, just update status
             self.update_vehicle_status("Rented Out")
             self.db_set("agreement_status", "Active", update_modified=False)
+            # db_set skips the on_update hooks that keep these in step
+            sync_vehicle_occupancy(self)
+            update_revenue_cube(self)
 
         frappe.msgprint("Rental started successfully")
 
@@ -486,11 +485,25 @@ def validate_agreement(doc, method=None):
     pass
 
 
+def on_agreement_update(doc, method=None):
+    """Hook for on_update / on_update_after_submit."""
+    sync_vehicle_occupancy(doc)
+    if doc.docstatus == 1:
+        update_revenue_cube(doc)
+
+
 def on_agreement_submit(doc, method=None):
     """Hook for on_submit."""
-    pass
+    sync_vehicle_occupancy(doc)
+    update_revenue_cube(doc)
 
 
 def on_agreement_cancel(doc, method=None):
     """Hook for on_cancel."""
-    pass
+    sync_vehicle_occupancy(doc)
+    update_revenue_cube(doc)
+
+
+def on_agreement_trash(doc, method=None):
+    """Hook for on_trash."""
+    remove_vehicle_occupancy(doc)
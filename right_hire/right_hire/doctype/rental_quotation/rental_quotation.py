@@ -2,6 +2,8 @@ import frappe
 from frappe.model.document import Document
 from frappe.utils import flt, get_datetime
 
+from right_hire.right_hire.pricing import get_rate_plan_pricing
+
 
 class RentalQuotation(Document):
     def validate(self):
@@ -29,17 +31,9 @@ class RentalQuotation(Document):
     def calculate_amounts(self):
         """Calculate all amounts."""
         # Calculate rental amount
-        if self.rate_plan and self.base_rate:
-            rate_plan = frappe.get_doc("Rate Plan", self.rate_plan)
-            days = flt(self.planned_days)
-            if rate_plan.rate_type == "Daily":
-                self.rental_amount = flt(self.base_rate) * days
-            elif rate_plan.rate_type == "Weekly":
-                self.rental_amount = flt(self.base_rate) * (days / 7)
-            elif rate_plan.rate_type == "Monthly":
-                self.rental_amount = flt(self.base_rate) * (days / 30)
-            else:
-                self.rental_amount = 0
+        pricing = get_rate_plan_pricing(self.rate_plan)
+        if pricing and self.base_rate:
+            self.rental_amount = pricing.rental_amount(self.start_datetime, self.end_datetime, base_rate=flt(self.base_rate))
 
         # Calculate extras total
         extras_total = sum(flt(extra.amount) for extra in (self.extras or []))
@@ -2,6 +2,14 @@ import frappe
 from frappe.model.document import Document
 from frappe.utils import getdate, get_datetime, date_diff, flt, add_days
 
+from right_hire.right_hire.allocation import allocate_reservation
+from right_hire.right_hire.availability import (
+    get_available_vehicles,
+    remove_vehicle_occupancy,
+    sync_vehicle_occupancy,
+)
+from right_hire.right_hire.pricing import get_rate_plan_pricing
+
 
 class Reservation(Document):
     def validate(self):
@@ -36,19 +44,12 @@ class Reservation(Document):
         if not self.rate_plan:
             return
 
-        rate_plan = frappe.get_doc("Rate Plan", self.rate_plan)
-
-        # Base rental amount
-        if rate_plan.rate_type == "Daily":
-            self.rental_amount = flt(self.base_rate) * flt(self.rental_days)
-        elif rate_plan.rate_type == "Weekly":
-            weeks = flt(self.rental_days) / 7
-            self.rental_amount = flt(self.base_rate) * weeks
-        elif rate_plan.rate_type == "Monthly":
-            months = flt(self.rental_days) / 30
-            self.rental_amount = flt(self.base_rate) * months
-        else:
-            self.rental_amount = 0
+        pricing = get_rate_plan_pricing(self.rate_plan)
+        self.rental_amount = (
+            pricing.rental_amount(self.pickup_datetime, self.return_datetime, base_rate=flt(self.base_rate))
+            if pricing
+            else 0
+        )
 
         # Extras total (safe if no child rows)
         self.extras_total = sum(flt(extra.amount) for extra in (self.extras or []))
@@ -91,23 +92,11 @@ class Reservation(Document):
 
     def allocate_vehicle_smart(self):
         """Smart vehicle allocation based on availability and preferences."""
-        filters = {"status": "Available", "branch": self.branch}
-
-        if self.preferred_make:
-            filters["make"] = self.preferred_make
-        if self.preferred_model:
-            filters["model"] = self.preferred_model
-
-        available_vehicles = frappe.get_all("Vehicle", filters=filters, pluck="name")
-
-        # Pick the first available vehicle for the period
-        for vehicle_name in available_vehicles:
-            vehicle = frappe.get_doc("Vehicle", vehicle_name)
-            if vehicle.check_availability(self.pickup_datetime, self.return_datetime):
-                self.vehicle = vehicle_name
-                return
+        vehicle = allocate_reservation(self)
+        if not vehicle:
+            frappe.throw("No available vehicles found matching criteria")
 
-        frappe.throw("No available vehicles found matching criteria")
+        self.vehicle = vehicle
 
     @frappe.whitelist()
     def convert_to_agreement(self):
@@ -169,20 +158,13 @@ class Reservation(Document):
         if self.preferred_category:
             pass
 
-        vehicles = frappe.get_all(
-            "Vehicle",
+        return get_available_vehicles(
+            self.pickup_datetime,
+            self.return_datetime,
             filters=filters,
             fields=["name", "make", "model", "year", "plate_no", "odometer"],
         )
 
-        available = []
-        for v in vehicles:
-            vehicle = frappe.get_doc("Vehicle", v.name)
-            if vehicle.check_availability(self.pickup_datetime, self.return_datetime):
-                available.append(v)
-
-        return available
-
 
 def validate_reservation(doc, method=None):
     """Hook for validate."""
@@ -192,3 +174,13 @@ def validate_reservation(doc, method=None):
 def check_conflicts(doc, method=None):
     """Hook to check conflicts."""
     pass
+
+
+def on_reservation_update(doc, method=None):
+    """Hook for on_update."""
+    sync_vehicle_occupancy(doc)
+
+
+def on_reservation_trash(doc, method=None):
+    """Hook for on_trash."""
+    remove_vehicle_occupancy(doc)
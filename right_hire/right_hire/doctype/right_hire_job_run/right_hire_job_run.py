@@ -0,0 +1,14 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.query_builder import Interval
+from frappe.query_builder.functions import Now
+
+class RightHireJobRun(Document):
+    @staticmethod
+    def clear_old_logs(days=90):
+        """Called by Log Settings to prune old runs"""
+        table = frappe.qb.DocType("Right Hire Job Run")
+        frappe.db.delete(table, filters=(table.modified < (Now() - Interval(days=days))))
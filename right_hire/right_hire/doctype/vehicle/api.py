@@ -1,14 +1,34 @@
 # File: your_app/your_app/vehicles/api.py
 # Server-side VIN decoder with auto-create for Vehicles Model
 
+import json
+
 import frappe
 import requests
 from frappe import _
+from frappe.utils import cint, cstr
+
+from right_hire.right_hire.bulk import bulk_upsert
+from right_hire.right_hire.integrations import request
+from right_hire.right_hire.vin_cache import (
+    get_api_headers,
+    get_api_url,
+    get_cached_decode,
+    get_prefix_match,
+    get_vds_key,
+    is_api_configured,
+    is_offline,
+    normalize_vin,
+    store_decode,
+)
+
+# Safety limit on API pages per catalog sync
+MAX_SYNC_PAGES = 100
 
 @frappe.whitelist()
 def decode_vehicle_vin(vin, model_year=None):
     """
-    Decode VIN using NHTSA vPIC API
+    Decode VIN, from the VIN Decode Cache when it has been decoded before
     
     Args:
         vin (str): Vehicle Identification Number
@@ -21,7 +41,7 @@ def decode_vehicle_vin(vin, model_year=None):
         frappe.throw(_("VIN is required"))
     
     # Clean VIN
-    vin = vin.strip().upper()
+    vin = normalize_vin(vin)
     
     # Validate VIN length
     if len(vin) < 11:
@@ -32,17 +52,35 @@ def decode_vehicle_vin(vin, model_year=None):
         invalid_chars = set('IOQ')
         if any(char in invalid_chars for char in vin):
             frappe.throw(_("VIN cannot contain letters I, O, or Q"))
+
+    cached = get_cached_decode(vin)
+    if cached and cached.status == "Decoded":
+        return build_decode_result(cached.raw_data, cached.mapped_data, _("VIN decoded (cached)"), cached=True)
+    if cached:
+        # Failed recently: don't ask the API again until retry_after
+        return decode_from_prefix(vin) or {
+            "success": False,
+            "message": _("VIN could not be decoded: {0}").format(cached.error or _("no data")),
+            "cached": True,
+        }
+
+    # Partial VINs, offline mode and a missing API key are answered from decoded VINs with the same WMI + VDS
+    offline = is_offline() or not is_api_configured()
+    if len(vin) < 17 or offline:
+        result = decode_from_prefix(vin)
+        if result or offline:
+            return result or {
+                "success": False,
+                "message": _("VIN not found in the decode cache (offline mode)") if is_offline()
+                    else _("VIN decoder API key is not configured (right_hire_rapidapi_key in site config)"),
+            }
     
     try:
-        # Build API URL for RapidAPI car-api2
-        api_url = f"https://car-api2.p.rapidapi.com/api/vin/{vin}"
-        headers = {
-            'x-rapidapi-host': 'car-api2.p.rapidapi.com',
-            'x-rapidapi-key': '60d40f8d72msh2b2f2454f08ea4dp1e7250jsnafc12c2141f1'
-        }
+        # Build API URL for RapidAPI car-api2 (or the configured stand-in)
+        api_url = f"{get_api_url()}/api/vin/{vin}"
 
         # Make API request
-        response = requests.get(api_url, headers=headers, timeout=15)
+        response = request("car_api", "vin", "GET", api_url, headers=get_api_headers())
         response.raise_for_status()
 
         data = response.json()
@@ -50,32 +88,12 @@ def decode_vehicle_vin(vin, model_year=None):
         if data:
             # Map to your DocType fields
             mapped_data = map_to_vehicle_fields(data)
+            store_decode(vin, data, mapped_data)
 
-            # Create manufacturer and model if they don't exist
-            make_name = create_manufacturer_if_not_exists(data)
-            model_name = create_vehicle_model_if_not_exists(data, make_name)
-
-            # Add the linked fields to mapped data
-            if make_name:
-                mapped_data['make'] = make_name
-                frappe.msgprint(_("Manufacturer set: {0}").format(make_name), indicator='blue', alert=True)
-
-            if model_name:
-                mapped_data['model'] = model_name
-                frappe.msgprint(_("Model set: {0}").format(model_name), indicator='blue', alert=True)
-
-            # Store complete JSON response
-            import json
-            mapped_data['vin_decode_data'] = json.dumps(data, indent=2)
-
-            return {
-                "success": True,
-                "data": mapped_data,
-                "raw_data": data,
-                "message": _("VIN decoded successfully")
-            }
+            return build_decode_result(data, mapped_data, _("VIN decoded successfully"))
         else:
-            return {
+            store_decode(vin, error=_("No data returned from API"))
+            return decode_from_prefix(vin) or {
                 "success": False,
                 "message": _("No data returned from API"),
                 "data": None
@@ -83,13 +101,23 @@ def decode_vehicle_vin(vin, model_year=None):
             
     except requests.exceptions.Timeout:
         frappe.log_error("VIN Decode Timeout", "VIN Decoder")
-        return {
+        return decode_from_prefix(vin) or {
             "success": False,
             "message": _("Request timed out. Please try again."),
         }
+    except requests.exceptions.HTTPError as e:
+        # The API rejected this VIN; remember that for a while
+        if e.response is not None and 400 <= e.response.status_code < 500:
+            store_decode(vin, error=str(e))
+        frappe.log_error(f"VIN Decode Error: {str(e)}", "VIN Decoder")
+        return decode_from_prefix(vin) or {
+            "success": False,
+            "message": _("VIN could not be decoded"),
+            "error": str(e)
+        }
     except requests.exceptions.RequestException as e:
         frappe.log_error(f"VIN Decode Error: {str(e)}", "VIN Decoder")
-        return {
+        return decode_from_prefix(vin) or {
             "success": False,
             "message": _("Failed to connect to VIN decoder service"),
             "error": str(e)
@@ -103,6 +131,51 @@ def decode_vehicle_vin(vin, model_year=None):
         }
 
 
+def decode_from_prefix(vin):
+    """Partial decode from a cached VIN with the same WMI + VDS, or None"""
+    match = get_prefix_match(vin)
+    if not match:
+        return None
+
+    result = build_decode_result(
+        match.raw_data,
+        match.mapped_data,
+        _("Partial match on VIN prefix {0}: check year and trim").format(get_vds_key(vin)),
+        cached=True,
+    )
+    result["partial"] = True
+    return result
+
+
+def build_decode_result(data, mapped_data, message, cached=False):
+    """Decode response with make and model linked, creating them if missing"""
+    mapped_data = dict(mapped_data)
+
+    # Create manufacturer and model if they don't exist
+    make_name = create_manufacturer_if_not_exists(data)
+    model_name = create_vehicle_model_if_not_exists(data, make_name)
+
+    # Add the linked fields to mapped data
+    if make_name:
+        mapped_data['make'] = make_name
+        frappe.msgprint(_("Manufacturer set: {0}").format(make_name), indicator='blue', alert=True)
+
+    if model_name:
+        mapped_data['model'] = model_name
+        frappe.msgprint(_("Model set: {0}").format(model_name), indicator='blue', alert=True)
+
+    # Store complete JSON response
+    mapped_data['vin_decode_data'] = json.dumps(data, indent=2)
+
+    return {
+        "success": True,
+        "data": mapped_data,
+        "raw_data": data,
+        "cached": cached,
+        "message": message
+    }
+
+
 def create_manufacturer_if_not_exists(api_data):
     """
     Create Vehicle Make record if it doesn't exist
@@ -131,47 +204,24 @@ def create_manufacturer_if_not_exists(api_data):
         return existing_make
 
     try:
-        # Double-check before creating (prevent race condition)
-        existing_make = frappe.db.get_value("Vehicle Make",
-            filters={"make_name": make},
-            fieldname="name"
-        )
-
-        if existing_make:
-            return existing_make
-
-        # Create new make
+        # Create new make; one created meanwhile by another request is
+        # ignored and fetched below, without rolling back the caller's transaction
         make_doc = frappe.get_doc({
             "doctype": "Vehicle Make",
             "make_name": make,
         })
 
         make_doc.insert(ignore_permissions=True, ignore_if_duplicate=True)
-        frappe.db.commit()
-
         frappe.msgprint(_("Created new make: {0}").format(make), alert=True)
 
-        # Return the name of the created document
-        return make_doc.name
-
-    except frappe.DuplicateEntryError:
-        # Make was created by another process, fetch and return it
-        frappe.db.rollback()
-        existing_make = frappe.db.get_value("Vehicle Make",
-            filters={"make_name": make},
-            fieldname="name"
-        )
-        return existing_make
-
     except Exception as e:
         frappe.log_error(f"Error creating make {make}: {str(e)}", "VIN Decoder")
-        frappe.db.rollback()
-        # Try to return existing make if any
-        existing_make = frappe.db.get_value("Vehicle Make",
-            filters={"make_name": make},
-            fieldname="name"
-        )
-        return existing_make if existing_make else None
+
+    existing_make = frappe.db.get_value("Vehicle Make",
+        filters={"make_name": make},
+        fieldname="name"
+    )
+    return existing_make if existing_make else None
 
 
 def create_vehicle_model_if_not_exists(api_data, make_name):
@@ -203,16 +253,8 @@ def create_vehicle_model_if_not_exists(api_data, make_name):
         return existing_model
 
     try:
-        # Double-check before creating (prevent race condition)
-        existing_model = frappe.db.get_value("Vehicle Model",
-            filters={"model_name": model, "make": make_name},
-            fieldname="name"
-        )
-
-        if existing_model:
-            return existing_model
-
-        # Create new vehicle model
+        # Create new vehicle model; one created meanwhile by another request is
+        # ignored and fetched below, without rolling back the caller's transaction
         model_doc = frappe.get_doc({
             "doctype": "Vehicle Model",
             "model_name": model,
@@ -220,31 +262,16 @@ def create_vehicle_model_if_not_exists(api_data, make_name):
         })
 
         model_doc.insert(ignore_permissions=True, ignore_if_duplicate=True)
-        frappe.db.commit()
-
         frappe.msgprint(_("Created new model: {0}").format(model), alert=True)
 
-        # Return the name of the created document
-        return model_doc.name
-
-    except frappe.DuplicateEntryError:
-        # Model was created by another process, fetch and return it
-        frappe.db.rollback()
-        existing_model = frappe.db.get_value("Vehicle Model",
-            filters={"model_name": model, "make": make_name},
-            fieldname="name"
-        )
-        return existing_model
-
     except Exception as e:
         frappe.log_error(f"Error creating vehicle model {model}: {str(e)}", "VIN Decoder")
-        frappe.db.rollback()
-        # Try to return existing model if any
-        existing_model = frappe.db.get_value("Vehicle Model",
-            filters={"model_name": model, "make": make_name},
-            fieldname="name"
-        )
-        return existing_model if existing_model else None
+
+    existing_model = frappe.db.get_value("Vehicle Model",
+        filters={"model_name": model, "make": make_name},
+        fieldname="name"
+    )
+    return existing_model if existing_model else None
 
 
 def map_to_vehicle_fields(api_data):
@@ -425,216 +452,217 @@ def sync_makes_from_api():
     Sync all vehicle makes from RapidAPI
 
     Returns:
-        dict: Sync result with count of created/updated makes
+        dict: Sync result with inserted / updated / unchanged counts
     """
-    api_url = "https://car-api2.p.rapidapi.com/api/makes?direction=asc&sort=id"
-    headers = {
-        'x-rapidapi-host': 'car-api2.p.rapidapi.com',
-        'x-rapidapi-key': '60d40f8d72msh2b2f2454f08ea4dp1e7250jsnafc12c2141f1'
-    }
+    return run_catalog_sync(
+        "makes",
+        f"{get_api_url()}/api/makes?direction=asc&sort=id",
+        sync_makes_page,
+        load_makes(),
+    )
 
-    try:
-        response = requests.get(api_url, headers=headers, timeout=30)
-        response.raise_for_status()
-        data = response.json()
 
-        if not data.get("data"):
-            return {
-                "success": False,
-                "message": _("No makes found in API response")
-            }
+@frappe.whitelist()
+def sync_models_from_api(year=None, make_id=None):
+    """
+    Sync vehicle models from RapidAPI
 
-        makes = data["data"]
-        created = 0
-        updated = 0
+    Args:
+        year (int, optional): Filter by year
+        make_id (int, optional): Filter by make ID
 
-        for make_data in makes:
-            make_name = make_data.get("name")
-            api_id = make_data.get("id")
+    Returns:
+        dict: Sync result with inserted / updated / unchanged counts
+    """
+    # Build API URL
+    api_url = f"{get_api_url()}/api/models?sort=id&direction=asc&verbose=yes"
+    if year:
+        api_url += f"&year={cint(year)}"
+    if make_id:
+        api_url += f"&make_id={cint(make_id)}"
 
-            if not make_name:
-                continue
+    return run_catalog_sync("models", api_url, sync_models_page, {"makes": load_makes(), "models": load_models()})
 
-            # Check if make exists
-            existing = frappe.db.get_value("Vehicle Make",
-                filters={"make_name": make_name},
-                fieldname=["name", "api_id"],
-                as_dict=True
-            )
 
-            if existing:
-                # Update API ID if different
-                if existing.api_id != api_id:
-                    frappe.db.set_value("Vehicle Make", existing.name, "api_id", api_id)
-                    updated += 1
-            else:
-                # Create new make
-                try:
-                    make_doc = frappe.get_doc({
-                        "doctype": "Vehicle Make",
-                        "make_name": make_name,
-                        "api_id": api_id
-                    })
-                    make_doc.insert(ignore_permissions=True, ignore_if_duplicate=True)
-                    created += 1
-                except Exception as e:
-                    frappe.log_error(f"Error creating make {make_name}: {str(e)}", "Make Sync")
-
-        frappe.db.commit()
+def run_catalog_sync(endpoint, api_url, sync_page, catalog):
+    """
+    Stream the API pages of a catalog ("makes" / "models") and upsert each page in its own transaction
 
+    sync_page(rows, catalog, counts) diffs one page against the preloaded
+    catalog (updated in place) and writes the changes.
+    """
+    label = _(endpoint)
+    if not is_api_configured():
         return {
-            "success": True,
-            "message": _("Synced {0} makes ({1} created, {2} updated)").format(
-                len(makes), created, updated
-            ),
-            "created": created,
-            "updated": updated,
-            "total": len(makes)
+            "success": False,
+            "message": _("VIN decoder API key is not configured (right_hire_rapidapi_key in site config)")
         }
 
+    counts = frappe._dict(inserted=0, updated=0, unchanged=0, skipped=0, total=0)
+
+    try:
+        for rows in iter_api_pages(endpoint, api_url):
+            counts.total += len(rows)
+            sync_page(rows, catalog, counts)
+            frappe.db.commit()
     except Exception as e:
-        frappe.log_error(f"Make Sync Error: {str(e)}", "Make Sync")
+        frappe.db.rollback()
+        frappe.log_error(f"Catalog Sync Error ({label}): {str(e)}", "Catalog Sync")
         return {
             "success": False,
-            "message": _("Failed to sync makes: {0}").format(str(e))
+            "message": _("Failed to sync {0} after {1} records: {2}").format(label, counts.total, str(e)),
+            **counts,
         }
 
+    if not counts.total:
+        return {
+            "success": False,
+            "message": _("No {0} found in API response").format(label)
+        }
 
-@frappe.whitelist()
-def sync_models_from_api(year=None, make_id=None):
-    """
-    Sync vehicle models from RapidAPI
+    return {
+        "success": True,
+        "message": _("Synced {0} {1} ({2} inserted, {3} updated, {4} unchanged, {5} skipped)").format(
+            counts.total, label, counts.inserted, counts.updated, counts.unchanged, counts.skipped
+        ),
+        **counts,
+    }
 
-    Args:
-        year (int, optional): Filter by year
-        make_id (int, optional): Filter by make ID
+
+def iter_api_pages(endpoint, api_url):
+    """Yield the data rows of each page as it arrives"""
+    page = 1
+    total_pages = 1
+
+    # Safety limit to avoid too many requests
+    while page <= min(total_pages, MAX_SYNC_PAGES):
+        response = request("car_api", endpoint, "GET", f"{api_url}&page={page}", headers=get_api_headers())
+        response.raise_for_status()
+        data = response.json()
+
+        # Get total pages from first request
+        if page == 1 and data.get("collection"):
+            total_pages = cint(data["collection"].get("pages")) or 1
+
+        yield data.get("data") or []
+        page += 1
+
+
+def load_makes():
+    """Existing makes keyed by API ID and by lower-cased name"""
+    makes = frappe._dict(by_id={}, by_name={})
+    for make in frappe.get_all("Vehicle Make", fields=["name", "make_name", "api_id"]):
+        remember_make(makes, make)
+    return makes
+
+
+def remember_make(makes, make):
+    if make.api_id:
+        makes.by_id[cint(make.api_id)] = make
+    makes.by_name[make.make_name.lower()] = make
+
+
+def load_models():
+    """Existing models keyed by API ID and by (make, lower-cased name)"""
+    models = frappe._dict(by_id={}, by_name={})
+    for model in frappe.get_all("Vehicle Model", fields=["name", "make", "model_name", "api_id"]):
+        remember_model(models, model)
+    return models
+
+
+def remember_model(models, model):
+    if model.api_id:
+        models.by_id[cint(model.api_id)] = model
+    models.by_name[(model.make, model.model_name.lower())] = model
+
+
+def diff_makes(make_rows, makes, counts):
+    """
+    Rows to upsert for (make name, api id) pairs not already in `makes` as they are
 
     Returns:
-        dict: Sync result with count of created/updated models
+        dict: {make name: upsert row}; `makes` is updated to include them
     """
-    # Build API URL
-    api_url = "https://car-api2.p.rapidapi.com/api/models?sort=id&direction=asc&verbose=yes"
+    changes = {}
+    for make_name, api_id in make_rows:
+        api_id = cint(api_id) or None
+        existing = makes.by_name.get(make_name.lower()) or (api_id and makes.by_id.get(api_id))
 
-    if year:
-        api_url += f"&year={year}"
-    if make_id:
-        api_url += f"&make_id={make_id}"
+        if existing and (not api_id or cint(existing.api_id) == api_id):
+            counts.unchanged += 1
+        else:
+            make = frappe._dict(
+                name=existing.name if existing else make_name,
+                make_name=existing.make_name if existing else make_name,
+                api_id=api_id,
+            )
+            changes[make.name] = {**make, "enabled": 1}
+            remember_make(makes, make)
+            existing = make
 
-    headers = {
-        'x-rapidapi-host': 'car-api2.p.rapidapi.com',
-        'x-rapidapi-key': '60d40f8d72msh2b2f2454f08ea4dp1e7250jsnafc12c2141f1'
-    }
+        # A make matched on API ID under another name is found by this name too
+        makes.by_name.setdefault(make_name.lower(), existing)
 
-    try:
-        # Fetch all pages
-        all_models = []
-        page = 1
-        total_pages = 1
+    return changes
 
-        while page <= total_pages:
-            url = f"{api_url}&page={page}"
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            data = response.json()
 
-            if data.get("data"):
-                all_models.extend(data["data"])
+def upsert_catalog(doctype, changes, counts):
+    """Write a page's inserts and updates; only api_id is overwritten on existing records"""
+    result = bulk_upsert(doctype, list(changes.values()), update_fields=["api_id"])
+    counts.inserted += result["inserted"]
+    counts.updated += result["updated"]
 
-            # Get total pages from first request
-            if page == 1 and data.get("collection"):
-                total_pages = data["collection"].get("pages", 1)
 
-            page += 1
+def sync_makes_page(rows, makes, counts):
+    make_rows = []
+    for make_data in rows:
+        make_name = cstr(make_data.get("name")).strip()
+        if not make_name:
+            counts.skipped += 1
+            continue
+        make_rows.append((make_name, make_data.get("id")))
 
-            # Safety limit to avoid too many requests
-            if page > 100:
-                break
+    upsert_catalog("Vehicle Make", diff_makes(make_rows, makes, counts), counts)
 
-        if not all_models:
-            return {
-                "success": False,
-                "message": _("No models found in API response")
-            }
 
-        created = 0
-        updated = 0
-        skipped = 0
-
-        for model_data in all_models:
-            model_name = model_data.get("name")
-            api_id = model_data.get("id")
-            make_api_id = model_data.get("make_id")
-            make_info = model_data.get("make", {})
-            make_name = make_info.get("name")
-
-            if not model_name or not make_name:
-                skipped += 1
-                continue
-
-            # Find or create the make first
-            make_doc_name = frappe.db.get_value("Vehicle Make",
-                filters={"make_name": make_name},
-                fieldname="name"
-            )
+def sync_models_page(rows, catalog, counts):
+    makes, models = catalog["makes"], catalog["models"]
 
-            if not make_doc_name:
-                # Create the make if it doesn't exist
-                try:
-                    make_doc = frappe.get_doc({
-                        "doctype": "Vehicle Make",
-                        "make_name": make_name,
-                        "api_id": make_api_id
-                    })
-                    make_doc.insert(ignore_permissions=True, ignore_if_duplicate=True)
-                    make_doc_name = make_doc.name
-                except Exception as e:
-                    frappe.log_error(f"Error creating make {make_name}: {str(e)}", "Model Sync")
-                    skipped += 1
-                    continue
-
-            # Check if model exists
-            existing = frappe.db.get_value("Vehicle Model",
-                filters={"model_name": model_name, "make": make_doc_name},
-                fieldname=["name", "api_id"],
-                as_dict=True
-            )
+    # Makes first, so every model on the page has its make; these don't count towards the model totals
+    make_counts = frappe._dict(inserted=0, updated=0, unchanged=0)
+    make_rows = [
+        (cstr((model_data.get("make") or {}).get("name")).strip(), model_data.get("make_id"))
+        for model_data in rows
+        if cstr((model_data.get("make") or {}).get("name")).strip()
+    ]
+    bulk_upsert("Vehicle Make", list(diff_makes(make_rows, makes, make_counts).values()), update_fields=["api_id"])
 
-            if existing:
-                # Update API ID if different
-                if existing.api_id != api_id:
-                    frappe.db.set_value("Vehicle Model", existing.name, "api_id", api_id)
-                    updated += 1
-            else:
-                # Create new model
-                try:
-                    model_doc = frappe.get_doc({
-                        "doctype": "Vehicle Model",
-                        "model_name": model_name,
-                        "make": make_doc_name,
-                        "api_id": api_id
-                    })
-                    model_doc.insert(ignore_permissions=True, ignore_if_duplicate=True)
-                    created += 1
-                except Exception as e:
-                    frappe.log_error(f"Error creating model {model_name}: {str(e)}", "Model Sync")
-                    skipped += 1
-
-        frappe.db.commit()
+    changes = {}
+    for model_data in rows:
+        model_name = cstr(model_data.get("name")).strip()
+        make_name = cstr((model_data.get("make") or {}).get("name")).strip()
+        api_id = cint(model_data.get("id")) or None
 
-        return {
-            "success": True,
-            "message": _("Synced {0} models ({1} created, {2} updated, {3} skipped)").format(
-                len(all_models), created, updated, skipped
-            ),
-            "created": created,
-            "updated": updated,
-            "skipped": skipped,
-            "total": len(all_models)
-        }
+        if not model_name or not make_name:
+            counts.skipped += 1
+            continue
 
-    except Exception as e:
-        frappe.log_error(f"Model Sync Error: {str(e)}", "Model Sync")
-        return {
-            "success": False,
-            "message": _("Failed to sync models: {0}").format(str(e))
-        }
+        make = makes.by_name[make_name.lower()].name
+        existing = models.by_name.get((make, model_name.lower())) or (api_id and models.by_id.get(api_id))
+        if existing and existing.make != make:
+            existing = None
+
+        if existing and (not api_id or cint(existing.api_id) == api_id):
+            counts.unchanged += 1
+            continue
+
+        model = frappe._dict(
+            name=existing.name if existing else f"{make}-{model_name}",
+            model_name=existing.model_name if existing else model_name,
+            make=make,
+            api_id=api_id,
+        )
+        changes[model.name] = {**model, "enabled": 1}
+        remember_model(models, model)
+
+    upsert_catalog("Vehicle Model", changes, counts)
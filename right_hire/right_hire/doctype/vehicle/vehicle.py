@@ -2,6 +2,8 @@ import frappe
 from frappe.model.document import Document
 from frappe.utils import flt, getdate, nowdate
 
+from right_hire.right_hire.availability import is_vehicle_available
+
 
 class Vehicle(Document):
     def validate(self):
@@ -116,61 +118,7 @@ class Vehicle(Document):
         if not self.availability_status:
             return False
 
-        # Check for overlapping reservations
-        overlapping = frappe.db.sql(
-            """
-            SELECT name
-            FROM `tabReservation`
-            WHERE vehicle = %s
-              AND reservation_status NOT IN ('Cancelled', 'Expired')
-              AND (
-                    (pickup_datetime <= %s AND return_datetime >= %s)
-                 OR (pickup_datetime <= %s AND return_datetime >= %s)
-                 OR (pickup_datetime >= %s AND return_datetime <= %s)
-              )
-            """,
-            (
-                self.name,
-                start_datetime,
-                start_datetime,
-                end_datetime,
-                end_datetime,
-                start_datetime,
-                end_datetime,
-            ),
-        )
-
-        if overlapping:
-            return False
-
-        # Check for overlapping agreements
-        overlapping_agreements = frappe.db.sql(
-            """
-            SELECT name
-            FROM `tabRental Agreement`
-            WHERE vehicle = %s
-              AND agreement_status NOT IN ('Cancelled', 'Closed')
-              AND (
-                    (start_datetime <= %s AND end_datetime >= %s)
-                 OR (start_datetime <= %s AND end_datetime >= %s)
-                 OR (start_datetime >= %s AND end_datetime <= %s)
-              )
-            """,
-            (
-                self.name,
-                start_datetime,
-                start_datetime,
-                end_datetime,
-                end_datetime,
-                start_datetime,
-                end_datetime,
-            ),
-        )
-
-        if overlapping_agreements:
-            return False
-
-        return True
+        return is_vehicle_available(self.name, start_datetime, end_datetime)
 
 
 def validate_vehicle(doc, method):
@@ -3,6 +3,9 @@
 
 import frappe
 from frappe.model.document import Document
+from frappe.utils import now_datetime
 
 class VehicleMovement(Document):
-    pass
+    def validate(self):
+        if self.movement_status == "Completed" and not self.completed_date:
+            self.completed_date = now_datetime()
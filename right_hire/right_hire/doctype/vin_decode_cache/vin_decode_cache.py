@@ -0,0 +1,16 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.query_builder import Interval
+from frappe.query_builder.functions import Now
+
+class VINDecodeCache(Document):
+    @staticmethod
+    def clear_old_logs(days=30):
+        """Called by Log Settings to prune old failed decodes; decoded VINs are kept"""
+        table = frappe.qb.DocType("VIN Decode Cache")
+        frappe.db.delete(
+            table, filters=(table.status == "Failed") & (table.modified < (Now() - Interval(days=days)))
+        )
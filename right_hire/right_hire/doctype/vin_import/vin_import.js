@@ -0,0 +1,29 @@
+// Copyright (c) 2025, Right Hire and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on("VIN Import", {
+	setup(frm) {
+		frappe.realtime.on("vin_import_progress", (data) => {
+			if (data.import !== frm.doc.name) return;
+
+			if (data.stage === "Completed" || data.stage === "Failed") {
+				frm.dashboard.hide_progress();
+				frm.reload_doc();
+			} else if (data.total) {
+				frm.dashboard.show_progress(
+					__("VIN Import"),
+					(data.done / data.total) * 100,
+					__("{0}: {1} of {2} VINs", [__(data.stage), data.done, data.total])
+				);
+			}
+		});
+	},
+
+	refresh(frm) {
+		if (frm.is_new() || ["Queued", "Running"].includes(frm.doc.status)) return;
+
+		frm.add_custom_button(frm.doc.status === "Pending" ? __("Start Import") : __("Run Again"), () => {
+			frm.call("start_import").then(() => frm.reload_doc());
+		}).addClass("btn-primary");
+	},
+});
@@ -0,0 +1,18 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+
+from right_hire.right_hire.vin_import import enqueue_vin_import
+
+class VINImport(Document):
+    @frappe.whitelist()
+    def start_import(self):
+        """Queue the import job for this file"""
+        if self.status in ("Queued", "Running"):
+            frappe.throw(_("This import is already {0}").format(_(self.status)))
+
+        self.db_set({"status": "Queued", "created": 0, "skipped": 0, "failed": 0, "result_file": None})
+        enqueue_vin_import(self.name)
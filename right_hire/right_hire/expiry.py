@@ -0,0 +1,201 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+"""Expiry engine.
+
+Every expirable date in the app (vehicle registration / insurance / service,
+vehicle documents, insurance policies, driver licences, customer licence /
+ID / passport) is exposed through one UNION ALL query. Each branch filters
+on its own indexed date column, so only rows inside the horizon are read, and
+the combined result is ordered and paged in SQL.
+
+Used by the Expiry Alerts report and the daily expiry / maintenance alerts.
+"""
+
+import frappe
+from frappe.utils import add_days, getdate, today
+
+DEFAULT_PAGE_LENGTH = 500
+
+# expiry_type -> source. `horizon` is the default look-ahead in days when no
+# to_date is given; the SQL snippets are evaluated against the source table.
+EXPIRY_SOURCES = {
+    "Vehicle Registration": frappe._dict(
+        table="Vehicle",
+        date_field="registration_expiry",
+        reference_doctype="'Vehicle'",
+        reference_name="name",
+        vehicle="name",
+        holder="NULL",
+        status="status",
+        conditions="status != 'Deactivated'",
+        horizon=90,
+    ),
+    "Vehicle Insurance": frappe._dict(
+        table="Vehicle",
+        date_field="insurance_expiry",
+        reference_doctype="'Vehicle'",
+        reference_name="name",
+        vehicle="name",
+        holder="insurance_provider",
+        status="status",
+        conditions="status != 'Deactivated'",
+        horizon=90,
+    ),
+    "Service Due": frappe._dict(
+        table="Vehicle",
+        date_field="next_service_due",
+        reference_doctype="'Vehicle'",
+        reference_name="name",
+        vehicle="name",
+        holder="NULL",
+        status="status",
+        conditions="status != 'Deactivated'",
+        horizon=30,
+    ),
+    "Vehicle Document": frappe._dict(
+        table="Vehicle Document",
+        date_field="expiry_date",
+        reference_doctype="'Vehicle'",
+        reference_name="parent",
+        vehicle="parent",
+        holder="document_type",
+        status="NULL",
+        conditions="parenttype = 'Vehicle'",
+        horizon=90,
+    ),
+    "Insurance Policy": frappe._dict(
+        table="Insurance Policy",
+        date_field="end_date",
+        reference_doctype="'Insurance Policy'",
+        reference_name="name",
+        vehicle="NULL",
+        holder="policy_number",
+        status="'Active'",
+        conditions="is_active = 1",
+        horizon=90,
+    ),
+    "Driver License": frappe._dict(
+        table="Driver",
+        date_field="license_expiry",
+        reference_doctype="'Driver'",
+        reference_name="name",
+        vehicle="NULL",
+        holder="driver_name",
+        status="IF(is_blacklisted, 'Blacklisted', 'Active')",
+        conditions="1 = 1",
+        horizon=90,
+    ),
+    "Customer License": frappe._dict(
+        table="Customer",
+        date_field="license_expiry",
+        reference_doctype="'Customer'",
+        reference_name="name",
+        vehicle="NULL",
+        holder="customer_name",
+        status="IF(is_blacklisted, 'Blacklisted', 'Active')",
+        conditions="customer_type = 'Individual'",
+        horizon=90,
+    ),
+    "Customer ID": frappe._dict(
+        table="Customer",
+        date_field="id_expiry",
+        reference_doctype="'Customer'",
+        reference_name="name",
+        vehicle="NULL",
+        holder="customer_name",
+        status="IF(is_blacklisted, 'Blacklisted', 'Active')",
+        conditions="customer_type = 'Individual'",
+        horizon=90,
+    ),
+    "Customer Passport": frappe._dict(
+        table="Customer",
+        date_field="passport_expiry",
+        reference_doctype="'Customer'",
+        reference_name="name",
+        vehicle="NULL",
+        holder="customer_name",
+        status="IF(is_blacklisted, 'Blacklisted', 'Active')",
+        conditions="customer_type = 'Individual'",
+        horizon=90,
+    ),
+}
+
+
+def get_expiries(expiry_types=None, from_date=None, to_date=None, start=0, page_length=DEFAULT_PAGE_LENGTH):
+    """One page of expiries ordered by date.
+
+    expiry_types: subset of EXPIRY_SOURCES (default all)
+    from_date: earliest expiry date to include (default: no lower bound, so overdue items show)
+    to_date: latest expiry date (default: today + each source's own horizon)
+    """
+    expiry_types = [t for t in (expiry_types or EXPIRY_SOURCES) if t in EXPIRY_SOURCES]
+    if not expiry_types:
+        return []
+
+    values = {"start": int(start), "page_length": int(page_length), "today": getdate(today())}
+    if from_date:
+        values["from_date"] = getdate(from_date)
+
+    branches = []
+    for idx, expiry_type in enumerate(expiry_types):
+        source = EXPIRY_SOURCES[expiry_type]
+        values[f"type_{idx}"] = expiry_type
+        values[f"to_date_{idx}"] = getdate(to_date) if to_date else getdate(add_days(today(), source.horizon))
+        lower_bound = f"AND `{source.date_field}` >= %(from_date)s" if from_date else ""
+
+        branches.append(f"""
+            SELECT {source.reference_doctype} AS reference_doctype,
+                {source.reference_name} AS reference_name,
+                {source.vehicle} AS vehicle,
+                {source.holder} AS holder,
+                {source.status} AS status,
+                %(type_{idx})s AS expiry_type,
+                `{source.date_field}` AS expiry_date
+            FROM `tab{source.table}`
+            WHERE `{source.date_field}` <= %(to_date_{idx})s
+              {lower_bound}
+              AND {source.conditions}
+        """)
+
+    return frappe.db.sql(
+        f"""
+        SELECT e.reference_doctype, e.reference_name, e.vehicle, e.holder,
+            e.expiry_type, e.expiry_date,
+            DATEDIFF(e.expiry_date, %(today)s) AS days_remaining,
+            IFNULL(e.status, v.status) AS status,
+            v.vehicle_id, v.plate_no,
+            TRIM(CONCAT(IFNULL(v.make, ''), ' ', IFNULL(v.model, ''))) AS make_model
+        FROM ({" UNION ALL ".join(branches)}) e
+        LEFT JOIN `tabVehicle` v ON v.name = e.vehicle
+        ORDER BY e.expiry_date, e.expiry_type, e.reference_name
+        LIMIT %(start)s, %(page_length)s
+        """,
+        values,
+        as_dict=True,
+    )
+
+
+def iter_expiries(expiry_types=None, from_date=None, to_date=None, page_length=DEFAULT_PAGE_LENGTH):
+    """Yield every expiry in the range, fetched a page at a time."""
+    start = 0
+    while True:
+        page = get_expiries(expiry_types, from_date, to_date, start=start, page_length=page_length)
+        yield from page
+        if len(page) < page_length:
+            break
+        start += page_length
+
+
+def get_urgency(days_remaining):
+    """Calculate urgency level based on days remaining"""
+    if days_remaining < 0:
+        return "Overdue"
+    elif days_remaining <= 7:
+        return "Critical"
+    elif days_remaining <= 14:
+        return "High"
+    elif days_remaining <= 30:
+        return "Medium"
+    else:
+        return "Low"
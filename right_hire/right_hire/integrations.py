@@ -0,0 +1,220 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+"""Shared HTTP client for outbound integrations (car API, Azure Document Intelligence).
+
+`request(integration, endpoint, method, url)` sends through a pooled
+`requests.Session` per host, kept per process, so repeated calls reuse
+keep-alive connections instead of a new TCP + TLS handshake each.
+
+Per integration (INTEGRATIONS defaults, overridden by
+`right_hire_integrations` in site config, e.g.
+`{"car_api": {"timeout": 10, "max_retries": 3}}`):
+
+    connect_timeout / timeout: seconds to connect / to read
+    max_retries: retries of 429 and 5xx responses, and of timeouts and
+        connection errors, for idempotent methods; a non-idempotent call
+        (e.g. a billed POST) is only retried on 429, or 503 with
+        Retry-After, where the server refused it without starting any work;
+        exponential backoff with jitter, honouring Retry-After
+    breaker_threshold / breaker_cooldown: after this many consecutive
+        failed calls the circuit opens and calls fail at once with
+        CircuitOpenError for `breaker_cooldown` seconds; after that calls go
+        through again and the first failure re-opens it
+
+Breaker state and per-endpoint call / error / retry counts and latency are
+kept in Redis, shared by all workers; read them with
+`get_integration_metrics`. Credentials come from site config only
+(`get_credential`).
+"""
+
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import frappe
+import requests
+from frappe import _
+from frappe.utils import cint, flt
+
+CIRCUIT_KEY = "right_hire_circuit"
+METRICS_KEY = "right_hire_integration_metrics"
+# Breaker failure counts are forgotten after a quiet hour
+CIRCUIT_TTL = 3600
+POOL_SIZE = 10
+MAX_BACKOFF = 30
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+DEFAULT_SETTINGS = {
+    "connect_timeout": 5,
+    "timeout": 30,
+    "max_retries": 2,
+    "backoff": 0.5,
+    "breaker_threshold": 5,
+    "breaker_cooldown": 60,
+}
+
+INTEGRATIONS = {
+    "car_api": {"timeout": 15},
+    "azure_di": {"timeout": 60},
+}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling a service whose circuit is open."""
+
+
+def get_settings(integration):
+    settings = {**DEFAULT_SETTINGS, **INTEGRATIONS.get(integration, {})}
+    settings.update((frappe.conf.get("right_hire_integrations") or {}).get(integration) or {})
+    return frappe._dict(settings)
+
+
+def get_credential(key):
+    """A secret from site config; never from source."""
+    return frappe.conf.get(key)
+
+
+def get_session(url):
+    """The pooled keep-alive session for the host of `url`, shared by all threads of this process."""
+    parts = urlsplit(url)
+    host = f"{parts.scheme}://{parts.netloc}"
+    session = _sessions.get(host)
+    if session:
+        return session
+
+    with _sessions_lock:
+        if host not in _sessions:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount(f"{parts.scheme}://", adapter)
+            _sessions[host] = session
+        return _sessions[host]
+
+
+def request(integration, endpoint, method, url, **kwargs):
+    """Send a request through the pool with timeouts, retries, the circuit breaker and metrics.
+
+    `endpoint` names the call for the metrics ("vin", "models", ...), so it
+    must not contain per-request values.
+
+    Returns the response for any status below 500 other than 429 (the caller
+    decides what a 4xx means); raises requests exceptions, or CircuitOpenError.
+    """
+    settings = get_settings(integration)
+    method = method.upper()
+    kwargs.setdefault("timeout", (flt(settings.connect_timeout), flt(settings.timeout)))
+
+    check_circuit(integration)
+    session = get_session(url)
+    max_retries = cint(settings.max_retries)
+
+    for attempt in range(max_retries + 1):
+        started = time.monotonic()
+        retry_after = None
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            record_call(integration, endpoint, get_latency_ms(started), error=True)
+            if attempt == max_retries or method not in IDEMPOTENT_METHODS:
+                record_failure(integration, settings)
+                raise
+        else:
+            failed = response.status_code == 429 or response.status_code >= 500
+            record_call(integration, endpoint, get_latency_ms(started), error=failed or response.status_code >= 400)
+            if not failed:
+                record_success(integration)
+                return response
+            if attempt == max_retries or not is_retryable(method, response):
+                record_failure(integration, settings)
+                return response
+            retry_after = response.headers.get("Retry-After")
+
+        count(integration, endpoint, "retries")
+        time.sleep(get_backoff(attempt, flt(settings.backoff), retry_after))
+
+
+def is_retryable(method, response):
+    """Whether a 429 / 5xx response may be retried without risking the request running twice."""
+    if method in IDEMPOTENT_METHODS:
+        return True
+    return response.status_code == 429 or (response.status_code == 503 and "Retry-After" in response.headers)
+
+
+def get_backoff(attempt, base, retry_after=None):
+    """Seconds before retry `attempt + 1`: Retry-After if given, else exponential with jitter."""
+    if str(retry_after or "").isdigit():
+        return min(int(retry_after), MAX_BACKOFF)
+    return min(base * 2**attempt, MAX_BACKOFF) * random.uniform(0.5, 1)
+
+
+def get_circuit_key(integration):
+    return frappe.cache().make_key(f"{CIRCUIT_KEY}:{integration}")
+
+
+def check_circuit(integration):
+    # Raw commands: the cache wrapper's hash helpers pickle values, counters must stay integers
+    open_until = flt(frappe.cache().execute_command("HGET", get_circuit_key(integration), "open_until"))
+    if open_until > time.time():
+        count(integration, "circuit", "rejected")
+        raise CircuitOpenError(_("{0} is unavailable, retrying after {1} seconds").format(
+            integration, cint(open_until - time.time()) + 1
+        ))
+
+
+def record_failure(integration, settings):
+    key = get_circuit_key(integration)
+    pipeline = frappe.cache().pipeline()
+    pipeline.hincrby(key, "failures", 1)
+    pipeline.expire(key, CIRCUIT_TTL)
+    failures = pipeline.execute()[0]
+
+    if failures >= cint(settings.breaker_threshold):
+        # Open (or re-open after a failed probe) for the cooldown
+        frappe.cache().execute_command("HSET", key, "open_until", time.time() + flt(settings.breaker_cooldown))
+        count(integration, "circuit", "opened")
+        frappe.logger().warning(f"Circuit for {integration} opened after {failures} consecutive failures")
+
+
+def record_success(integration):
+    frappe.cache().delete(get_circuit_key(integration))
+
+
+def get_latency_ms(started):
+    return int((time.monotonic() - started) * 1000)
+
+
+def record_call(integration, endpoint, latency_ms, error=False):
+    key = frappe.cache().make_key(METRICS_KEY)
+    field = f"{integration}|{endpoint}"
+    pipeline = frappe.cache().pipeline()
+    pipeline.hincrby(key, f"{field}|calls", 1)
+    pipeline.hincrby(key, f"{field}|latency_ms", latency_ms)
+    if error:
+        pipeline.hincrby(key, f"{field}|errors", 1)
+    pipeline.execute()
+
+
+def count(integration, endpoint, counter):
+    frappe.cache().execute_command("HINCRBY", frappe.cache().make_key(METRICS_KEY), f"{integration}|{endpoint}|{counter}", 1)
+
+
+@frappe.whitelist()
+def get_integration_metrics():
+    """{integration: {endpoint: {calls, errors, retries, avg_latency_ms, ...}}}"""
+    frappe.only_for(("System Manager", "Right Hire Admin"))
+
+    metrics = {}
+    for field, value in frappe.cache().execute_command("HGETALL", frappe.cache().make_key(METRICS_KEY)).items():
+        integration, endpoint, counter = frappe.safe_decode(field).rsplit("|", 2)
+        metrics.setdefault(integration, {}).setdefault(endpoint, {})[counter] = cint(value)
+
+    for endpoints in metrics.values():
+        for values in endpoints.values():
+            if values.get("calls"):
+                values["avg_latency_ms"] = round(values.pop("latency_ms", 0) / values["calls"])
+    return metrics
@@ -0,0 +1,247 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+"""Lease billing run.
+
+Runs daily. Due `Lease Schedule Line` rows are selected directly with one
+query over the (status, period_start) index, split into batches and billed
+as chunks on the long queue with bounded concurrency. A line is due once its
+period has started and its contract's billing day in that month has been
+reached.
+
+Every invoice carries an idempotency key (`billing_key`, unique) derived from
+its schedule line, so a batch that is retried, or a second run on the same
+day, can never bill a line twice. Progress is recorded on a `Lease Billing
+Run` per day; running again resumes with whatever is still pending.
+"""
+
+import frappe
+from frappe.utils import cint, flt, getdate, now
+
+from right_hire.tasks.chunked import batch_chunks, run_chunked
+
+BILLING_BATCH_SIZE = 200
+BILLED_LINE_STATUSES = ("Invoiced", "Paid", "Overdue")
+
+
+def get_due_schedule_lines(as_of):
+    """Names of Pending schedule lines due for billing on `as_of`."""
+    return frappe.db.sql_list(
+        """
+        SELECT sl.name
+        FROM `tabLease Schedule Line` sl
+        INNER JOIN `tabLease Contract` lc ON lc.name = sl.parent
+        WHERE sl.status = 'Pending'
+          AND sl.period_start <= %(as_of)s
+          AND sl.parenttype = 'Lease Contract'
+          AND lc.docstatus = 1
+          AND lc.lease_status = 'Active'
+          AND (
+              IFNULL(lc.billing_day, 0) = 0
+              OR DATE_ADD(
+                  DATE_SUB(sl.period_start, INTERVAL DAY(sl.period_start) - 1 DAY),
+                  INTERVAL LEAST(lc.billing_day, DAY(LAST_DAY(sl.period_start))) - 1 DAY
+              ) <= %(as_of)s
+          )
+        ORDER BY sl.parent, sl.period_start
+        """,
+        {"as_of": as_of},
+    )
+
+
+def start_billing_run(as_of=None, batch_size=None):
+    """Queue billing of every due schedule line; returns the Lease Billing Run name."""
+    as_of = getdate(as_of)
+    batch_size = cint(batch_size) or BILLING_BATCH_SIZE
+    run_name = f"LBR-{as_of}"
+    lines = get_due_schedule_lines(as_of)
+    batches = batch_chunks(lines, batch_size, arg="lines", run_name=run_name, as_of=as_of)
+
+    if not frappe.db.exists("Lease Billing Run", run_name):
+        frappe.get_doc({"doctype": "Lease Billing Run", "run_date": as_of}).insert(ignore_permissions=True)
+
+    # Each start (or resume) counts only the lines still pending
+    frappe.db.set_value(
+        "Lease Billing Run",
+        run_name,
+        {
+            "status": "Running" if batches else "Completed",
+            "started_at": now(),
+            "finished_at": None if batches else now(),
+            "due_lines": len(lines),
+            "batches": len(batches),
+            "batches_done": 0,
+            "invoiced": 0,
+            "skipped": 0,
+            "failed": 0,
+        },
+    )
+
+    # Pending lines are re-selected on every start, so a rerun is a fresh set of chunks;
+    # billing_key keeps lines that were billed meanwhile from being billed again
+    run_chunked(
+        "lease_billing",
+        "right_hire.right_hire.lease_billing.process_billing_batch",
+        batches,
+        run_id=as_of,
+        restart=True,
+    )
+
+    return run_name
+
+
+def process_billing_batch(run_name, lines, as_of):
+    """Background job: bill one batch of schedule lines and record the outcome on the run."""
+    counts = {"invoiced": 0, "skipped": 0, "failed": 0}
+    errors = []
+    schedule_lines = get_schedule_lines(lines)
+
+    for line in schedule_lines:
+        try:
+            counts[bill_schedule_line(line, as_of)] += 1
+            frappe.db.commit()
+        except Exception as e:
+            frappe.db.rollback()
+            counts["failed"] += 1
+            errors.append(f"{line.contract} / {line.name}: {e}")
+            frappe.log_error(f"Failed to bill lease {line.contract} line {line.name}: {str(e)}")
+
+    update_contract_totals({line.contract for line in schedule_lines})
+    record_batch(run_name, counts, errors)
+    frappe.db.commit()
+    return counts
+
+
+def get_schedule_lines(lines):
+    """Schedule lines with the contract fields needed to invoice them."""
+    if not lines:
+        return []
+
+    return frappe.db.sql(
+        """
+        SELECT sl.name, sl.period_start, sl.period_end, sl.amount, sl.status,
+            lc.name AS contract, lc.customer, lc.branch, lc.vehicle, lc.plate_no
+        FROM `tabLease Schedule Line` sl
+        INNER JOIN `tabLease Contract` lc ON lc.name = sl.parent
+        WHERE sl.name IN %(lines)s
+        ORDER BY sl.parent, sl.period_start
+        """,
+        {"lines": tuple(lines)},
+        as_dict=True,
+    )
+
+
+def bill_schedule_line(line, as_of):
+    """Invoice one schedule line unless its idempotency key was already used.
+
+    Returns "invoiced" or "skipped".
+    """
+    billing_key = f"Lease Schedule Line:{line.name}"
+    invoice_name = frappe.db.get_value("Invoice", {"billing_key": billing_key})
+
+    if line.status != "Pending" or invoice_name:
+        mark_line_invoiced(line, invoice_name, as_of)
+        return "skipped"
+
+    amount = flt(line.amount)
+    invoice = frappe.get_doc({
+        "doctype": "Invoice",
+        "customer": line.customer,
+        "branch": line.branch,
+        "reference_type": "Lease Contract",
+        "reference_name": line.contract,
+        "billing_key": billing_key,
+        "posting_date": as_of,
+        "due_date": as_of,
+        "status": "Unpaid",
+        "total": amount,
+        "grand_total": amount,
+        "outstanding": amount,
+        "items": [{
+            "item_name": f"Vehicle Lease - {line.plate_no or line.vehicle}",
+            "description": f"Lease {line.contract}: {line.period_start} to {line.period_end}",
+            "qty": 1,
+            "rate": amount,
+            "amount": amount,
+        }],
+    })
+
+    try:
+        invoice.insert(ignore_permissions=True)
+    except frappe.UniqueValidationError:
+        # A concurrent worker billed this line between the check and the insert
+        frappe.db.rollback()
+        mark_line_invoiced(line, frappe.db.get_value("Invoice", {"billing_key": billing_key}), as_of)
+        return "skipped"
+
+    invoice.submit()
+    mark_line_invoiced(line, invoice.name, as_of)
+    return "invoiced"
+
+
+def mark_line_invoiced(line, invoice_name, as_of):
+    """Point a still-Pending schedule line at its invoice."""
+    if not invoice_name:
+        return
+
+    frappe.db.sql(
+        """
+        UPDATE `tabLease Schedule Line`
+        SET status = 'Invoiced', invoice_ref = %(invoice)s, invoice_date = %(as_of)s
+        WHERE name = %(name)s AND status = 'Pending'
+        """,
+        {"invoice": invoice_name, "as_of": as_of, "name": line.name},
+    )
+
+
+def update_contract_totals(contracts):
+    """Recompute total_invoiced / total_outstanding for the given contracts in one UPDATE."""
+    if not contracts:
+        return
+
+    frappe.db.sql(
+        """
+        UPDATE `tabLease Contract` lc
+        INNER JOIN (
+            SELECT parent, SUM(amount) AS total_invoiced
+            FROM `tabLease Schedule Line`
+            WHERE parent IN %(contracts)s
+              AND parenttype = 'Lease Contract'
+              AND status IN %(statuses)s
+            GROUP BY parent
+        ) sl ON sl.parent = lc.name
+        SET lc.total_invoiced = sl.total_invoiced,
+            lc.total_outstanding = sl.total_invoiced - IFNULL(lc.total_paid, 0)
+        """,
+        {"contracts": tuple(contracts), "statuses": BILLED_LINE_STATUSES},
+    )
+
+
+def record_batch(run_name, counts, errors):
+    """Add one finished batch to the run's counters atomically.
+
+    Status and finished_at are assigned first because MariaDB evaluates
+    SET clauses left to right against the already-updated values.
+    """
+    frappe.db.sql(
+        """
+        UPDATE `tabLease Billing Run`
+        SET status = IF(batches_done + 1 >= batches,
+                IF(failed + %(failed)s > 0, 'Completed with Errors', 'Completed'),
+                'Running'),
+            finished_at = IF(batches_done + 1 >= batches, %(now)s, finished_at),
+            batches_done = batches_done + 1,
+            invoiced = invoiced + %(invoiced)s,
+            skipped = skipped + %(skipped)s,
+            failed = failed + %(failed)s,
+            error_log = CONCAT(IFNULL(error_log, ''), %(errors)s),
+            modified = %(now)s
+        WHERE name = %(run)s
+        """,
+        {
+            **counts,
+            "errors": "".join(f"{error}\n" for error in errors),
+            "now": now(),
+            "run": run_name,
+        },
+    )
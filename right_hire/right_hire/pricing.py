@@ -0,0 +1,290 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+"""Rate Plan pricing.
+
+A Rate Plan and its Seasonal Price Windows are compiled once into an
+immutable `RatePlanPricing` object and cached (Redis, fronted by the
+request-local cache), so Reservation, Rental Agreement and Rental Quotation
+validate without loading the Rate Plan again. The cache is dropped whenever
+the Rate Plan is saved, renamed or deleted.
+"""
+
+from bisect import bisect_right
+from dataclasses import dataclass
+
+import frappe
+from frappe import _
+from frappe.utils import add_days, cint, flt, get_datetime, getdate
+
+from right_hire.right_hire.availability import count_available_vehicles
+
+PRICING_CACHE_KEY = "right_hire_rate_plan_pricing"
+
+# Length of one rate unit in days, per Rate Plan rate type
+RATE_UNIT_DAYS = {
+    "Hourly": 1 / 24,
+    "Daily": 1,
+    "Weekly": 7,
+    "Monthly": 30,
+}
+
+# Extras priced from the Rate Plan itself: code -> (rate field, charged per day)
+PLAN_EXTRAS = {
+    "CDW": ("cdw_rate", True),
+    "PAI": ("pai_rate", True),
+    "Delivery": ("delivery_charge", False),
+    "Pickup": ("pickup_charge", False),
+}
+
+MAX_QUOTE_CELLS = 5000
+
+
+@dataclass(frozen=True)
+class RatePlanPricing:
+    """Compiled, read-only view of a Rate Plan.
+
+    `segments` is the seasonal calendar flattened into disjoint
+    (start, end, multiplier) intervals sorted by start, with `segment_ends`
+    alongside for bisecting. Where windows overlap the highest multiplier
+    wins; time outside every window is charged at 1x.
+    """
+
+    name: str
+    rate_type: str
+    base_rate: float
+    free_km: int
+    overage_per_km: float
+    deposit: float
+    minimum_rental_days: int
+    vehicle_category: str = None
+    applicable_from: object = None
+    applicable_to: object = None
+    cdw_rate: float = 0
+    pai_rate: float = 0
+    delivery_charge: float = 0
+    pickup_charge: float = 0
+    segments: tuple = ()
+    segment_ends: tuple = ()
+
+    @property
+    def unit_days(self):
+        return RATE_UNIT_DAYS.get(self.rate_type)
+
+    def seasonal_days(self, start_datetime, end_datetime):
+        """Days in the period, each weighted by its seasonal multiplier."""
+        start, end = get_datetime(start_datetime), get_datetime(end_datetime)
+        total = (end - start).total_seconds()
+        if total <= 0:
+            return 0
+
+        # Seconds falling inside windows are re-weighted; the rest stay at 1x
+        extra = 0
+        for seg_start, seg_end, multiplier in self.segments[bisect_right(self.segment_ends, start):]:
+            if seg_start >= end:
+                break
+            overlap = (min(seg_end, end) - max(seg_start, start)).total_seconds()
+            if overlap > 0:
+                extra += overlap * (multiplier - 1)
+
+        return (total + extra) / 86400
+
+    def rental_amount(self, start_datetime, end_datetime, base_rate=None):
+        """Rental charge for the period at `base_rate` (defaults to the plan's) per rate unit."""
+        if not self.unit_days:
+            return 0
+
+        rate = flt(self.base_rate if base_rate is None else base_rate)
+        return rate * self.seasonal_days(start_datetime, end_datetime) / self.unit_days
+
+    def overage_amount(self, km_driven, free_km=None):
+        """Overage charge for the km driven beyond the free allowance."""
+        overage_km = flt(km_driven) - flt(self.free_km if free_km is None else free_km)
+        return max(overage_km, 0) * flt(self.overage_per_km)
+
+    def applies_on(self, date):
+        """Whether the plan's applicability range covers a date."""
+        date = getdate(date)
+        return (not self.applicable_from or self.applicable_from <= date) and (
+            not self.applicable_to or date <= self.applicable_to
+        )
+
+    def extras_amount(self, extras, rental_days):
+        """Charge for plan extras (codes from PLAN_EXTRAS) over the rental."""
+        total = 0
+        for extra in extras or ():
+            field, per_day = PLAN_EXTRAS[extra]
+            total += getattr(self, field) * (rental_days if per_day else 1)
+        return total
+
+
+def compile_rate_plan(rate_plan):
+    """Build a `RatePlanPricing` from a Rate Plan document."""
+    windows = sorted(
+        (
+            get_datetime(getdate(w.start_date)),
+            # Window end dates are inclusive
+            get_datetime(add_days(getdate(w.end_date), 1)),
+            flt(w.multiplier) or 1,
+        )
+        for w in (rate_plan.get("seasonal_windows") or [])
+        if w.start_date and w.end_date and getdate(w.end_date) >= getdate(w.start_date)
+    )
+    segments = flatten_windows(windows)
+
+    return RatePlanPricing(
+        name=rate_plan.name,
+        rate_type=rate_plan.rate_type,
+        base_rate=flt(rate_plan.base_rate),
+        free_km=int(rate_plan.free_km or 0),
+        overage_per_km=flt(rate_plan.overage_per_km),
+        deposit=flt(rate_plan.deposit),
+        minimum_rental_days=int(rate_plan.minimum_rental_days or 0),
+        vehicle_category=rate_plan.vehicle_category,
+        applicable_from=getdate(rate_plan.applicable_from) if rate_plan.applicable_from else None,
+        applicable_to=getdate(rate_plan.applicable_to) if rate_plan.applicable_to else None,
+        cdw_rate=flt(rate_plan.cdw_rate),
+        pai_rate=flt(rate_plan.pai_rate),
+        delivery_charge=flt(rate_plan.delivery_charge),
+        pickup_charge=flt(rate_plan.pickup_charge),
+        segments=tuple(segments),
+        segment_ends=tuple(end for _start, end, _multiplier in segments),
+    )
+
+
+def flatten_windows(windows):
+    """Split possibly overlapping (start, end, multiplier) windows into disjoint segments."""
+    boundaries = sorted({point for start, end, _multiplier in windows for point in (start, end)})
+    segments = []
+
+    for seg_start, seg_end in zip(boundaries, boundaries[1:]):
+        multipliers = [m for start, end, m in windows if start <= seg_start and end >= seg_end]
+        if not multipliers:
+            continue
+        multiplier = max(multipliers)
+        # Merge with the previous segment when contiguous at the same multiplier
+        if segments and segments[-1][1] == seg_start and segments[-1][2] == multiplier:
+            segments[-1] = (segments[-1][0], seg_end, multiplier)
+        else:
+            segments.append((seg_start, seg_end, multiplier))
+
+    return segments
+
+
+def get_rate_plan_pricing(rate_plan):
+    """Cached `RatePlanPricing` for a Rate Plan name, or None if it does not exist."""
+    if not rate_plan:
+        return None
+
+    def generator():
+        if not frappe.db.exists("Rate Plan", rate_plan):
+            return None
+        return compile_rate_plan(frappe.get_doc("Rate Plan", rate_plan))
+
+    return frappe.cache().hget(PRICING_CACHE_KEY, rate_plan, generator)
+
+
+def clear_rate_plan_pricing(rate_plan=None):
+    """Drop one (or every) compiled Rate Plan from the cache."""
+    if rate_plan:
+        frappe.cache().hdel(PRICING_CACHE_KEY, rate_plan)
+    else:
+        frappe.cache().delete_value(PRICING_CACHE_KEY)
+
+
+def quote_matrix(cells, include_availability=False):
+    """Price many (rate plan or category, pickup, return, extras) cells in one pass.
+
+    Each cell is a dict with `rate_plan` or `vehicle_category`,
+    `pickup_datetime`, `return_datetime` and optional `extras` (codes from
+    PLAN_EXTRAS); `branch`, `make` and `model` narrow the availability count.
+    A category cell is quoted on its cheapest active plan applicable at pickup.
+    Returns one result dict per cell, in input order.
+    """
+    if len(cells) > MAX_QUOTE_CELLS:
+        frappe.throw(_("A bulk quote is limited to {0} cells").format(MAX_QUOTE_CELLS))
+
+    categories = {c.get("vehicle_category") for c in cells if not c.get("rate_plan") and c.get("vehicle_category")}
+    plans_by_category = {}
+    if categories:
+        for plan in frappe.get_all(
+            "Rate Plan",
+            filters={"is_active": 1, "vehicle_category": ["in", list(categories)]},
+            fields=["name", "vehicle_category"],
+        ):
+            plans_by_category.setdefault(plan.vehicle_category, []).append(plan.name)
+
+    # Candidate windows repeat across cells, so parse each only once
+    periods = {}
+    results = []
+    for cell in cells:
+        key = (cell.get("pickup_datetime"), cell.get("return_datetime"))
+        if key not in periods:
+            periods[key] = (get_datetime(key[0]), get_datetime(key[1])) if all(key) else None
+        results.append(quote_cell(cell, periods[key], plans_by_category))
+
+    if cint(include_availability):
+        attach_availability(cells, results, periods)
+
+    return results
+
+
+def quote_cell(cell, period, plans_by_category):
+    """Quote one bulk cell; returns an `error` entry instead of raising."""
+    if not period or period[1] <= period[0]:
+        return {"error": _("Return must be after pickup")}
+
+    start, end = period
+    extras = cell.get("extras") or []
+    unknown = [extra for extra in extras if extra not in PLAN_EXTRAS]
+    if unknown:
+        return {"error": _("Unknown extras: {0}").format(", ".join(unknown))}
+
+    if cell.get("rate_plan"):
+        plans = [get_rate_plan_pricing(cell["rate_plan"])]
+    else:
+        plans = [get_rate_plan_pricing(name) for name in plans_by_category.get(cell.get("vehicle_category"), [])]
+    plans = [plan for plan in plans if plan and plan.applies_on(start)]
+    if not plans:
+        return {"error": _("No applicable Rate Plan")}
+
+    rental_days = (end - start).total_seconds() / 86400
+    best = None
+    for plan in plans:
+        rental_amount = plan.rental_amount(start, end)
+        extras_total = plan.extras_amount(extras, rental_days)
+        quote = {
+            "rate_plan": plan.name,
+            "rental_days": rental_days,
+            "rental_amount": flt(rental_amount, 2),
+            "extras_total": flt(extras_total, 2),
+            "grand_total": flt(rental_amount + extras_total, 2),
+            "deposit": plan.deposit,
+        }
+        if best is None or quote["grand_total"] < best["grand_total"]:
+            best = quote
+
+    return best
+
+
+def attach_availability(cells, results, periods):
+    """Add `available` vehicle counts to each priced result, one lookup per fleet filter."""
+    windows_by_filter = {}
+    for cell, result in zip(cells, results):
+        if "error" not in result:
+            key = (cell.get("branch"), cell.get("make"), cell.get("model"))
+            period = periods[(cell.get("pickup_datetime"), cell.get("return_datetime"))]
+            windows_by_filter.setdefault(key, set()).add(period)
+
+    counts = {}
+    for (branch, make, model), windows in windows_by_filter.items():
+        filters = {"status": ["!=", "Deactivated"]}
+        for field, value in (("branch", branch), ("make", make), ("model", model)):
+            if value:
+                filters[field] = value
+        counts[(branch, make, model)] = count_available_vehicles(filters, windows)
+
+    for cell, result in zip(cells, results):
+        if "error" not in result:
+            key = (cell.get("branch"), cell.get("make"), cell.get("model"))
+            result["available"] = counts[key][periods[(cell.get("pickup_datetime"), cell.get("return_datetime"))]]
@@ -0,0 +1,206 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+"""Per-vehicle monthly profitability ledger.
+
+Revenue and cost for the whole fleet are computed with one grouped query per
+source and written to `Vehicle Profitability` (one row per vehicle per
+month) with a bulk upsert. The lifetime summary on Vehicle (total_revenue,
+total_maintenance_cost, net_profit) is then re-derived from the ledger with a
+single UPDATE ... JOIN instead of saving every Vehicle.
+"""
+
+from collections import defaultdict
+
+import frappe
+from frappe.utils import add_days, add_months, flt, get_datetime, get_first_day, get_last_day, getdate
+
+from right_hire.right_hire.bulk import bulk_upsert
+from right_hire.right_hire.report_cache import invalidate_doctypes
+from right_hire.tasks.chunked import run_chunked, vehicle_chunks
+
+RENTED_AGREEMENT_STATUSES = ("Active", "Due for Return", "Returned", "Closed")
+
+REVENUE_FIELDS = ("rental_revenue", "lease_revenue", "lease_to_own_revenue")
+COST_FIELDS = ("maintenance_cost", "workshop_cost", "violation_cost")
+
+
+def get_period_amounts(start_date, end_date, vehicles=None):
+    """{vehicle: {field: amount}} for every revenue and cost source in the period.
+
+    vehicles: restrict to these vehicle names (default the whole fleet)
+    """
+    values = {
+        "start_date": start_date,
+        "end_date": end_date,
+        "start": get_datetime(start_date),
+        # Exclusive upper bound keeps datetime range predicates sargable
+        "end": add_days(get_datetime(end_date), 1),
+        "agreement_statuses": RENTED_AGREEMENT_STATUSES,
+        "vehicles": tuple(vehicles or ()),
+    }
+    amounts = defaultdict(lambda: dict.fromkeys(REVENUE_FIELDS + COST_FIELDS, 0))
+
+    queries = {
+        "rental_revenue": ("vehicle", """
+            SELECT vehicle, SUM(grand_total) AS amount
+            FROM `tabRental Agreement`
+            WHERE start_datetime >= %(start)s AND start_datetime < %(end)s
+            AND docstatus = 1 AND agreement_status IN %(agreement_statuses)s
+            {vehicle_filter}
+            GROUP BY vehicle
+        """),
+        "lease_revenue": ("lc.vehicle", """
+            SELECT lc.vehicle, SUM(i.grand_total) AS amount
+            FROM `tabInvoice` i
+            INNER JOIN `tabLease Contract` lc ON lc.name = i.reference_name
+            WHERE i.reference_type = 'Lease Contract'
+            AND i.docstatus = 1 AND i.status != 'Cancelled'
+            AND i.posting_date BETWEEN %(start_date)s AND %(end_date)s
+            {vehicle_filter}
+            GROUP BY lc.vehicle
+        """),
+        "lease_to_own_revenue": ("lto.vehicle", """
+            SELECT lto.vehicle, SUM(i.grand_total) AS amount
+            FROM `tabInvoice` i
+            INNER JOIN `tabLease to Own` lto ON lto.name = i.reference_name
+            WHERE i.reference_type = 'Lease to Own'
+            AND i.docstatus = 1 AND i.status != 'Cancelled'
+            AND i.posting_date BETWEEN %(start_date)s AND %(end_date)s
+            {vehicle_filter}
+            GROUP BY lto.vehicle
+        """),
+        "maintenance_cost": ("vehicle", """
+            SELECT vehicle, SUM(actual_cost) AS amount
+            FROM `tabMaintenance Job`
+            WHERE job_date BETWEEN %(start_date)s AND %(end_date)s
+            AND job_status = 'Completed'
+            {vehicle_filter}
+            GROUP BY vehicle
+        """),
+        "workshop_cost": ("vehicle", """
+            SELECT vehicle, SUM(total_workshop_cost) AS amount
+            FROM `tabWorkshop`
+            WHERE actual_completion >= %(start)s AND actual_completion < %(end)s
+            AND status = 'Completed'
+            {vehicle_filter}
+            GROUP BY vehicle
+        """),
+        "violation_cost": ("vehicle", """
+            SELECT vehicle, SUM(amount) AS amount
+            FROM `tabViolation`
+            WHERE IFNULL(payment_date, offense_date) BETWEEN %(start_date)s AND %(end_date)s
+            AND paid_by_company = 1 AND recovered_from_customer = 0
+            AND violation_status != 'Recovered'
+            {vehicle_filter}
+            GROUP BY vehicle
+        """),
+    }
+
+    for field, (vehicle_column, query) in queries.items():
+        vehicle_filter = f"AND {vehicle_column} IN %(vehicles)s" if vehicles else ""
+        for row in frappe.db.sql(query.format(vehicle_filter=vehicle_filter), values, as_dict=True):
+            if row.vehicle:
+                amounts[row.vehicle][field] = flt(row.amount)
+
+    return amounts
+
+
+def calculate_period(month=None, update_totals=True, vehicles=None):
+    """Write the ledger for the calendar month containing `month` and refresh Vehicle totals.
+
+    vehicles: only write rows for these vehicle names (default the whole fleet)
+    Returns the bulk upsert counts.
+    """
+    start_date = get_first_day(month or getdate())
+    end_date = get_last_day(start_date)
+    period = start_date.strftime("%Y-%m")
+
+    filters = {"status": ["!=", "Deactivated"]}
+    if vehicles is not None:
+        filters["name"] = ["in", vehicles or [""]]
+    fleet = frappe.get_all("Vehicle", filters=filters, fields=["name", "branch"])
+    if not fleet:
+        return {"inserted": 0, "updated": 0}
+    amounts = get_period_amounts(start_date, end_date, [v.name for v in fleet] if vehicles is not None else None)
+
+    rows = []
+    for vehicle in fleet:
+        row = amounts.get(vehicle.name) or dict.fromkeys(REVENUE_FIELDS + COST_FIELDS, 0)
+        total_revenue = sum(row[f] for f in REVENUE_FIELDS)
+        total_cost = sum(row[f] for f in COST_FIELDS)
+        rows.append({
+            "name": f"{vehicle.name}-{period}",
+            "vehicle": vehicle.name,
+            "branch": vehicle.branch,
+            "period": period,
+            "period_start": start_date,
+            "period_end": end_date,
+            **row,
+            "total_revenue": total_revenue,
+            "total_cost": total_cost,
+            "net_profit": total_revenue - total_cost,
+        })
+
+    result = bulk_upsert("Vehicle Profitability", rows)
+    if update_totals:
+        update_vehicle_totals()
+    return result
+
+
+def calculate_period_chunk(vehicles, month):
+    """Chunk job: write one month's ledger rows for a list of vehicle names."""
+    return calculate_period(month, update_totals=False, vehicles=vehicles)
+
+
+def calculate_profitability_chunked(month=None, restart=False):
+    """Write one month's ledger as resumable vehicle chunks on the long queue.
+
+    Vehicle totals are refreshed once, after the last chunk finishes.
+    """
+    month = get_first_day(month or getdate())
+    vehicles = frappe.get_all("Vehicle", filters={"status": ["!=", "Deactivated"]}, pluck="name")
+
+    result = run_chunked(
+        "profitability",
+        "right_hire.right_hire.profitability.calculate_period_chunk",
+        vehicle_chunks(vehicles, month=month),
+        run_id=month.strftime("%Y-%m"),
+        on_complete="right_hire.right_hire.profitability.update_vehicle_totals",
+        restart=restart,
+    )
+    return {"rows": len(vehicles), **result}
+
+
+def backfill_profitability(from_month, to_month=None):
+    """Rebuild the ledger month by month for a range (inclusive)."""
+    month = get_first_day(from_month)
+    last = get_first_day(to_month or getdate())
+    results = {}
+    while month <= last:
+        results[month.strftime("%Y-%m")] = calculate_period(month, update_totals=False)
+        month = add_months(month, 1)
+
+    update_vehicle_totals()
+    return results
+
+
+def update_vehicle_totals():
+    """Lifetime Vehicle totals from the ledger in one UPDATE, without saving documents."""
+    frappe.db.sql(
+        """
+        UPDATE `tabVehicle` v
+        INNER JOIN (
+            SELECT vehicle,
+                SUM(total_revenue) AS total_revenue,
+                SUM(maintenance_cost + workshop_cost) AS maintenance_cost,
+                SUM(net_profit) AS net_profit
+            FROM `tabVehicle Profitability`
+            GROUP BY vehicle
+        ) p ON p.vehicle = v.name
+        SET v.total_revenue = p.total_revenue,
+            v.total_maintenance_cost = p.maintenance_cost,
+            v.net_profit = p.net_profit
+        """
+    )
+    invalidate_doctypes(["Vehicle"])
@@ -0,0 +1,30 @@
+// Copyright (c) 2025, Right Hire and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["Expiry Alerts"] = {
+	"filters": [
+		{
+			"fieldname": "expiry_type",
+			"label": __("Expiry Type"),
+			"fieldtype": "Select",
+			"options": [
+				"",
+				"Vehicle Registration",
+				"Vehicle Insurance",
+				"Service Due",
+				"Vehicle Document",
+				"Insurance Policy",
+				"Driver License",
+				"Customer License",
+				"Customer ID",
+				"Customer Passport"
+			]
+		},
+		{
+			"fieldname": "to_date",
+			"label": __("Expiring On or Before"),
+			"fieldtype": "Date"
+		}
+	],
+	"onload": right_hire.report_cache.setup
+};
@@ -3,9 +3,12 @@
 
 import frappe
 from frappe import _
-from frappe.utils import getdate, today, date_diff
 
+from right_hire.right_hire.expiry import EXPIRY_SOURCES, get_urgency, iter_expiries
+from right_hire.right_hire.report_cache import cached_report
 
+
+@cached_report("Expiry Alerts")
 def execute(filters=None):
     columns = get_columns()
     data = get_data(filters)
@@ -58,6 +61,26 @@ def get_columns():
             "fieldtype": "Data",
             "width": 100
         },
+        {
+            "fieldname": "holder",
+            "label": _("Holder / Document"),
+            "fieldtype": "Data",
+            "width": 150
+        },
+        {
+            "fieldname": "reference_doctype",
+            "label": _("Reference Type"),
+            "fieldtype": "Link",
+            "options": "DocType",
+            "width": 120
+        },
+        {
+            "fieldname": "reference_name",
+            "label": _("Reference"),
+            "fieldtype": "Dynamic Link",
+            "options": "reference_doctype",
+            "width": 140
+        },
         {
             "fieldname": "status",
             "label": _("Status"),
@@ -68,85 +91,13 @@ def get_columns():
 
 
 def get_data(filters):
-    data = []
-
-    # Get all vehicles
-    vehicles = frappe.db.sql("""
-        SELECT
-            name as vehicle,
-            vehicle_id,
-            CONCAT(IFNULL(make, ''), ' ', IFNULL(model, '')) as make_model,
-            registration_expiry,
-            insurance_expiry,
-            next_service_due,
-            status
-        FROM
-            `tabVehicle`
-        WHERE
-            docstatus < 2
-    """, as_dict=1)
-
-    for vehicle in vehicles:
-        # Check registration expiry
-        if vehicle.registration_expiry:
-            days = date_diff(vehicle.registration_expiry, today())
-            if days <= 90:  # Show if expiring within 90 days or overdue
-                data.append({
-                    "vehicle": vehicle.vehicle,
-                    "vehicle_id": vehicle.vehicle_id,
-                    "make_model": vehicle.make_model,
-                    "expiry_type": "Registration",
-                    "expiry_date": vehicle.registration_expiry,
-                    "days_remaining": days,
-                    "urgency": get_urgency(days),
-                    "status": vehicle.status
-                })
-
-        # Check insurance expiry
-        if vehicle.insurance_expiry:
-            days = date_diff(vehicle.insurance_expiry, today())
-            if days <= 90:  # Show if expiring within 90 days or overdue
-                data.append({
-                    "vehicle": vehicle.vehicle,
-                    "vehicle_id": vehicle.vehicle_id,
-                    "make_model": vehicle.make_model,
-                    "expiry_type": "Insurance",
-                    "expiry_date": vehicle.insurance_expiry,
-                    "days_remaining": days,
-                    "urgency": get_urgency(days),
-                    "status": vehicle.status
-                })
+    filters = filters or {}
+    expiry_types = [filters.get("expiry_type")] if filters.get("expiry_type") else list(EXPIRY_SOURCES)
 
-        # Check service due
-        if vehicle.next_service_due:
-            days = date_diff(vehicle.next_service_due, today())
-            if days <= 30:  # Show if service due within 30 days or overdue
-                data.append({
-                    "vehicle": vehicle.vehicle,
-                    "vehicle_id": vehicle.vehicle_id,
-                    "make_model": vehicle.make_model,
-                    "expiry_type": "Service Due",
-                    "expiry_date": vehicle.next_service_due,
-                    "days_remaining": days,
-                    "urgency": get_urgency(days),
-                    "status": vehicle.status
-                })
-
-    # Sort by urgency (overdue first, then by days remaining)
-    data.sort(key=lambda x: (x["urgency"] != "Overdue", x["days_remaining"]))
+    # Overdue items come first naturally: rows are ordered by expiry date
+    data = []
+    for row in iter_expiries(expiry_types, to_date=filters.get("to_date")):
+        row["urgency"] = get_urgency(row.days_remaining)
+        data.append(row)
 
     return data
-
-
-def get_urgency(days_remaining):
-    """Calculate urgency level based on days remaining"""
-    if days_remaining < 0:
-        return "Overdue"
-    elif days_remaining <= 7:
-        return "Critical"
-    elif days_remaining <= 14:
-        return "High"
-    elif days_remaining <= 30:
-        return "Medium"
-    else:
-        return "Low"
@@ -0,0 +1,30 @@
+// Copyright (c) 2025, Right Hire and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["Fleet Profitability"] = {
+	"filters": [
+		{
+			"fieldname": "branch",
+			"label": __("Branch"),
+			"fieldtype": "Link",
+			"options": "Branch"
+		},
+		{
+			"fieldname": "status",
+			"label": __("Status"),
+			"fieldtype": "Select",
+			"options": "\nAvailable\nReserved\nOut for Delivery\nRented Out\nDue for Return\nCustody\nAt Garage\nUnder Maintenance\nAccident/Repair\nDeactivated"
+		},
+		{
+			"fieldname": "from_date",
+			"label": __("From Month"),
+			"fieldtype": "Date"
+		},
+		{
+			"fieldname": "to_date",
+			"label": __("To Month"),
+			"fieldtype": "Date"
+		}
+	],
+	"onload": right_hire.report_cache.setup
+};
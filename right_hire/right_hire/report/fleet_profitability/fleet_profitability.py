@@ -3,8 +3,12 @@
 
 import frappe
 from frappe import _
+from frappe.utils import get_first_day
 
+from right_hire.right_hire.report_cache import cached_report
 
+
+@cached_report("Fleet Profitability")
 def execute(filters=None):
     columns = get_columns()
     data = get_data(filters)
@@ -80,14 +84,25 @@ def get_columns():
 
 
 def get_data(filters):
+    filters = frappe._dict(filters or {})
     conditions = ""
+    ledger_conditions = ""
 
-    if filters and filters.get("branch"):
+    if filters.get("branch"):
         conditions += " AND v.branch = %(branch)s"
 
-    if filters and filters.get("status"):
+    if filters.get("status"):
         conditions += " AND v.status = %(status)s"
 
+    # Without a period the ledger's lifetime totals are shown
+    if filters.get("from_date"):
+        ledger_conditions += " AND period_start >= %(from_period)s"
+        filters.from_period = get_first_day(filters.from_date)
+
+    if filters.get("to_date"):
+        ledger_conditions += " AND period_start <= %(to_period)s"
+        filters.to_period = get_first_day(filters.to_date)
+
     query = f"""
         SELECT
             v.name as vehicle,
@@ -95,17 +110,26 @@ def get_data(filters):
             CONCAT(IFNULL(v.make, ''), ' ', IFNULL(v.model, '')) as make_model,
             IFNULL(v.purchase_cost, 0) as purchase_cost,
             IFNULL(v.current_book_value, 0) as current_value,
-            IFNULL(v.total_revenue, 0) as total_revenue,
-            IFNULL(v.total_maintenance_cost, 0) as maintenance_cost,
-            IFNULL(v.net_profit, 0) as net_profit,
+            IFNULL(p.total_revenue, 0) as total_revenue,
+            IFNULL(p.maintenance_cost, 0) as maintenance_cost,
+            IFNULL(p.net_profit, 0) as net_profit,
             CASE
                 WHEN IFNULL(v.purchase_cost, 0) > 0
-                THEN (IFNULL(v.net_profit, 0) / v.purchase_cost) * 100
+                THEN (IFNULL(p.net_profit, 0) / v.purchase_cost) * 100
                 ELSE 0
             END as roi,
             v.status
         FROM
             `tabVehicle` v
+        LEFT JOIN (
+            SELECT vehicle,
+                SUM(total_revenue) as total_revenue,
+                SUM(maintenance_cost + workshop_cost) as maintenance_cost,
+                SUM(net_profit) as net_profit
+            FROM `tabVehicle Profitability`
+            WHERE 1 = 1 {ledger_conditions}
+            GROUP BY vehicle
+        ) p ON p.vehicle = v.name
         WHERE
             v.docstatus < 2
             {conditions}
@@ -4,10 +4,14 @@
 import frappe
 from frappe import _
 
+from right_hire.right_hire.report_cache import cached_report
+from right_hire.right_hire.status_counts import get_status_counts
+
+@cached_report("Fleet Status")
 def execute(filters=None):
     columns = get_columns()
     data = get_data(filters)
-    chart = get_chart_data(data)
+    chart = get_chart_data(filters)
     return columns, data, None, chart
 
 def get_columns():
@@ -117,12 +121,13 @@ def get_data(filters):
     
     return data
 
-def get_chart_data(data):
-    # Count vehicles by status
-    status_count = {}
-    for row in data:
-        status = row.status
-        status_count[status] = status_count.get(status, 0) + 1
+def get_chart_data(filters):
+    # Vehicles by status from the status counters, not from the rows above
+    status_count = {
+        status: count
+        for status, count in sorted(get_status_counts("Vehicle", filters.get("branch")).items())
+        if status != "Deactivated" and (not filters.get("status") or status == filters.get("status"))
+    }
     
     chart = {
         "data": {
@@ -0,0 +1,39 @@
+// Copyright (c) 2025, Right Hire and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["Job Run History"] = {
+	"filters": [
+		{
+			"fieldname": "from_date",
+			"label": __("From Date"),
+			"fieldtype": "Date",
+			"default": frappe.datetime.add_days(frappe.datetime.get_today(), -30),
+			"reqd": 1
+		},
+		{
+			"fieldname": "to_date",
+			"label": __("To Date"),
+			"fieldtype": "Date",
+			"default": frappe.datetime.get_today(),
+			"reqd": 1
+		},
+		{
+			"fieldname": "job_name",
+			"label": __("Job"),
+			"fieldtype": "Data"
+		},
+		{
+			"fieldname": "regression_pct",
+			"label": __("Flag Slowdown Above %"),
+			"fieldtype": "Float",
+			"default": 50
+		}
+	],
+	"formatter": function(value, row, column, data, default_formatter) {
+		value = default_formatter(value, row, column, data);
+		if (column.fieldname == "trend" && data && data.trend == "Regression") {
+			value = `<span style="color: var(--red-500); font-weight: bold">${value}</span>`;
+		}
+		return value;
+	}
+};
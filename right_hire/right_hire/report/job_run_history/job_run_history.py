@@ -0,0 +1,159 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.utils import add_days, flt, getdate
+
+# Days of earlier history a day's average duration is compared against
+BASELINE_DAYS = 7
+FREQUENCY_SECONDS = {
+    "all": 4 * 60,
+    "hourly": 3600,
+    "hourly_long": 3600,
+    "daily": 86400,
+    "daily_long": 86400,
+    "weekly": 7 * 86400,
+    "weekly_long": 7 * 86400,
+    "monthly": 28 * 86400,
+    "monthly_long": 28 * 86400,
+}
+CHART_JOBS = 5
+
+
+def execute(filters=None):
+    filters = frappe._dict(filters or {})
+    columns = get_columns()
+    data = get_data(filters)
+    chart = get_chart(data)
+
+    return columns, data, None, chart
+
+
+def get_columns():
+    return [
+        {"fieldname": "job_name", "label": _("Job"), "fieldtype": "Data", "width": 300},
+        {"fieldname": "run_date", "label": _("Date"), "fieldtype": "Date", "width": 100},
+        {"fieldname": "runs", "label": _("Runs"), "fieldtype": "Int", "width": 70},
+        {"fieldname": "failures", "label": _("Failures"), "fieldtype": "Int", "width": 80},
+        {"fieldname": "avg_duration", "label": _("Avg Duration (s)"), "fieldtype": "Float", "width": 120},
+        {"fieldname": "max_duration", "label": _("Max Duration (s)"), "fieldtype": "Float", "width": 120},
+        {"fieldname": "baseline_duration", "label": _("Baseline (s)"), "fieldtype": "Float", "width": 110},
+        {"fieldname": "change_pct", "label": _("Change %"), "fieldtype": "Percent", "width": 90},
+        {"fieldname": "interval_pct", "label": _("% of Interval"), "fieldtype": "Percent", "width": 100},
+        {"fieldname": "trend", "label": _("Trend"), "fieldtype": "Data", "width": 100},
+        {"fieldname": "avg_rows", "label": _("Avg Rows"), "fieldtype": "Float", "width": 100},
+        {"fieldname": "errors", "label": _("Logged Errors"), "fieldtype": "Int", "width": 100},
+        {"fieldname": "avg_queries", "label": _("Avg Queries"), "fieldtype": "Float", "width": 100},
+        {"fieldname": "avg_query_time", "label": _("Avg DB Time (s)"), "fieldtype": "Float", "width": 120},
+    ]
+
+
+def get_data(filters):
+    from_date = getdate(filters.get("from_date") or add_days(getdate(), -30))
+    to_date = getdate(filters.get("to_date") or getdate())
+    regression_pct = flt(filters.get("regression_pct") or 50)
+
+    values = {
+        # The baseline needs history from before the first reported day
+        "from": add_days(from_date, -BASELINE_DAYS),
+        "to": add_days(to_date, 1),
+    }
+    conditions = ""
+    if filters.get("job_name"):
+        conditions += " AND job_name LIKE %(job_name)s"
+        values["job_name"] = f"%{filters.job_name}%"
+
+    rows = frappe.db.sql(
+        f"""
+        SELECT job_name, DATE(started_at) AS run_date,
+            COUNT(*) AS runs,
+            SUM(status = 'Failed') AS failures,
+            AVG(duration) AS avg_duration,
+            MAX(duration) AS max_duration,
+            AVG(rows_processed) AS avg_rows,
+            SUM(errors) AS errors,
+            AVG(query_count) AS avg_queries,
+            AVG(query_time) AS avg_query_time
+        FROM `tabRight Hire Job Run`
+        WHERE started_at >= %(from)s AND started_at < %(to)s
+            {conditions}
+        GROUP BY job_name, DATE(started_at)
+        ORDER BY job_name, run_date
+        """,
+        values,
+        as_dict=True,
+    )
+
+    intervals = get_job_intervals()
+    history = {}
+    data = []
+    for row in rows:
+        row.run_date = getdate(row.run_date)
+        earlier = [
+            d for d in history.setdefault(row.job_name, [])
+            if d.run_date >= add_days(row.run_date, -BASELINE_DAYS)
+        ]
+        history[row.job_name].append(row)
+
+        row.baseline_duration = (
+            sum(flt(d.avg_duration) for d in earlier) / len(earlier) if earlier else None
+        )
+        row.change_pct = (
+            (flt(row.avg_duration) - row.baseline_duration) / row.baseline_duration * 100
+            if row.baseline_duration else None
+        )
+        interval = intervals.get(row.job_name)
+        row.interval_pct = flt(row.max_duration) / interval * 100 if interval else None
+
+        if row.failures:
+            row.trend = "Failing"
+        elif row.change_pct is not None and row.change_pct > regression_pct:
+            row.trend = "Regression"
+        elif row.interval_pct and row.interval_pct > 50:
+            row.trend = "Near Overlap"
+        else:
+            row.trend = "OK"
+
+        if row.run_date >= from_date:
+            data.append(row)
+
+    return data
+
+
+def get_job_intervals():
+    """Scheduled interval in seconds for every job listed in scheduler_events"""
+    intervals = {}
+    for frequency, methods in frappe.get_hooks("scheduler_events", {}).items():
+        if frequency in FREQUENCY_SECONDS:
+            for method in methods:
+                intervals[method] = FREQUENCY_SECONDS[frequency]
+    return intervals
+
+
+def get_chart(data):
+    if not data:
+        return None
+
+    # Average duration per day for the slowest jobs
+    slowest = {}
+    for row in data:
+        slowest[row.job_name] = max(slowest.get(row.job_name, 0), flt(row.max_duration))
+    jobs = sorted(slowest, key=slowest.get, reverse=True)[:CHART_JOBS]
+
+    labels = sorted({row.run_date for row in data})
+    durations = {(row.job_name, row.run_date): flt(row.avg_duration, 3) for row in data}
+
+    return {
+        "data": {
+            "labels": [str(d) for d in labels],
+            "datasets": [
+                {
+                    "name": job.rsplit(".", 1)[-1],
+                    "values": [durations.get((job, d), 0) for d in labels]
+                }
+                for job in jobs
+            ]
+        },
+        "type": "line"
+    }
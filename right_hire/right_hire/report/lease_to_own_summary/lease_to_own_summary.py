@@ -4,7 +4,10 @@
 import frappe
 from frappe import _
 
+from right_hire.right_hire.report_cache import cached_report
 
+
+@cached_report("Lease to Own Summary")
 def execute(filters=None):
     columns = get_columns()
     data = get_data(filters)
@@ -0,0 +1,6 @@
+// Copyright (c) 2025, Right Hire and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["Revenue Analysis"] = {
+	"onload": right_hire.report_cache.setup
+};
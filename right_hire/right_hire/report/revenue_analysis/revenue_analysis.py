@@ -3,7 +3,20 @@
 
 import frappe
 from frappe import _
+from frappe.utils import flt, getdate
 
+from right_hire.right_hire.report_cache import cached_report
+from right_hire.right_hire.revenue import aggregate_agreements, is_revenue_cube_enabled
+
+# group_by -> period expression over agreements (start_datetime) and over the cube (revenue_date)
+PERIOD_EXPRESSIONS = {
+    "Month": ("DATE_FORMAT(ra.start_datetime, '%%Y-%%m')", "DATE_FORMAT(revenue_date, '%%Y-%%m')"),
+    "Week": ("DATE_FORMAT(ra.start_datetime, '%%Y-W%%u')", "DATE_FORMAT(revenue_date, '%%Y-W%%u')"),
+    "Day": ("DATE(ra.start_datetime)", "revenue_date"),
+    "Branch": ("ra.branch", "branch"),
+}
+
+@cached_report("Revenue Analysis")
 def execute(filters=None):
     columns = get_columns(filters)
     data = get_data(filters)
@@ -68,58 +81,60 @@ def get_columns(filters):
     return columns
 
 def get_data(filters):
+    group_by = filters.get("group_by", "Month")
+    if group_by not in PERIOD_EXPRESSIONS:
+        group_by = "Month"
+
+    if is_revenue_cube_enabled():
+        data = get_cube_data(filters, group_by)
+    else:
+        agreement_expression = PERIOD_EXPRESSIONS[group_by][0]
+        columns = {"period": agreement_expression}
+        if group_by == "Branch":
+            columns["branch"] = "ra.branch"
+        data = aggregate_agreements(
+            columns, filters.get("from_date"), filters.get("to_date"), filters.get("branch")
+        )
+
+    for row in data:
+        row.avg_agreement_value = flt(row.total_revenue) / row.total_agreements if row.total_agreements else 0
+
+    return data
+
+def get_cube_data(filters, group_by):
+    """Same figures grouped from Daily Revenue rows"""
     conditions = []
-    values = []
-    
+    values = {}
+
     if filters.get("from_date"):
-        conditions.append("DATE(start_datetime) >= %s")
-        values.append(filters.get("from_date"))
-    
+        conditions.append("revenue_date >= %(from_date)s")
+        values["from_date"] = getdate(filters.get("from_date"))
+
     if filters.get("to_date"):
-        conditions.append("DATE(start_datetime) <= %s")
-        values.append(filters.get("to_date"))
-    
+        conditions.append("revenue_date <= %(to_date)s")
+        values["to_date"] = getdate(filters.get("to_date"))
+
     if filters.get("branch"):
-        conditions.append("branch = %s")
-        values.append(filters.get("branch"))
-    
+        conditions.append("branch = %(branch)s")
+        values["branch"] = filters.get("branch")
+
     where_clause = " AND ".join(conditions) if conditions else "1=1"
-    
-    group_by = filters.get("group_by", "Month")
-    
-    if group_by == "Month":
-        date_format = "DATE_FORMAT(start_datetime, '%%Y-%%m')"
-    elif group_by == "Week":
-        date_format = "DATE_FORMAT(start_datetime, '%%Y-W%%u')"
-    elif group_by == "Day":
-        date_format = "DATE(start_datetime)"
-    elif group_by == "Branch":
-        date_format = "branch"
-    else:
-        date_format = "DATE_FORMAT(start_datetime, '%%Y-%%m')"
-    
-    data = frappe.db.sql(f"""
-        SELECT 
-            {date_format} as period,
-            {f"branch," if group_by == "Branch" else ""}
-            COUNT(name) as total_agreements,
-            SUM(grand_total) as total_revenue,
-            SUM(rental_amount) as rental_revenue,
-            SUM(
-                (SELECT SUM(amount) FROM `tabAgreement Charge` 
-                 WHERE parent = `tabRental Agreement`.name 
-                 AND charge_type IN ('Extra', 'CDW', 'PAI'))
-            ) as extras_revenue,
-            SUM(overage_amount) as overage_revenue,
-            AVG(grand_total) as avg_agreement_value
-        FROM `tabRental Agreement`
+    period = PERIOD_EXPRESSIONS[group_by][1]
+
+    return frappe.db.sql(f"""
+        SELECT
+            {period} as period,
+            {"branch," if group_by == "Branch" else ""}
+            SUM(agreements) as total_agreements,
+            SUM(total_revenue) as total_revenue,
+            SUM(rental_revenue) as rental_revenue,
+            SUM(extras_revenue) as extras_revenue,
+            SUM(overage_revenue) as overage_revenue
+        FROM `tabDaily Revenue`
         WHERE {where_clause}
-        AND agreement_status NOT IN ('Cancelled', 'Draft')
-        GROUP BY {date_format} {", branch" if group_by == "Branch" else ""}
+        GROUP BY {period}
         ORDER BY period
-    """, tuple(values), as_dict=1)
-    
-    return data
+    """, values, as_dict=1)
 
 def get_chart_data(data, filters):
     labels = [d.period for d in data]
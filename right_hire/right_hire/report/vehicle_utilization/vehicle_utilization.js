@@ -4,5 +4,6 @@
 frappe.query_reports["Vehicle Utilization"] = {
 	"filters": [
 
-	]
+	],
+	"onload": right_hire.report_cache.setup
 };
@@ -5,6 +5,9 @@ import frappe
 from frappe import _
 from frappe.utils import getdate, flt
 
+from right_hire.right_hire.report_cache import cached_report
+
+@cached_report("Vehicle Utilization")
 def execute(filters=None):
     columns = get_columns()
     data = get_data(filters)
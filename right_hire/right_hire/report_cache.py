@@ -0,0 +1,151 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+"""Result cache for Right Hire query reports.
+
+`@cached_report(name)` on a report's `execute` stores its result in Redis,
+keyed by report name, language and the normalised filters, for
+`right_hire_report_cache_ttl` seconds (site config, default 15 minutes).
+
+Each report lists the doctypes it reads in REPORT_SOURCES. Any change to one
+of them (the `on_change` / `on_trash` doc events, or a bulk write through
+`bulk_upsert`) bumps the generation of the reports reading it, so their
+cached results are never served again and simply expire.
+
+The report message shows when the result was computed and the report's
+cache hit / miss counts; the "Refresh" button added by
+`right_hire.report_cache.setup` (public/js/report_cache.js) drops the
+report's cache before re-running it.
+"""
+
+import functools
+import hashlib
+import json
+
+import frappe
+from frappe import _
+from frappe.utils import cint, format_datetime, now
+
+REPORT_CACHE_KEY = "right_hire_report_cache"
+GENERATION_KEY = "right_hire_report_generation"
+STATS_KEY = "right_hire_report_cache_stats"
+DEFAULT_TTL = 15 * 60
+
+# Report -> doctypes it reads; a change to any of them invalidates the report
+REPORT_SOURCES = {
+    "Fleet Status": ("Vehicle",),
+    "Vehicle Utilization": ("Utilization Snapshot", "Vehicle"),
+    "Revenue Analysis": ("Rental Agreement", "Daily Revenue"),
+    "Fleet Profitability": ("Vehicle", "Vehicle Profitability"),
+    "Lease to Own Summary": ("Lease to Own",),
+    "Expiry Alerts": ("Vehicle", "Insurance Policy", "Driver", "Customer"),
+}
+
+DOCTYPE_REPORTS = {
+    doctype: [report for report, sources in REPORT_SOURCES.items() if doctype in sources]
+    for sources in REPORT_SOURCES.values()
+    for doctype in sources
+}
+
+
+def cached_report(report_name):
+    """Decorator for a report's execute(filters=None) serving results from the cache."""
+    def decorator(execute):
+        @functools.wraps(execute)
+        def wrapper(filters=None):
+            key = get_cache_key(report_name, filters)
+            cached = frappe.cache().get_value(key)
+            if cached:
+                count(report_name, "hits")
+                return with_message(cached["result"], report_name, cached["as_of"], cached=True)
+
+            count(report_name, "misses")
+            result = execute(filters)
+            as_of = now()
+            frappe.cache().set_value(key, {"result": result, "as_of": as_of}, expires_in_sec=get_ttl())
+            return with_message(result, report_name, as_of, cached=False)
+
+        return wrapper
+
+    return decorator
+
+
+def get_ttl():
+    return cint(frappe.conf.get("right_hire_report_cache_ttl")) or DEFAULT_TTL
+
+
+def normalize_filters(filters):
+    """Filters with empty values dropped and values stringified, in key order."""
+    if isinstance(filters, str):
+        filters = json.loads(filters)
+    return {
+        key: value if isinstance(value, (list, tuple)) else str(value)
+        for key, value in sorted((filters or {}).items())
+        if value not in (None, "", [], ())
+    }
+
+
+def get_cache_key(report_name, filters):
+    generation = frappe.cache().hget(GENERATION_KEY, report_name) or 0
+    digest = hashlib.md5(
+        json.dumps(normalize_filters(filters), sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return f"{REPORT_CACHE_KEY}:{report_name}:{generation}:{frappe.local.lang}:{digest}"
+
+
+def with_message(result, report_name, as_of, cached):
+    """The report result with an "as of" line (plus any message of its own) in the message slot."""
+    result = list(result)
+    while len(result) < 3:
+        result.append(None)
+
+    stats = get_report_cache_stats(report_name)
+    note = _("As of {0} ({1}). Cache: {2} hits, {3} misses.").format(
+        format_datetime(as_of), _("cached") if cached else _("just computed"), stats["hits"], stats["misses"]
+    )
+    note = f"<p class='text-muted small'>{note}</p>"
+    result[2] = f"{result[2]}{note}" if result[2] else note
+    return result
+
+
+def count(report_name, outcome):
+    # Raw commands: the cache wrapper's hash helpers pickle values, counters must stay integers
+    frappe.cache().execute_command("HINCRBY", frappe.cache().make_key(STATS_KEY), f"{report_name}|{outcome}", 1)
+
+
+@frappe.whitelist()
+def get_report_cache_stats(report_name=None):
+    """Hit / miss counts per report, or for one report."""
+    stats = {}
+    for field, value in frappe.cache().execute_command("HGETALL", frappe.cache().make_key(STATS_KEY)).items():
+        report, outcome = frappe.safe_decode(field).rsplit("|", 1)
+        stats.setdefault(report, {"hits": 0, "misses": 0})[outcome] = cint(value)
+
+    if report_name:
+        return stats.get(report_name, {"hits": 0, "misses": 0})
+    return stats
+
+
+def invalidate_reports(report_names):
+    """Stop serving the cached results of these reports."""
+    for report_name in report_names:
+        frappe.cache().hset(GENERATION_KEY, report_name, frappe.generate_hash(length=8))
+
+
+def invalidate_doctypes(doctypes):
+    """Invalidate every report reading any of these doctypes."""
+    invalidate_reports({report for doctype in doctypes for report in DOCTYPE_REPORTS.get(doctype, ())})
+
+
+def invalidate_for_doc(doc, method=None):
+    """Doc event hook (on_change / on_trash) for all doctypes."""
+    if doc.doctype in DOCTYPE_REPORTS:
+        invalidate_reports(DOCTYPE_REPORTS[doc.doctype])
+
+
+@frappe.whitelist()
+def clear_report_cache(report_name):
+    """Force refresh: drop the cached results of a report the user can open."""
+    if not frappe.get_doc("Report", report_name).is_permitted():
+        frappe.throw(_("Not permitted"), frappe.PermissionError)
+    invalidate_reports([report_name])
@@ -0,0 +1,149 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+"""Rental revenue aggregation and the daily revenue cube.
+
+`aggregate_agreements` sums agreement revenue by any grouping with a
+half-open range on start_datetime (served by the (start_datetime, branch)
+index) and a pre-aggregated join for extras charges, instead of a
+correlated subquery per agreement.
+
+The cube (`Daily Revenue`, one row per branch per start day) holds the same
+sums. It is enabled with `right_hire_revenue_cube` in site config; agreement
+submit, update after submit and cancel then refresh the affected branch-day,
+and Revenue Analysis groups a few hundred cube rows instead of scanning
+agreements. Build it once for existing data with:
+
+    bench --site <site> execute right_hire.right_hire.revenue.rebuild_revenue_cube
+"""
+
+import frappe
+from frappe.utils import add_days, flt, get_datetime, getdate
+
+from right_hire.right_hire.bulk import bulk_upsert
+
+EXTRAS_CHARGE_TYPES = ("Extra", "CDW", "PAI")
+REVENUE_FIELDS = ("total_revenue", "rental_revenue", "extras_revenue", "overage_revenue")
+
+
+def is_revenue_cube_enabled():
+    return bool(frappe.conf.get("right_hire_revenue_cube"))
+
+
+def aggregate_agreements(group_by, from_date=None, to_date=None, branch=None):
+    """Agreement count and revenue components grouped by `group_by` (a dict of alias: SQL on `ra`)."""
+    # Submitted only: the cube is refreshed on submit / update after submit / cancel, so a
+    # draft never reaches it and the live path must not count drafts either
+    conditions = ["ra.docstatus = 1", "ra.agreement_status NOT IN ('Cancelled', 'Draft')"]
+    values = {"extras_charge_types": EXTRAS_CHARGE_TYPES}
+
+    # Half-open datetime range: start_datetime stays bare so the index applies
+    if from_date:
+        conditions.append("ra.start_datetime >= %(from_datetime)s")
+        values["from_datetime"] = get_datetime(getdate(from_date))
+    if to_date:
+        conditions.append("ra.start_datetime < %(to_datetime)s")
+        values["to_datetime"] = get_datetime(add_days(getdate(to_date), 1))
+    if branch:
+        conditions.append("ra.branch = %(branch)s")
+        values["branch"] = branch
+
+    where_clause = " AND ".join(conditions)
+    group_columns = ", ".join(f"{expression} AS {alias}" for alias, expression in group_by.items())
+
+    return frappe.db.sql(
+        f"""
+        SELECT {group_columns},
+            COUNT(ra.name) AS total_agreements,
+            SUM(ra.grand_total) AS total_revenue,
+            SUM(ra.rental_amount) AS rental_revenue,
+            SUM(IFNULL(c.extras, 0)) AS extras_revenue,
+            SUM(ra.overage_amount) AS overage_revenue
+        FROM `tabRental Agreement` ra
+        LEFT JOIN (
+            SELECT ac.parent, SUM(ac.amount) AS extras
+            FROM `tabAgreement Charge` ac
+            INNER JOIN `tabRental Agreement` ra ON ra.name = ac.parent
+            WHERE ac.parenttype = 'Rental Agreement'
+              AND ac.charge_type IN %(extras_charge_types)s
+              AND {where_clause}
+            GROUP BY ac.parent
+        ) c ON c.parent = ra.name
+        WHERE {where_clause}
+        GROUP BY {", ".join(group_by)}
+        ORDER BY {", ".join(group_by)}
+        """,
+        values,
+        as_dict=True,
+    )
+
+
+def get_cube_name(revenue_date, branch):
+    return f"{getdate(revenue_date)}-{branch or ''}"
+
+
+def make_cube_rows(rows):
+    return [
+        {
+            "name": get_cube_name(row.revenue_date, row.branch),
+            "revenue_date": row.revenue_date,
+            "branch": row.branch,
+            "agreements": row.total_agreements,
+            **{field: flt(row[field]) for field in REVENUE_FIELDS},
+        }
+        for row in rows
+    ]
+
+
+def rebuild_revenue_cube(from_date=None, to_date=None):
+    """Recompute the cube for a date range (default all time) from agreements."""
+    rows = aggregate_agreements(
+        {"revenue_date": "DATE(ra.start_datetime)", "branch": "ra.branch"}, from_date, to_date
+    )
+
+    # Drop branch-days that no longer have agreements
+    conditions, values = [], {}
+    if from_date:
+        conditions.append("revenue_date >= %(from_date)s")
+        values["from_date"] = getdate(from_date)
+    if to_date:
+        conditions.append("revenue_date <= %(to_date)s")
+        values["to_date"] = getdate(to_date)
+    frappe.db.sql(
+        f"DELETE FROM `tabDaily Revenue` WHERE {' AND '.join(conditions) or '1 = 1'}", values
+    )
+
+    return bulk_upsert("Daily Revenue", make_cube_rows(rows))
+
+
+def refresh_revenue_cube_day(revenue_date, branch):
+    """Recompute one branch-day of the cube."""
+    rows = [
+        row
+        for row in aggregate_agreements(
+            {"revenue_date": "DATE(ra.start_datetime)", "branch": "ra.branch"},
+            revenue_date,
+            revenue_date,
+            branch,
+        )
+        if row.branch == branch
+    ]
+    name = get_cube_name(revenue_date, branch)
+    if rows:
+        bulk_upsert("Daily Revenue", make_cube_rows(rows))
+    else:
+        frappe.db.delete("Daily Revenue", {"name": name})
+
+
+def update_revenue_cube(doc):
+    """Refresh the cube rows an agreement belongs to (and belonged to before this save)."""
+    if not is_revenue_cube_enabled() or not doc.start_datetime:
+        return
+
+    keys = {(getdate(doc.start_datetime), doc.branch or None)}
+    before = doc.get_doc_before_save()
+    if before and before.start_datetime:
+        keys.add((getdate(before.start_datetime), before.branch or None))
+
+    for revenue_date, branch in keys:
+        refresh_revenue_cube_day(revenue_date, branch)
@@ -0,0 +1,194 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+"""Per-branch status counters.
+
+Counts of Vehicles, Rental Agreements, Reservations and Maintenance Jobs per
+(branch, status) are kept in one Redis hash per doctype, so the Fleet Status
+chart, the dashboard chart and the desk notification badges read them
+without a query.
+
+Every status change goes through a document save (Vehicle.update_status
+included), whose `on_change` / `on_trash` events move one unit from the old
+(branch, status) to the new one. The increments are applied after the
+transaction commits, so a rolled-back save never shows up in the counts.
+A `db_set` or bulk UPDATE, whose previous state is unknown, drops the hash
+instead.
+
+If a hash is missing (Redis flushed, first use) it is rebuilt from the
+database with one GROUP BY; if Redis is unreachable the counts come straight
+from the database. `reconcile_status_counts` runs hourly and overwrites any
+drift left by writes that bypass documents (db_set, bulk UPDATEs).
+"""
+
+import frappe
+from frappe.utils import cint
+
+STATUS_COUNTS_KEY = "right_hire_status_counts"
+# Marks a hash as built even when the doctype has no rows
+BUILT_FIELD = "__built__"
+
+# doctype -> (status field, branch field or None)
+STATUS_FIELDS = {
+    "Vehicle": ("status", "branch"),
+    "Rental Agreement": ("agreement_status", "branch"),
+    "Reservation": ("reservation_status", "branch"),
+    "Maintenance Job": ("job_status", None),
+}
+
+# Submittable doctypes whose cancel sets the status in memory only; a cancelled
+# row is counted under this status whatever the column still holds
+CANCELLED_STATUSES = {
+    "Rental Agreement": "Cancelled",
+}
+
+
+def get_counts_key(doctype):
+    return frappe.cache().make_key(f"{STATUS_COUNTS_KEY}:{doctype}")
+
+
+def get_field(branch, status):
+    return f"{branch or ''}|{status or ''}"
+
+
+def count_from_db(doctype):
+    """{(branch, status): count} from one grouped query."""
+    status_field, branch_field = STATUS_FIELDS[doctype]
+    branch_column = f"`{branch_field}`" if branch_field else "NULL"
+    status_column = f"`{status_field}`"
+    values = {}
+    if doctype in CANCELLED_STATUSES:
+        status_column = f"IF(docstatus = 2, %(cancelled)s, {status_column})"
+        values["cancelled"] = CANCELLED_STATUSES[doctype]
+
+    return {
+        (branch or "", status or ""): cint(count)
+        for branch, status, count in frappe.db.sql(
+            f"""
+            SELECT {branch_column}, {status_column} AS status, COUNT(*)
+            FROM `tab{doctype}`
+            GROUP BY {branch_column}, status
+            """,
+            values,
+        )
+    }
+
+
+def store_counts(doctype, counts):
+    """Replace a doctype's hash with `counts` atomically."""
+    key = get_counts_key(doctype)
+    mapping = {get_field(branch, status): count for (branch, status), count in counts.items()}
+    mapping[BUILT_FIELD] = 1
+
+    # Raw commands: the cache wrapper's hash helpers pickle values, counters must stay integers
+    pipeline = frappe.cache().pipeline()
+    pipeline.delete(key)
+    pipeline.hset(key, mapping=mapping)
+    pipeline.execute()
+
+
+def get_all_status_counts(doctype):
+    """{(branch, status): count} for a doctype, from Redis with a database fallback."""
+    try:
+        raw = frappe.cache().execute_command("HGETALL", get_counts_key(doctype))
+        if not raw:
+            counts = count_from_db(doctype)
+            store_counts(doctype, counts)
+            return counts
+    except Exception:
+        frappe.log_error(f"Status counts for {doctype} unavailable from Redis")
+        return count_from_db(doctype)
+
+    counts = {}
+    for field, value in raw.items():
+        field = frappe.safe_decode(field)
+        if field != BUILT_FIELD and cint(value) > 0:
+            branch, status = field.split("|", 1)
+            counts[(branch, status)] = cint(value)
+    return counts
+
+
+def get_status_counts(doctype, branch=None, statuses=None):
+    """{status: count}, for one branch or summed over all of them."""
+    result = {}
+    for (row_branch, status), count in get_all_status_counts(doctype).items():
+        if (branch is None or row_branch == branch) and (statuses is None or status in statuses):
+            result[status] = result.get(status, 0) + count
+    return result
+
+
+def get_branch_status_counts(doctype):
+    """{branch: {status: count}}"""
+    result = {}
+    for (branch, status), count in get_all_status_counts(doctype).items():
+        result.setdefault(branch, {})[status] = count
+    return result
+
+
+def update_status_counts(doc, method=None):
+    """Doc event hook (on_change / on_trash): move the document between counters after commit."""
+    if doc.doctype not in STATUS_FIELDS:
+        return
+
+    status_field, branch_field = STATUS_FIELDS[doc.doctype]
+
+    def get_doc_field(d):
+        status = d.get(status_field)
+        if d.docstatus == 2 and d.doctype in CANCELLED_STATUSES:
+            status = CANCELLED_STATUSES[d.doctype]
+        return get_field(d.get(branch_field) if branch_field else None, status)
+
+    if method == "on_trash":
+        old, new = get_doc_field(doc), None
+    else:
+        # A doc saved earlier in this request was already counted at its last state
+        before = doc.get_doc_before_save()
+        old = doc.flags.status_counts_field or (get_doc_field(before) if before else None)
+        new = doc.flags.status_counts_field = get_doc_field(doc)
+        if not old and not doc.flags.in_insert:
+            # db_set on a loaded doc: the previous state is unknown, rebuild instead
+            refresh_status_counts([doc.doctype])
+            return
+
+    if old == new:
+        return
+
+    key = get_counts_key(doc.doctype)
+
+    def apply():
+        try:
+            # Only adjust a built hash; a missing one is rebuilt from the database on read
+            if not frappe.cache().execute_command("HEXISTS", key, BUILT_FIELD):
+                return
+            pipeline = frappe.cache().pipeline()
+            if old:
+                pipeline.hincrby(key, old, -1)
+            if new:
+                pipeline.hincrby(key, new, 1)
+            pipeline.execute()
+        except Exception:
+            frappe.log_error(f"Failed to update status counts for {doc.doctype} {doc.name}")
+
+    frappe.db.after_commit.add(apply)
+
+
+def refresh_status_counts(doctypes):
+    """After commit, drop the counters of doctypes changed by bulk SQL so the next read rebuilds them."""
+    keys = [get_counts_key(doctype) for doctype in doctypes if doctype in STATUS_FIELDS]
+    if keys:
+        frappe.db.after_commit.add(lambda: frappe.cache().delete(*keys))
+
+
+def reconcile_status_counts():
+    """Overwrite every counter hash from the database; returns the number of corrected counters."""
+    corrected = 0
+    for doctype in STATUS_FIELDS:
+        actual = count_from_db(doctype)
+        cached = get_all_status_counts(doctype)
+        drift = {key for key in set(actual) | set(cached) if actual.get(key, 0) != cached.get(key, 0)}
+        if drift:
+            frappe.logger().info(f"Status counts for {doctype} drifted on {len(drift)} counters")
+        corrected += len(drift)
+        store_counts(doctype, actual)
+
+    return corrected
@@ -0,0 +1,211 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+"""Hour-accurate vehicle utilization.
+
+Every rental agreement, reservation, workshop movement and maintenance job
+touching a vehicle is clipped to each day's boundaries, so a pickup at 18:00
+counts six rented hours rather than a full day. Where blocks overlap, each
+hour is counted once, under the highest-priority state:
+
+    maintenance job > workshop > on hire > reserved > idle
+
+Workshop hours not covered by a maintenance job are reported as
+`other_hours`. Revenue is each agreement's grand total prorated by the share
+of its period falling on the day.
+"""
+
+from collections import defaultdict
+
+import frappe
+from frappe.utils import add_days, cint, date_diff, flt, get_datetime, getdate
+
+from right_hire.right_hire.availability import get_off_rent_blocks
+from right_hire.right_hire.bulk import bulk_upsert
+from right_hire.tasks.chunked import get_chunked_progress, run_chunked, vehicle_chunks
+
+# Block state -> Utilization Snapshot field, in priority order
+STATE_FIELDS = {
+    "M": "maintenance_hours",
+    "W": "other_hours",
+    "H": "rented_hours",
+    "R": "reserved_hours",
+}
+STATE_PRIORITY = {state: rank for rank, state in enumerate(reversed(STATE_FIELDS))}
+
+RENTED_AGREEMENT_STATUSES = ("Active", "Due for Return", "Returned", "Closed")
+RESERVED_STATUSES = ("Confirmed", "Allocated")
+
+BACKFILL_VEHICLES_PER_CHUNK = 200
+BACKFILL_DAYS_PER_CHUNK = 31
+
+
+def get_usage_blocks(vehicles, range_start, range_end):
+    """Every block touching the range for `vehicles`, tagged with a state.
+
+    Agreements carry `amount` (grand total) for revenue proration; workshop
+    and maintenance blocks come from the availability grid's query.
+    """
+    if not vehicles:
+        return []
+
+    bookings = frappe.db.sql(
+        """
+        SELECT vehicle, 'H' AS state, start_datetime AS start,
+            IFNULL(actual_return_datetime, end_datetime) AS end,
+            grand_total AS amount
+        FROM `tabRental Agreement`
+        WHERE vehicle IN %(vehicles)s
+          AND docstatus = 1
+          AND agreement_status IN %(agreement_statuses)s
+          AND start_datetime < %(end)s
+          AND IFNULL(actual_return_datetime, end_datetime) > %(start)s
+        UNION ALL
+        SELECT vehicle, 'R' AS state, pickup_datetime AS start, return_datetime AS end, 0 AS amount
+        FROM `tabReservation`
+        WHERE vehicle IN %(vehicles)s
+          AND reservation_status IN %(reservation_statuses)s
+          AND pickup_datetime < %(end)s
+          AND return_datetime > %(start)s
+        """,
+        {
+            "vehicles": tuple(vehicles),
+            "start": range_start,
+            "end": range_end,
+            "agreement_statuses": RENTED_AGREEMENT_STATUSES,
+            "reservation_statuses": RESERVED_STATUSES,
+        },
+        as_dict=True,
+    )
+    return bookings + get_off_rent_blocks(vehicles, range_start, range_end)
+
+
+def clip_day(blocks, day_start, day_end):
+    """Exclusive hours per state and prorated revenue for one vehicle-day."""
+    hours = dict.fromkeys(STATE_FIELDS.values(), 0)
+    revenue = 0
+    clipped = []
+
+    for block in blocks:
+        start, end = max(block.start, day_start), min(block.end, day_end)
+        if start >= end:
+            continue
+        clipped.append((start, end, block.state))
+
+        if block.state == "H" and block.amount:
+            period = (block.end - block.start).total_seconds()
+            revenue += flt(block.amount) * (end - start).total_seconds() / period
+
+    # Walk the elementary segments between block edges; each goes to the top state covering it
+    points = sorted({point for start, end, _state in clipped for point in (start, end)})
+    for seg_start, seg_end in zip(points, points[1:]):
+        states = [state for start, end, state in clipped if start <= seg_start and end >= seg_end]
+        if states:
+            state = max(states, key=STATE_PRIORITY.get)
+            hours[STATE_FIELDS[state]] += (seg_end - seg_start).total_seconds() / 3600
+
+    return hours, revenue
+
+
+def build_snapshot_row(vehicle, date, blocks):
+    """Utilization Snapshot column values for one vehicle and day."""
+    day_start = get_datetime(date)
+    hours, revenue = clip_day(blocks, day_start, add_days(day_start, 1))
+
+    total_hours = 24
+    busy_hours = sum(hours.values())
+    off_rent_hours = hours["maintenance_hours"] + hours["other_hours"]
+    rental_days = hours["rented_hours"] / 24
+
+    return {
+        "name": f"{vehicle.name}-{date}",
+        "vehicle": vehicle.name,
+        "branch": vehicle.branch,
+        "snapshot_date": date,
+        "total_hours": total_hours,
+        **hours,
+        "idle_hours": total_hours - busy_hours,
+        "utilization_pct": hours["rented_hours"] / total_hours * 100,
+        "availability_pct": (total_hours - off_rent_hours) / total_hours * 100,
+        "revenue": revenue,
+        "rental_days": rental_days,
+        "average_daily_rate": revenue / rental_days if rental_days else 0,
+    }
+
+
+def compute_utilization_rows(vehicles, from_date, to_date):
+    """Snapshot rows for every vehicle (dicts with name, branch) and day in the range."""
+    from_date, to_date = getdate(from_date), getdate(to_date)
+    blocks_by_vehicle = defaultdict(list)
+    for block in get_usage_blocks(
+        [v.name for v in vehicles], get_datetime(from_date), get_datetime(add_days(to_date, 1))
+    ):
+        block.start, block.end = get_datetime(block.start), get_datetime(block.end)
+        blocks_by_vehicle[block.vehicle].append(block)
+
+    days = [add_days(from_date, offset) for offset in range(date_diff(to_date, from_date) + 1)]
+    return [
+        build_snapshot_row(vehicle, day, blocks_by_vehicle[vehicle.name])
+        for vehicle in vehicles
+        for day in days
+    ]
+
+
+def get_utilization_vehicles(names=None):
+    """Vehicles that get snapshots, as dicts with name and branch."""
+    filters = {"status": ["!=", "Deactivated"]}
+    if names is not None:
+        filters["name"] = ["in", names]
+    return frappe.get_all("Vehicle", filters=filters, fields=["name", "branch"], order_by="name asc")
+
+
+def update_utilization(from_date, to_date, vehicles=None):
+    """Recompute and upsert snapshots for a date range; returns inserted / updated counts."""
+    if vehicles is None:
+        vehicles = get_utilization_vehicles()
+    return bulk_upsert("Utilization Snapshot", compute_utilization_rows(vehicles, from_date, to_date))
+
+
+def update_utilization_chunk(vehicles, from_date, to_date):
+    """Chunk job: recompute snapshots for a list of vehicle names over a date range."""
+    return update_utilization(from_date, to_date, vehicles=get_utilization_vehicles(vehicles))
+
+
+def backfill_utilization(from_date, to_date, vehicles_per_chunk=None, days_per_chunk=None, restart=False):
+    """Recompute snapshots for a date range as vehicle x date chunks on the long queue.
+
+    Chunks are checkpointed as they finish, so re-running the same backfill
+    after a worker crash only queues what is still missing (pass restart=1 to
+    start over). Usage:
+
+        bench --site <site> execute right_hire.right_hire.utilization.backfill_utilization \
+            --kwargs "{'from_date': '2023-01-01', 'to_date': '2024-12-31'}"
+    """
+    from_date, to_date = getdate(from_date), getdate(to_date)
+    days_per_chunk = cint(days_per_chunk) or BACKFILL_DAYS_PER_CHUNK
+    names = [v.name for v in get_utilization_vehicles()]
+
+    chunks = []
+    chunk_start = from_date
+    while chunk_start <= to_date:
+        chunk_end = min(add_days(chunk_start, days_per_chunk - 1), to_date)
+        chunks += [
+            (f"{key}:{chunk_start}:{chunk_end}", kwargs)
+            for key, kwargs in vehicle_chunks(
+                names, vehicles_per_chunk or BACKFILL_VEHICLES_PER_CHUNK, from_date=chunk_start, to_date=chunk_end
+            )
+        ]
+        chunk_start = add_days(chunk_end, 1)
+
+    return run_chunked(
+        "utilization_backfill",
+        "right_hire.right_hire.utilization.update_utilization_chunk",
+        chunks,
+        run_id=f"{from_date}:{to_date}",
+        restart=restart,
+    )
+
+
+def get_backfill_progress(from_date, to_date):
+    """Total, finished and waiting chunk counts for a backfill range."""
+    return get_chunked_progress("utilization_backfill", f"{getdate(from_date)}:{getdate(to_date)}")
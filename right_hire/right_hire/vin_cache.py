@@ -0,0 +1,208 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+"""Persistent VIN decode cache (the VIN Decode Cache doctype).
+
+A VIN decodes to the same vehicle forever, so a successful decode is stored
+once with its raw payload and mapped Vehicle fields and served from the
+table afterwards. A failed decode is stored too, with `retry_after` set
+`right_hire_vin_negative_ttl` seconds ahead (site config, default 15
+minutes); until then lookups of that VIN fail fast without calling the API.
+
+The first 8 characters (WMI + VDS) identify make, model and body, so a VIN
+that cannot be decoded, or a partial VIN, is matched against any decoded VIN
+sharing that prefix and gets the fields that prefix determines.
+
+Site config:
+    right_hire_rapidapi_key: RapidAPI key for car-api2
+    right_hire_vin_api_url: base URL of the decoder API, e.g. a local
+        stand-in server for offline work (default car-api2 on RapidAPI)
+    right_hire_vin_decode_offline: never call the API; answer from the cache only
+
+Hits are counted in Redis and added to the table hourly (`flush_cache_hits`),
+so serving a cached decode costs no write.
+"""
+
+import json
+from collections import defaultdict
+
+import frappe
+from frappe.utils import add_to_date, cint, get_datetime, now_datetime
+
+from right_hire.right_hire.bulk import bulk_upsert
+from right_hire.right_hire.integrations import get_credential
+
+RAPIDAPI_HOST = "car-api2.p.rapidapi.com"
+DEFAULT_API_URL = f"https://{RAPIDAPI_HOST}"
+DEFAULT_NEGATIVE_TTL = 15 * 60
+VDS_KEY_LENGTH = 8
+# Mapped fields a WMI + VDS prefix determines; year and trim come from later characters
+PREFIX_FIELDS = ("transmission", "fuel_type", "seating_capacity", "body_type", "engine_capacity")
+# Columns overwritten when a VIN is stored again; `hits` is kept
+UPDATE_FIELDS = ("vin", "wmi", "vds_key", "status", "fetched_at", "retry_after", "error", "raw_data", "mapped_data")
+HITS_KEY = "right_hire_vin_cache_hits"
+HITS_FLUSH_CHUNK_SIZE = 500
+
+
+def normalize_vin(vin):
+    return "".join((vin or "").split()).upper()
+
+
+def get_vds_key(vin):
+    return vin[:VDS_KEY_LENGTH] if len(vin) >= VDS_KEY_LENGTH else None
+
+
+def get_api_url():
+    return (frappe.conf.get("right_hire_vin_api_url") or DEFAULT_API_URL).rstrip("/")
+
+
+def get_api_headers():
+    headers = {"x-rapidapi-host": RAPIDAPI_HOST}
+    api_key = get_credential("right_hire_rapidapi_key")
+    if api_key:
+        headers["x-rapidapi-key"] = api_key
+    return headers
+
+
+def is_api_configured():
+    """A RapidAPI key, or a stand-in server that needs none, is set in site config."""
+    return bool(get_credential("right_hire_rapidapi_key") or frappe.conf.get("right_hire_vin_api_url"))
+
+
+def is_offline():
+    return bool(cint(frappe.conf.get("right_hire_vin_decode_offline")))
+
+
+def get_negative_ttl():
+    return cint(frappe.conf.get("right_hire_vin_negative_ttl")) or DEFAULT_NEGATIVE_TTL
+
+
+def get_cached_decode(vin):
+    """The cache entry for a normalized VIN as a dict, or None when missing or an expired failure."""
+    entry = frappe.db.get_value(
+        "VIN Decode Cache",
+        vin,
+        ["name", "status", "raw_data", "mapped_data", "error", "retry_after"],
+        as_dict=True,
+    )
+    if not entry:
+        return None
+    if entry.status == "Failed" and entry.retry_after and get_datetime(entry.retry_after) <= now_datetime():
+        return None
+
+    count_hit(vin)
+    entry.raw_data = load_json(entry.raw_data)
+    entry.mapped_data = load_json(entry.mapped_data) or {}
+    return entry
+
+
+def get_prefix_match(vin):
+    """Raw payload and prefix-determined fields of a decoded VIN sharing the WMI + VDS prefix, or None."""
+    vds_key = get_vds_key(vin)
+    if not vds_key:
+        return None
+
+    entry = frappe.db.get_value(
+        "VIN Decode Cache",
+        {"vds_key": vds_key, "status": "Decoded"},
+        ["name", "raw_data", "mapped_data"],
+        as_dict=True,
+        order_by="fetched_at desc",
+    )
+    if not entry:
+        return None
+
+    mapped_data = load_json(entry.mapped_data) or {}
+    entry.raw_data = load_json(entry.raw_data)
+    entry.mapped_data = {field: mapped_data[field] for field in PREFIX_FIELDS if field in mapped_data}
+    return entry
+
+
+def get_cached_decodes(vins):
+    """Cache entries for many VINs in one query.
+
+    Returns ({vin: (raw_data, mapped_data)} for decoded VINs, {vin: error} for
+    failures not yet due for a retry).
+    """
+    decoded, failed = {}, {}
+    if not vins:
+        return decoded, failed
+
+    now = now_datetime()
+    for row in frappe.get_all(
+        "VIN Decode Cache",
+        filters={"name": ["in", list(vins)]},
+        fields=["name", "status", "raw_data", "mapped_data", "error", "retry_after"],
+    ):
+        if row.status == "Decoded":
+            decoded[row.name] = (load_json(row.raw_data), load_json(row.mapped_data) or {})
+        elif not row.retry_after or get_datetime(row.retry_after) > now:
+            failed[row.name] = row.error
+    return decoded, failed
+
+
+def make_cache_row(vin, raw_data=None, mapped_data=None, error=None):
+    """VIN Decode Cache row; without raw_data it is a failure with a retry time."""
+    now = now_datetime()
+    return {
+        "name": vin,
+        "vin": vin,
+        "wmi": vin[:3],
+        "vds_key": get_vds_key(vin),
+        "status": "Decoded" if raw_data else "Failed",
+        "fetched_at": now,
+        "retry_after": None if raw_data else add_to_date(now, seconds=get_negative_ttl()),
+        "error": None if raw_data else error,
+        "raw_data": json.dumps(raw_data) if raw_data else None,
+        "mapped_data": json.dumps(mapped_data) if raw_data else None,
+        "hits": 0,
+    }
+
+
+def store_decode(vin, raw_data=None, mapped_data=None, error=None):
+    """Save one decode result."""
+    upsert_cache_rows([make_cache_row(vin, raw_data, mapped_data, error)])
+
+
+def upsert_cache_rows(rows):
+    bulk_upsert("VIN Decode Cache", rows, update_fields=UPDATE_FIELDS)
+
+
+def count_hit(vin):
+    """Count a cache hit in Redis; `flush_cache_hits` adds the counts to the table."""
+    try:
+        # Raw command: the cache wrapper's hash helpers pickle values, counters must stay integers
+        frappe.cache().execute_command("HINCRBY", frappe.cache().make_key(HITS_KEY), vin, 1)
+    except Exception:
+        # Hit counts are informational; a lookup never fails over them
+        pass
+
+
+def flush_cache_hits():
+    """Add the hit counts gathered in Redis to the cache rows; returns the number of VINs updated."""
+    key = frappe.cache().make_key(HITS_KEY)
+    pipeline = frappe.cache().pipeline()
+    pipeline.hgetall(key)
+    pipeline.delete(key)
+    hits = pipeline.execute()[0]
+
+    # One UPDATE per distinct count (and chunk), not per VIN
+    by_count = defaultdict(list)
+    for vin, count in hits.items():
+        by_count[cint(count)].append(frappe.safe_decode(vin))
+
+    for count, vins in by_count.items():
+        for offset in range(0, len(vins), HITS_FLUSH_CHUNK_SIZE):
+            # No modified bump, so the entry's age stays meaningful
+            frappe.db.sql(
+                "UPDATE `tabVIN Decode Cache` SET hits = hits + %(count)s WHERE name IN %(vins)s",
+                {"count": count, "vins": tuple(vins[offset : offset + HITS_FLUSH_CHUNK_SIZE])},
+            )
+
+    return len(hits)
+
+
+def load_json(value):
+    if isinstance(value, str):
+        return json.loads(value) if value else None
+    return value
@@ -0,0 +1,543 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+"""Bulk VIN import for fleet onboarding (the VIN Import doctype).
+
+A VIN Import takes a CSV / XLSX file with a VIN column (plus plate_no and
+optionally vehicle_id, branch and year) and runs as one long background job:
+
+1. Rows are validated up front; VINs already on a Vehicle are skipped and
+   duplicate plates / ids are reported, with one query per column.
+2. VINs not in the VIN Decode Cache are decoded by a bounded thread pool.
+   Request starts are spaced to `right_hire_vin_import_rate` per second
+   across all threads, over the integration client's pooled session with
+   the car_api timeouts; timeouts, 429s and 5xx responses are retried with
+   exponential backoff (honouring Retry-After). Each VIN's outcome feeds the
+   car_api circuit breaker; once it opens no more VINs are sent and the rest
+   fail as transient. Results go to the decode cache, so a re-run only calls
+   the API for VINs that failed transiently.
+3. Makes and models are resolved from maps loaded once, creating the
+   missing ones. VINs, plates and ids are checked again, then the Vehicles
+   are written with plain multi-row INSERTs, so an existing Vehicle is never
+   overwritten; rows colliding with one are reported as failed.
+
+Progress is published as `vin_import_progress` realtime events on the
+import document; every input row's outcome is written to a CSV attached as
+the import's result file.
+
+Site config:
+    right_hire_vin_import_workers: decode threads (default 4)
+    right_hire_vin_import_rate: API requests per second (default 5)
+"""
+
+import csv
+import io
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import frappe
+import requests
+from frappe import _
+from frappe.utils import cint, cstr, flt, now
+from frappe.utils.csvutils import read_csv_content
+from frappe.utils.xlsxutils import read_xlsx_file_from_attached_file
+
+from right_hire.right_hire.bulk import bulk_insert
+from right_hire.right_hire.doctype.vehicle.api import map_to_vehicle_fields, validate_vin
+from right_hire.right_hire.integrations import (
+    CircuitOpenError,
+    check_circuit,
+    get_backoff,
+    get_latency_ms,
+    get_session,
+    get_settings,
+    record_call,
+    record_failure,
+    record_success,
+)
+from right_hire.right_hire.vin_cache import (
+    get_api_headers,
+    get_api_url,
+    get_cached_decodes,
+    is_api_configured,
+    is_offline,
+    make_cache_row,
+    normalize_vin,
+    upsert_cache_rows,
+)
+from right_hire.tasks.instrumentation import instrumented
+
+DEFAULT_WORKERS = 4
+DEFAULT_RATE = 5
+# Attempts per VIN; more than interactive calls since a batch can wait out rate limits
+MAX_ATTEMPTS = 4
+IMPORT_TIMEOUT = 4 * 3600
+# Decode results written to the cache per batch, and progress events per this many VINs
+CACHE_FLUSH_SIZE = 100
+PROGRESS_EVERY = 25
+# VINs queued in the pool per worker thread
+IN_FLIGHT_PER_WORKER = 2
+VEHICLE_CHUNK_SIZE = 500
+VEHICLE_SAVEPOINT = "vin_import_vehicles"
+
+COLUMN_ALIASES = {"chassis_number": "vin", "chassis_no": "vin", "vin_number": "vin", "plate": "plate_no"}
+RESULT_COLUMNS = ("row", "vin", "plate_no", "status", "vehicle", "message")
+# Mapped decode fields copied onto the Vehicle
+DECODED_FIELDS = ("variant", "transmission", "fuel_type", "seating_capacity", "body_type", "engine_capacity")
+
+
+def enqueue_vin_import(import_name):
+    frappe.enqueue(
+        "right_hire.right_hire.vin_import.run_vin_import",
+        queue="long",
+        timeout=IMPORT_TIMEOUT,
+        job_id=f"vin_import:{import_name}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        import_name=import_name,
+    )
+
+
+@instrumented("vin_import")
+def run_vin_import(import_name):
+    """Background job: import every row of a VIN Import's file."""
+    doc = frappe.get_doc("VIN Import", import_name)
+    doc.db_set(
+        {"status": "Running", "started_at": now(), "finished_at": None, "error_log": None}, commit=True
+    )
+
+    try:
+        results = import_rows(doc)
+    except Exception:
+        frappe.db.rollback()
+        doc.db_set({"status": "Failed", "finished_at": now(), "error_log": frappe.get_traceback()}, commit=True)
+        publish_progress(doc.name, "Failed")
+        raise
+
+    counts = {status: sum(1 for r in results if r.status == status) for status in ("Created", "Skipped", "Failed")}
+    doc.db_set(
+        {
+            "status": "Completed with Errors" if counts["Failed"] else "Completed",
+            "finished_at": now(),
+            "created": counts["Created"],
+            "skipped": counts["Skipped"],
+            "failed": counts["Failed"],
+            "result_file": save_result_file(doc.name, results),
+        },
+        commit=True,
+    )
+    publish_progress(doc.name, "Completed", total=len(results), done=len(results))
+    return counts["Created"]
+
+
+def import_rows(doc):
+    rows = read_import_file(doc.import_file)
+    doc.db_set("total_rows", len(rows), commit=True)
+
+    results = [
+        frappe._dict(row=index, vin=normalize_vin(row.vin), plate_no=cstr(row.plate_no).strip(), status=None,
+                     vehicle=None, message=None)
+        for index, row in enumerate(rows, start=2)
+    ]
+    pending = validate_rows(rows, results, doc.branch)
+
+    vins = {result.vin for _row, result in pending}
+    decoded, failed = decode_vins(doc.name, vins)
+    doc.db_set("decoded", len(decoded), commit=True)
+
+    publish_progress(doc.name, "Creating Vehicles", total=len(vins), done=len(vins))
+    create_vehicles(pending, decoded, failed)
+    return results
+
+
+def read_import_file(file_url):
+    """Rows of the import file as dicts keyed by scrubbed header."""
+    file_doc = frappe.get_doc("File", {"file_url": file_url})
+    content = file_doc.get_content()
+    if cstr(file_doc.file_name).lower().endswith(".xlsx"):
+        rows = read_xlsx_file_from_attached_file(fcontent=content)
+    else:
+        rows = read_csv_content(content)
+
+    if not rows:
+        frappe.throw(_("The import file is empty"))
+
+    header = [COLUMN_ALIASES.get(frappe.scrub(cstr(h)), frappe.scrub(cstr(h))) for h in rows[0]]
+    if "vin" not in header:
+        frappe.throw(_("The import file needs a VIN column"))
+
+    return [
+        frappe._dict(zip(header, (cstr(value).strip() for value in row)))
+        for row in rows[1:]
+        if any(cstr(value).strip() for value in row)
+    ]
+
+
+def validate_rows(rows, results, default_branch=None):
+    """Mark rows that cannot be imported; returns [(row, result)] of the rest."""
+    vins = [result.vin for result in results]
+    plates = [result.plate_no for result in results if result.plate_no]
+    ids = [row.vehicle_id or result.plate_no for row, result in zip(rows, results)]
+
+    existing_vins, existing_plates, existing_ids = get_existing_keys(vins, plates, ids)
+
+    seen = {}
+    pending = []
+    for row, result in zip(rows, results):
+        row.vehicle_id = row.vehicle_id or result.plate_no
+        row.branch = row.branch or default_branch
+        validation = validate_vin(result.vin)
+
+        if not validation["valid"]:
+            result.status, result.message = "Failed", validation["message"]
+        elif result.vin in existing_vins:
+            result.status, result.vehicle = "Skipped", existing_vins[result.vin]
+            result.message = _("Vehicle already exists")
+        elif result.vin in seen:
+            result.status, result.message = "Skipped", _("Duplicate of row {0}").format(seen[result.vin])
+        elif not result.plate_no:
+            result.status, result.message = "Failed", _("Plate No is required")
+        elif not row.branch:
+            result.status, result.message = "Failed", _("Branch is required")
+        elif result.plate_no in existing_plates or ("plate", result.plate_no) in seen:
+            result.status, result.message = "Failed", _("Plate No {0} is already used").format(result.plate_no)
+        elif row.vehicle_id in existing_ids or ("id", row.vehicle_id) in seen:
+            result.status, result.message = "Failed", _("Vehicle ID {0} is already used").format(row.vehicle_id)
+        else:
+            seen[result.vin] = result.row
+            seen[("plate", result.plate_no)] = seen[("id", row.vehicle_id)] = result.row
+            pending.append((row, result))
+
+    return pending
+
+
+def get_existing_keys(vins, plates, ids):
+    """({chassis_number: Vehicle}, {plate_no}, {Vehicle name}) of Vehicles using any of the values."""
+    vins, plates, ids = [v for v in vins if v], [p for p in plates if p], [i for i in ids if i]
+    existing_vins = dict(
+        frappe.get_all("Vehicle", filters={"chassis_number": ["in", vins]}, fields=["chassis_number", "name"],
+                       as_list=True)
+    ) if vins else {}
+    existing_plates = set(
+        frappe.get_all("Vehicle", filters={"plate_no": ["in", plates]}, pluck="plate_no")
+    ) if plates else set()
+    existing_ids = set(
+        frappe.get_all("Vehicle", filters={"name": ["in", ids]}, pluck="name")
+    ) if ids else set()
+    return existing_vins, existing_plates, existing_ids
+
+
+def decode_vins(import_name, vins):
+    """Decode VINs, cached first, the rest through the thread pool.
+
+    Returns ({vin: (raw_data, mapped_data)}, {vin: error}).
+    """
+    decoded, failed = get_cached_decodes(vins)
+    to_fetch = sorted(vins - set(decoded) - set(failed))
+    total = len(vins)
+    publish_progress(import_name, "Decoding", total=total, done=total - len(to_fetch))
+
+    if is_offline() or not is_api_configured():
+        error = _("Not in the decode cache (offline mode)") if is_offline() else _("VIN decoder API key is not configured")
+        failed.update({vin: error for vin in to_fetch})
+        return decoded, failed
+
+    # Fail the whole import at once while the car API's circuit is open
+    check_circuit("car_api")
+
+    workers = cint(frappe.conf.get("right_hire_vin_import_workers")) or DEFAULT_WORKERS
+    limiter = RateLimiter(frappe.conf.get("right_hire_vin_import_rate") or DEFAULT_RATE)
+    settings = get_settings("car_api")
+    api_url, headers = get_api_url(), get_api_headers()
+    timeout = (flt(settings.connect_timeout), flt(settings.timeout))
+    # Threads share the integration client's pooled keep-alive session for the API host
+    session = get_session(api_url)
+    cache_rows = []
+
+    remaining = iter(to_fetch)
+    in_flight = {}
+    circuit_error = None
+    done = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            # Keep a bounded queue in the pool, so submitting can stop as soon as the circuit opens
+            while not circuit_error and len(in_flight) < workers * IN_FLIGHT_PER_WORKER:
+                try:
+                    check_circuit("car_api")
+                except CircuitOpenError as e:
+                    circuit_error = str(e)
+                    break
+                vin = next(remaining, None)
+                if vin is None:
+                    break
+                future = pool.submit(
+                    fetch_vin, session, limiter, f"{api_url}/api/vin/{vin}", headers, timeout, flt(settings.backoff)
+                )
+                in_flight[future] = vin
+
+            if not in_flight:
+                break
+
+            finished, _not_done = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                vin = in_flight.pop(future)
+                data, error, permanent, latency_ms = future.result()
+                # Worker threads have no site context, so the metrics and the breaker are fed from here
+                record_call("car_api", "vin import", latency_ms, error=not data)
+                if data or permanent:
+                    record_success("car_api")
+                else:
+                    record_failure("car_api", settings)
+
+                try:
+                    if data:
+                        mapped_data = map_to_vehicle_fields(data)
+                        decoded[vin] = (data, mapped_data)
+                        cache_rows.append(make_cache_row(vin, data, mapped_data))
+                    else:
+                        failed[vin] = error
+                        # Only failures about the VIN itself are negative-cached; transient ones retry next run
+                        if permanent:
+                            cache_rows.append(make_cache_row(vin, error=error))
+                except Exception as e:
+                    failed[vin] = _("Could not map decoded data: {0}").format(e)
+
+                done += 1
+                if len(cache_rows) >= CACHE_FLUSH_SIZE:
+                    flush_cache_rows(cache_rows)
+                if done % PROGRESS_EVERY == 0 or done == len(to_fetch):
+                    publish_progress(import_name, "Decoding", total=total, done=total - len(to_fetch) + done)
+
+    # VINs never sent because the circuit opened; not negative-cached, so a re-run retries them
+    failed.update({vin: circuit_error for vin in remaining})
+    flush_cache_rows(cache_rows)
+    return decoded, failed
+
+
+def flush_cache_rows(cache_rows):
+    upsert_cache_rows(cache_rows)
+    frappe.db.commit()
+    cache_rows.clear()
+
+
+class RateLimiter:
+    """Spaces request starts at least 1 / rate seconds apart across threads."""
+
+    def __init__(self, rate):
+        rate = float(rate)
+        self.interval = 1 / rate if rate > 0 else 0
+        self.next_at = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            current = time.monotonic()
+            start = max(current, self.next_at)
+            self.next_at = start + self.interval
+        if start > current:
+            time.sleep(start - current)
+
+
+def fetch_vin(session, limiter, url, headers, timeout, backoff):
+    """Worker thread: decode one VIN with retries.
+
+    Returns (raw_data, error, permanent, latency_ms of the last attempt). Runs
+    without a site context, so it must not touch frappe.db, frappe.cache,
+    frappe.conf or frappe.local.
+    """
+    error = None
+    for attempt in range(MAX_ATTEMPTS):
+        limiter.wait()
+        retry_after = None
+        started = time.monotonic()
+        try:
+            response = session.get(url, headers=headers, timeout=timeout)
+            if response.status_code == 429 or response.status_code >= 500:
+                error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("Retry-After")
+            else:
+                # Any other 4xx is about the VIN and won't change on retry
+                response.raise_for_status()
+                data = response.json()
+                if data:
+                    return data, None, True, get_latency_ms(started)
+                return None, "No data returned from API", True, get_latency_ms(started)
+        except requests.exceptions.HTTPError as e:
+            return None, str(e), True, get_latency_ms(started)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            error = str(e)
+        except ValueError as e:
+            return None, f"Invalid response from API: {e}", False, get_latency_ms(started)
+
+        if attempt < MAX_ATTEMPTS - 1:
+            time.sleep(get_backoff(attempt, backoff, retry_after))
+
+    return None, error, False, get_latency_ms(started)
+
+
+def get_make_model_maps():
+    """({make name lower: Vehicle Make}, {(Vehicle Make, model name lower): Vehicle Model}), loaded once."""
+    makes = {
+        cstr(make_name).lower(): name
+        for name, make_name in frappe.get_all("Vehicle Make", fields=["name", "make_name"], as_list=True)
+    }
+    models = {
+        (make, cstr(model_name).lower()): name
+        for name, make, model_name in frappe.get_all(
+            "Vehicle Model", fields=["name", "make", "model_name"], as_list=True
+        )
+    }
+    return makes, models
+
+
+def resolve_make_model(data, makes, models):
+    """Vehicle Make and Model for a decode payload, creating and remembering missing ones."""
+    make_name = cstr(data.get("make") or data.get("Make")).strip()
+    model_name = cstr(data.get("model") or data.get("Model")).strip()
+    if not make_name or make_name == "Not Applicable":
+        return None, None
+
+    if make_name.lower() not in makes:
+        make_doc = frappe.get_doc({"doctype": "Vehicle Make", "make_name": make_name})
+        make_doc.insert(ignore_permissions=True, ignore_if_duplicate=True)
+        makes[make_name.lower()] = make_doc.name
+    make = makes[make_name.lower()]
+
+    if not model_name or model_name == "Not Applicable":
+        return make, None
+
+    if (make, model_name.lower()) not in models:
+        model_doc = frappe.get_doc({"doctype": "Vehicle Model", "model_name": model_name, "make": make})
+        model_doc.insert(ignore_permissions=True, ignore_if_duplicate=True)
+        models[(make, model_name.lower())] = model_doc.name
+    return make, models[(make, model_name.lower())]
+
+
+def create_vehicles(pending, decoded, failed):
+    """Bulk insert a Vehicle for every decoded pending row."""
+    makes, models = get_make_model_maps()
+    has_plate_art = frappe.get_meta("Vehicle").has_field("custom_plate_art")
+    vehicles = []
+
+    for row, result in pending:
+        if result.vin not in decoded:
+            result.status = "Failed"
+            result.message = failed.get(result.vin) or _("VIN could not be decoded")
+            continue
+
+        data, mapped_data = decoded[result.vin]
+        make, model = resolve_make_model(data, makes, models)
+        year = cint(mapped_data.get("year")) or cint(row.year)
+        if not make or not model or not year:
+            result.status = "Failed"
+            result.message = _("Decoded data has no make, model or year")
+            continue
+
+        vehicle = {
+            "name": row.vehicle_id,
+            "vehicle_id": row.vehicle_id,
+            "chassis_number": result.vin,
+            "plate_no": result.plate_no,
+            "make": make,
+            "model": model,
+            "year": year,
+            "branch": row.branch,
+            # As Vehicle.validate would set them for a new, available vehicle
+            "status": "Available",
+            "availability_status": 1,
+            "vin_decode_data": json.dumps(data, indent=2),
+            **{field: mapped_data.get(field) for field in DECODED_FIELDS},
+        }
+        if has_plate_art:
+            vehicle["custom_plate_art"] = result.plate_no
+        vehicles.append((vehicle, result))
+
+    insert_vehicles(drop_collisions(vehicles))
+    frappe.db.commit()
+
+
+def drop_collisions(vehicles):
+    """Fail rows whose VIN, plate or id was taken by a Vehicle created since validation.
+
+    Decoding can take many minutes, so the uniqueness checks of validate_rows
+    are repeated right before the write.
+    """
+    existing_vins, existing_plates, existing_ids = get_existing_keys(
+        [v["chassis_number"] for v, _result in vehicles],
+        [v["plate_no"] for v, _result in vehicles],
+        [v["name"] for v, _result in vehicles],
+    )
+
+    remaining = []
+    for vehicle, result in vehicles:
+        if vehicle["chassis_number"] in existing_vins:
+            result.status, result.vehicle = "Skipped", existing_vins[vehicle["chassis_number"]]
+            result.message = _("Vehicle already exists")
+        elif vehicle["plate_no"] in existing_plates:
+            result.status, result.message = "Failed", _("Plate No {0} is already used").format(vehicle["plate_no"])
+        elif vehicle["name"] in existing_ids:
+            result.status, result.message = "Failed", _("Vehicle ID {0} is already used").format(vehicle["name"])
+        else:
+            remaining.append((vehicle, result))
+    return remaining
+
+
+def insert_vehicles(vehicles):
+    """Insert in chunks; a chunk hitting a unique key is retried row by row to fail only the colliding rows."""
+    for offset in range(0, len(vehicles), VEHICLE_CHUNK_SIZE):
+        chunk = vehicles[offset : offset + VEHICLE_CHUNK_SIZE]
+        if not try_insert(chunk):
+            for vehicle, result in chunk:
+                if not try_insert([(vehicle, result)]):
+                    result.status = "Failed"
+                    result.message = _("Vehicle ID, Plate No or VIN was taken by another Vehicle during the import")
+
+
+def try_insert(vehicles):
+    """Plain INSERT of the rows, marking them Created; False, with nothing written, on a duplicate key."""
+    frappe.db.savepoint(VEHICLE_SAVEPOINT)
+    try:
+        bulk_insert("Vehicle", [vehicle for vehicle, _result in vehicles])
+    except Exception as e:
+        if not frappe.db.is_duplicate_entry(e):
+            raise
+        frappe.db.rollback(save_point=VEHICLE_SAVEPOINT)
+        return False
+
+    for vehicle, result in vehicles:
+        result.status, result.vehicle = "Created", vehicle["name"]
+    return True
+
+
+def save_result_file(import_name, results):
+    """Attach a CSV of every row's outcome to the import; returns its URL."""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow([_("Row"), _("VIN"), _("Plate No"), _("Status"), _("Vehicle"), _("Message")])
+    for result in results:
+        writer.writerow([result.get(column) or "" for column in RESULT_COLUMNS])
+
+    file_doc = frappe.get_doc(
+        {
+            "doctype": "File",
+            "file_name": f"{import_name}-results.csv",
+            "attached_to_doctype": "VIN Import",
+            "attached_to_name": import_name,
+            "attached_to_field": "result_file",
+            "content": output.getvalue(),
+            "is_private": 1,
+        }
+    ).insert(ignore_permissions=True)
+    return file_doc.file_url
+
+
+def publish_progress(import_name, stage, total=0, done=0):
+    frappe.publish_realtime(
+        "vin_import_progress",
+        {"import": import_name, "stage": stage, "total": total, "done": done},
+        doctype="VIN Import",
+        docname=import_name,
+    )
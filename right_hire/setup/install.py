@@ -4,11 +4,51 @@
 import frappe
 from frappe import _
 
+# Indexes backing the app's hot queries: (doctype, index name, columns)
+QUERY_INDEXES = [
+    # Half-open booking overlap predicate: vehicle = ? AND status IN (...) AND start < ? AND end > ?
+    (
+        "Reservation",
+        "vehicle_status_period",
+        ["vehicle", "reservation_status", "pickup_datetime", "return_datetime"],
+    ),
+    (
+        "Rental Agreement",
+        "vehicle_status_period",
+        ["vehicle", "agreement_status", "start_datetime", "end_datetime"],
+    ),
+    # Hourly overdue scan: agreement_status = 'Active' AND end_datetime < now
+    (
+        "Rental Agreement",
+        "status_end",
+        ["agreement_status", "end_datetime"],
+    ),
+    # Revenue Analysis: half-open range on start_datetime, optionally per branch
+    (
+        "Rental Agreement",
+        "start_branch",
+        ["start_datetime", "branch"],
+    ),
+    # Daily lease billing: status = 'Pending' AND period_start <= today
+    (
+        "Lease Schedule Line",
+        "status_period_start",
+        ["status", "period_start"],
+    ),
+    # Occupancy calendar: vehicle IN (...) AND start < ? AND end > ?
+    (
+        "Vehicle Occupancy",
+        "vehicle_period",
+        ["vehicle", "start_datetime", "end_datetime"],
+    ),
+]
+
 def after_install():
     """Setup after installation"""
     create_custom_roles()
     create_default_branches()
     create_default_rate_plans()
+    create_query_indexes()
     frappe.db.commit()
 
 def create_custom_roles():
@@ -76,3 +116,14 @@ def create_default_rate_plans():
             doc = frappe.get_doc({"doctype": "Rate Plan", **plan})
             doc.insert(ignore_permissions=True)
             frappe.logger().info(f"Created rate plan: {plan['rate_plan_name']}")
+
+def create_query_indexes():
+    """Create every index in QUERY_INDEXES; existing ones are skipped"""
+    for doctype, index_name, _fields in QUERY_INDEXES:
+        create_index(doctype, index_name)
+
+def create_index(doctype, index_name):
+    """Create one index from QUERY_INDEXES, e.g. from the patch introducing it"""
+    fields = next(f for d, name, f in QUERY_INDEXES if d == doctype and name == index_name)
+    frappe.db.add_index(doctype, fields, index_name=index_name)
+    frappe.logger().info(f"Ensured index {index_name} on {doctype}")
@@ -0,0 +1,160 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+"""Chunked, resumable scheduler jobs.
+
+A job is split into keyed chunks (a vehicle name range, a batch of schedule
+lines, ...). `run_chunked` queues at most `max_concurrent` of them on the
+long queue; every chunk, when it finishes, queues the next pending one, so a
+large fleet never floods the workers.
+
+Finished chunk keys are checkpointed in Redis per (job, run id). Running the
+same job for the same run id again, e.g. after a worker was killed, only
+queues the chunks that have not finished. When the last chunk of a run
+finishes, the optional `on_complete` method is called exactly once.
+
+Each chunk is recorded as a Right Hire Job Run named "<job> chunk".
+"""
+
+import json
+
+import frappe
+from frappe.utils import cint
+
+from right_hire.tasks.instrumentation import instrumented
+
+CHUNK_STATE_KEY = "right_hire_chunked"
+DEFAULT_CHUNK_SIZE = 200
+DEFAULT_MAX_CONCURRENT = 4
+CHUNK_TIMEOUT = 1800
+# Forget checkpoints after a week
+CHUNK_STATE_TTL = 7 * 24 * 3600
+
+
+def batch_chunks(names, chunk_size=None, arg="names", **kwargs):
+    """(key, kwargs) chunks over a list of names, keyed by the first..last name of each."""
+    chunk_size = cint(chunk_size) or DEFAULT_CHUNK_SIZE
+    return [
+        (f"{batch[0]}..{batch[-1]}", {arg: batch, **kwargs})
+        for batch in (names[offset : offset + chunk_size] for offset in range(0, len(names), chunk_size))
+    ]
+
+
+def vehicle_chunks(vehicles, chunk_size=None, **kwargs):
+    """Chunks of vehicle names by name range; each chunk gets `vehicles=[...]` plus kwargs."""
+    return batch_chunks(sorted(vehicles), chunk_size, arg="vehicles", **kwargs)
+
+
+def get_state_key(job, run_id, part):
+    return f"{CHUNK_STATE_KEY}:{job}:{run_id}:{part}"
+
+
+def run_chunked(job, method, chunks, run_id, on_complete=None, max_concurrent=None, restart=False):
+    """Queue the chunks of a run that have not finished yet.
+
+    job: name of the job, used for checkpoint keys and job ids
+    method: dotted path called as method(**kwargs) for each chunk
+    chunks: list of (key, kwargs); kwargs must be JSON serialisable
+    run_id: identifies one run (e.g. the date processed); reruns with the same id resume
+    on_complete: dotted path called with no arguments once every chunk has finished
+    max_concurrent: chunks queued at a time (default `right_hire_max_concurrent_chunks`
+        from site config, else 4)
+    restart: forget the checkpoints of this run first
+    """
+    cache = frappe.cache()
+    run_id = str(run_id)
+    if cint(restart):
+        for part in ("done", "pending", "total", "complete"):
+            cache.delete_value(get_state_key(job, run_id, part))
+
+    max_concurrent = cint(
+        max_concurrent or frappe.conf.get("right_hire_max_concurrent_chunks") or DEFAULT_MAX_CONCURRENT
+    )
+    done = get_done_chunks(job, run_id)
+    # Round-trip through JSON so queued and deferred chunks see the same argument types
+    pending = [(key, json.loads(frappe.as_json(kwargs))) for key, kwargs in chunks if key not in done]
+
+    cache.set_value(get_state_key(job, run_id, "total"), len(chunks), expires_in_sec=CHUNK_STATE_TTL)
+    pending_key = get_state_key(job, run_id, "pending")
+    cache.delete_value(pending_key)
+    for key, kwargs in pending[max_concurrent:]:
+        cache.rpush(pending_key, frappe.as_json({"key": key, "kwargs": kwargs}, indent=None))
+    expire(pending_key)
+
+    for key, kwargs in pending[:max_concurrent]:
+        enqueue_chunk(job, run_id, key, method, kwargs, on_complete)
+
+    if not chunks and on_complete:
+        frappe.get_attr(on_complete)()
+
+    return {"run": run_id, "chunks": len(chunks), "queued": len(pending), "skipped": len(chunks) - len(pending)}
+
+
+def enqueue_chunk(job, run_id, key, method, kwargs, on_complete=None):
+    frappe.enqueue(
+        "right_hire.tasks.chunked.run_chunk",
+        queue="long",
+        timeout=CHUNK_TIMEOUT,
+        job_id=f"{job}:{run_id}:{key}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        job=job,
+        run_id=run_id,
+        key=key,
+        method=method,
+        kwargs=kwargs,
+        on_complete=on_complete,
+    )
+
+
+def run_chunk(job, run_id, key, method, kwargs, on_complete=None):
+    """Background job: run one chunk, checkpoint it and queue the next pending chunk."""
+    try:
+        if not frappe.cache().sismember(get_state_key(job, run_id, "done"), key):
+            instrumented(f"{job} chunk")(frappe.get_attr(method))(**kwargs)
+            frappe.db.commit()
+            mark_chunk_done(job, run_id, key, on_complete)
+    finally:
+        # A failed chunk stays unfinished for the next run but does not stall this one
+        queue_next_chunk(job, run_id, method, on_complete)
+
+
+def mark_chunk_done(job, run_id, key, on_complete=None):
+    cache = frappe.cache()
+    done_key = get_state_key(job, run_id, "done")
+    cache.sadd(done_key, key)
+    expire(done_key)
+
+    total = cint(cache.get_value(get_state_key(job, run_id, "total")))
+    if on_complete and total and len(cache.smembers(done_key)) >= total:
+        # SET NX lets exactly one of several chunks finishing together run the hook
+        if cache.set(cache.make_key(get_state_key(job, run_id, "complete")), 1, nx=True, ex=CHUNK_STATE_TTL):
+            frappe.get_attr(on_complete)()
+            frappe.db.commit()
+
+
+def queue_next_chunk(job, run_id, method, on_complete=None):
+    chunk = frappe.cache().lpop(get_state_key(job, run_id, "pending"))
+    if chunk:
+        chunk = json.loads(frappe.safe_decode(chunk))
+        enqueue_chunk(job, run_id, chunk["key"], method, chunk["kwargs"], on_complete)
+        frappe.db.commit()
+
+
+def get_done_chunks(job, run_id):
+    return {frappe.safe_decode(member) for member in frappe.cache().smembers(get_state_key(job, run_id, "done"))}
+
+
+def get_chunked_progress(job, run_id):
+    """Total, finished and still-waiting chunk counts for a run."""
+    cache = frappe.cache()
+    run_id = str(run_id)
+    return {
+        "total": cint(cache.get_value(get_state_key(job, run_id, "total"))),
+        "done": len(get_done_chunks(job, run_id)),
+        "waiting": cint(cache.llen(get_state_key(job, run_id, "pending"))),
+    }
+
+
+def expire(key):
+    frappe.cache().expire(frappe.cache().make_key(key), CHUNK_STATE_TTL)
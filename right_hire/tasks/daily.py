@@ -2,151 +2,95 @@
 # For license information, please see license.txt
 
 import frappe
-from frappe.utils import getdate, add_days, nowdate, date_diff, today
-
-def calculate_daily_utilization():
-    """Calculate daily utilization for all vehicles"""
-    vehicles = frappe.get_all("Vehicle", 
-                             filters={"status": ["!=", "Deactivated"]}, 
-                             pluck="name")
-    
-    for vehicle_name in vehicles:
-        try:
-            calculate_vehicle_utilization(vehicle_name, getdate())
-        except Exception as e:
-            frappe.log_error(f"Failed to calculate utilization for {vehicle_name}: {str(e)}")
-
-def calculate_vehicle_utilization(vehicle, date):
-    """Calculate utilization for a specific vehicle and date"""
-    # Get agreements for this vehicle on this date
-    agreements = frappe.db.sql("""
-        SELECT name, start_datetime, end_datetime, grand_total
-        FROM tabRental Agreement
-        WHERE vehicle = %s
-        AND DATE(start_datetime) <= %s
-        AND DATE(end_datetime) >= %s
-        AND agreement_status NOT IN ('Cancelled', 'Draft')
-    """, (vehicle, date, date), as_dict=True)
-    
-    # Get maintenance jobs
-    maintenance = frappe.db.sql("""
-        SELECT actual_hours
-        FROM tabMaintenance Job
-        WHERE vehicle = %s
-        AND DATE(job_date) = %s
-        AND job_status = 'Completed'
-    """, (vehicle, date), as_dict=True)
-    
-    rented_hours = 0
-    revenue = 0
-    
-    for agreement in agreements:
-        # Calculate hours for this day
-        hours = 24  # Simplified - assume full day if active
-        rented_hours += hours
-        
-        # Prorate revenue
-        total_days = date_diff(agreement.end_datetime, agreement.start_datetime) or 1
-        daily_revenue = agreement.grand_total / total_days
-        revenue += daily_revenue
-    
-    maintenance_hours = sum([m.actual_hours or 0 for m in maintenance])
-    idle_hours = 24 - rented_hours - maintenance_hours
-    
-    utilization_pct = (rented_hours / 24) * 100 if rented_hours else 0
-    
-    # Create or update snapshot
-    snapshot_name = f"{vehicle}-{date}"
-    if frappe.db.exists("Utilization Snapshot", snapshot_name):
-        snapshot = frappe.get_doc("Utilization Snapshot", snapshot_name)
-    else:
-        snapshot = frappe.new_doc("Utilization Snapshot")
-        snapshot.vehicle = vehicle
-        snapshot.snapshot_date = date
-    
-    snapshot.total_hours = 24
-    snapshot.rented_hours = rented_hours
-    snapshot.idle_hours = idle_hours
-    snapshot.maintenance_hours = maintenance_hours
-    snapshot.utilization_pct = utilization_pct
-    snapshot.revenue = revenue
-    snapshot.rental_days = rented_hours / 24
-    
-    snapshot.save(ignore_permissions=True)
+from frappe.utils import getdate, get_datetime, add_days, nowdate, date_diff, today
 
-def send_expiry_alerts():
-    """Send alerts for expiring documents"""
-    # Insurance expiring in 30 days
-    expiring_insurance = frappe.get_all(
-        "Insurance Policy",
-        filters={
-            "end_date": ["between", [today(), add_days(today(), 30)]],
-            "is_active": 1
-        },
-        fields=["name", "policy_number", "end_date"]
-    )
-    
-    for policy in expiring_insurance:
-        send_alert("Insurance Policy Expiring", 
-                   f"Policy {policy.policy_number} expires on {policy.end_date}")
-    
-    # Vehicle registration expiring in 30 days
-    expiring_registration = frappe.get_all(
-        "Vehicle",
-        filters={
-            "registration_expiry": ["between", [today(), add_days(today(), 30)]],
-            "status": ["!=", "Deactivated"]
-        },
-        fields=["name", "plate_no", "registration_expiry"]
+from right_hire.right_hire.alerts import dispatch_alerts, make_alert
+from right_hire.right_hire.availability import rebuild_vehicle_occupancy
+from right_hire.right_hire.expiry import EXPIRY_SOURCES, iter_expiries
+from right_hire.right_hire.lease_billing import start_billing_run
+from right_hire.right_hire.utilization import get_utilization_vehicles
+from right_hire.tasks.chunked import run_chunked, vehicle_chunks
+from right_hire.tasks.instrumentation import instrumented
+
+@instrumented()
+def calculate_daily_utilization(date=None):
+    """Calculate daily utilization for all vehicles
+
+    The fleet is split into vehicle name ranges computed as resumable chunks
+    on the long queue; each chunk clips its vehicles' bookings, workshop
+    visits and maintenance jobs to the day in one query and writes snapshots
+    with one bulk upsert.
+    """
+    date = getdate(date)
+    vehicles = [v.name for v in get_utilization_vehicles()]
+
+    result = run_chunked(
+        "daily_utilization",
+        "right_hire.right_hire.utilization.update_utilization_chunk",
+        vehicle_chunks(vehicles, from_date=date, to_date=date),
+        run_id=date,
     )
-    
-    for vehicle in expiring_registration:
-        send_alert("Vehicle Registration Expiring",
-                   f"Vehicle {vehicle.plate_no} registration expires on {vehicle.registration_expiry}")
-    
-    # Customer licenses expiring in 30 days
-    expiring_licenses = frappe.get_all(
-        "Customer",
-        filters={
-            "license_expiry": ["between", [today(), add_days(today(), 30)]],
-            "customer_type": "Individual"
-        },
-        fields=["name", "customer_name", "license_expiry"]
+
+    frappe.logger().info(
+        f"Utilization snapshots for {date}: {result['queued']} chunks queued, {result['skipped']} already done"
     )
-    
-    for customer in expiring_licenses:
-        send_alert("Customer License Expiring",
-                   f"Customer {customer.customer_name} license expires on {customer.license_expiry}")
+    return {"rows": len(vehicles), **result}
+
+@instrumented()
+def reconcile_availability_calendar():
+    """Rebuild the Vehicle Occupancy calendar from Reservations and Rental Agreements"""
+    rows = rebuild_vehicle_occupancy()
+    frappe.logger().info(f"Rebuilt availability calendar: {rows} bookings")
+    return rows
+
+@instrumented()
+def generate_lease_invoices(date=None):
+    """Invoice every lease schedule line that has fallen due
+
+    Lines are billed in batches on the long queue; progress and failures are
+    recorded on the day's Lease Billing Run. Re-running on the same day only
+    picks up lines that are still pending.
+    """
+    run_name = start_billing_run(date)
+    frappe.logger().info(f"Started lease billing run {run_name}")
+    return {"run": run_name, "rows": frappe.db.get_value("Lease Billing Run", run_name, "due_lines")}
 
+@instrumented()
+def send_expiry_alerts():
+    """Send alerts for documents expiring in the next 30 days"""
+    expiry_types = [t for t in EXPIRY_SOURCES if t != "Service Due"]
+
+    alerts = []
+    for row in iter_expiries(expiry_types, from_date=today(), to_date=add_days(today(), 30)):
+        # A vehicle can carry several documents expiring on the same day
+        threshold = f"{row.expiry_date} {row.holder}" if row.expiry_type == "Vehicle Document" else row.expiry_date
+        alerts.append(make_alert(f"{row.expiry_type} Expiring", f"{row.expiry_type} Expiring",
+                                 f"{row.expiry_type} for {describe_expiry(row)} expires on {row.expiry_date}",
+                                 row.reference_doctype, row.reference_name, threshold))
+
+    return dispatch_alerts(alerts)
+
+@instrumented()
 def check_maintenance_due():
     """Check vehicles due for maintenance"""
-    vehicles = frappe.get_all(
-        "Vehicle",
-        filters={
-            "status": ["!=", "Deactivated"],
-            "next_service_due": ["<=", add_days(today(), 7)]
-        },
-        fields=["name", "plate_no", "next_service_due", "odometer"]
-    )
-    
-    for vehicle in vehicles:
-        send_alert("Maintenance Due",
-                   f"Vehicle {vehicle.plate_no} is due for maintenance on {vehicle.next_service_due}")
-
-def send_alert(subject, message):
-    """Send alert to admin users"""
-    admins = frappe.get_all("Has Role", 
-                           filters={"role": "Right Hire Admin", "parenttype": "User"}, 
-                           pluck="parent")
-    
-    for admin in admins:
-        try:
-            frappe.get_doc({
-                "doctype": "Notification Log",
-                "subject": subject,
-                "email_content": message,
-                "for_user": admin,
-                "type": "Alert"
-            }).insert(ignore_permissions=True)
-        except Exception as e:
-            frappe.log_error(f"Failed to send alert to {admin}: {str(e)}")
+    return dispatch_alerts([
+        make_alert("Maintenance Due", "Maintenance Due",
+                   f"Vehicle {row.plate_no} is due for maintenance on {row.expiry_date}",
+                   row.reference_doctype, row.reference_name, row.expiry_date)
+        for row in iter_expiries(["Service Due"], to_date=add_days(today(), 7))
+    ])
+
+def describe_expiry(row):
+    """Human label for what is expiring: plate number, holder or document name"""
+    if row.plate_no:
+        return f"{row.plate_no} ({row.holder})" if row.holder else row.plate_no
+    return row.holder or row.reference_name
+
+def send_alert(subject, message, reference_doctype=None, reference_name=None, threshold=None):
+    """Send alert to admin users
+
+    Alerts with a reference are sent once per (subject, reference, threshold).
+    """
+    return dispatch_alerts([
+        make_alert(subject, subject, message, reference_doctype, reference_name, threshold)
+    ])
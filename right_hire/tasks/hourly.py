@@ -1,82 +1,247 @@
 # Copyright (c) 2024, Right Hire and contributors
 # For license information, please see license.txt
 
+from itertools import groupby
+
 import frappe
-from frappe.utils import now, now_datetime, add_to_date
-
-def check_reservation_conflicts():
-    """Check for reservation conflicts hourly"""
-    # Get reservations starting in next 24 hours
-    next_24_hours = add_to_date(now_datetime(), hours=24)
-    
-    reservations = frappe.get_all(
-        "Reservation",
-        filters={
-            "reservation_status": ["in", ["Confirmed", "Allocated"]],
-            "pickup_datetime": ["<=", next_24_hours]
-        },
-        fields=["name", "vehicle", "pickup_datetime", "return_datetime"]
-    )
-    
-    for reservation in reservations:
-        if reservation.vehicle:
-            # Check for conflicts
-            conflicts = frappe.db.sql("""
-                SELECT name FROM tabReservation
-                WHERE vehicle = %s
-                AND name != %s
-                AND reservation_status IN ('Confirmed', 'Allocated')
-                AND (
-                    (pickup_datetime <= %s AND return_datetime >= %s)
-                    OR (pickup_datetime <= %s AND return_datetime >= %s)
-                    OR (pickup_datetime >= %s AND return_datetime <= %s)
-                )
-            """, (reservation.vehicle, reservation.name,
-                  reservation.pickup_datetime, reservation.pickup_datetime,
-                  reservation.return_datetime, reservation.return_datetime,
-                  reservation.pickup_datetime, reservation.return_datetime))
-            
+from frappe.utils import cint, now, now_datetime, add_to_date
+
+from right_hire.right_hire import status_counts, vin_cache
+from right_hire.right_hire.availability import find_overlaps
+from right_hire.right_hire.report_cache import invalidate_doctypes
+from right_hire.tasks.chunked import run_chunked
+from right_hire.tasks.instrumentation import instrumented
+
+CONFLICT_RESERVATION_STATUSES = ("Confirmed", "Allocated")
+CONFLICT_AGREEMENT_STATUSES = ("Active", "Due for Return")
+OVERDUE_NOTIFICATION_BATCH_SIZE = 50
+# Recorded as modified_by / owner of rows written by scheduled jobs
+SCHEDULER_USER = "Administrator"
+
+
+@instrumented()
+def check_reservation_conflicts(lookahead_hours=None, chunk_size=None):
+    """Check for reservation conflicts hourly
+
+    Loads the bookings of every vehicle with a reservation starting inside the
+    look-ahead window from the Vehicle Occupancy calendar, finds overlapping
+    pairs with a sweep-line pass and publishes one grouped
+    `reservation_conflict` event per vehicle.
+
+    Site config:
+        right_hire_conflict_lookahead_hours: window size (default 24)
+        right_hire_conflict_chunk_size: vehicles per partition, 0 = all at once
+    """
+    now_dt = now_datetime()
+    lookahead_hours = cint(lookahead_hours or frappe.conf.get("right_hire_conflict_lookahead_hours") or 24)
+    chunk_size = cint(chunk_size or frappe.conf.get("right_hire_conflict_chunk_size") or 0)
+    window_end = add_to_date(now_dt, hours=lookahead_hours)
+
+    # Vehicles with a reservation starting in the window, and how far ahead to scan for each
+    scan_until = dict(frappe.db.sql("""
+        SELECT vehicle, MAX(end_datetime)
+        FROM `tabVehicle Occupancy`
+        WHERE reference_doctype = 'Reservation'
+        AND status IN %(statuses)s
+        AND start_datetime < %(window_end)s
+        AND end_datetime > %(now)s
+        GROUP BY vehicle
+    """, {"statuses": CONFLICT_RESERVATION_STATUSES, "window_end": window_end, "now": now_dt}))
+
+    vehicles = sorted(scan_until)
+    if not vehicles:
+        return 0
+
+    step = chunk_size or len(vehicles)
+    for i in range(0, len(vehicles), step):
+        partition = vehicles[i:i + step]
+        bookings = get_partition_bookings(partition, now_dt, max(scan_until[v] for v in partition))
+
+        for vehicle, rows in groupby(bookings, key=lambda b: b.vehicle):
+            rows = [b for b in rows if b.start < scan_until[vehicle]]
+            conflicts = get_window_conflicts(rows, window_end)
             if conflicts:
-                # Send alert
-                frappe.publish_realtime("reservation_conflict", {
-                    "reservation": reservation.name,
-                    "conflicts": [c[0] for c in conflicts]
-                })
-                
-                frappe.logger().warning(
-                    f"Reservation conflict detected: {reservation.name} conflicts with {[c[0] for c in conflicts]}"
-                )
-
-def check_overdue_returns():
-    """Check for overdue vehicle returns"""
-    overdue_agreements = frappe.get_all(
-        "Rental Agreement",
-        filters={
-            "agreement_status": "Active",
-            "end_datetime": ["<", now()]
-        },
-        fields=["name", "customer", "vehicle", "end_datetime"]
+                publish_vehicle_conflicts(vehicle, conflicts)
+
+    return len(vehicles)
+
+
+def get_partition_bookings(vehicles, now_dt, scan_end):
+    """Load reservations and active agreements for a vehicle partition, ordered for the sweep"""
+    return frappe.db.sql("""
+        SELECT reference_doctype AS doctype, reference_name AS name, vehicle,
+            start_datetime AS start,
+            CASE
+                WHEN reference_doctype = 'Rental Agreement' THEN GREATEST(end_datetime, %(now)s)
+                ELSE end_datetime
+            END AS end
+        FROM `tabVehicle Occupancy`
+        WHERE vehicle IN %(vehicles)s
+        AND start_datetime < %(scan_end)s
+        AND (
+            (reference_doctype = 'Reservation'
+                AND status IN %(reservation_statuses)s
+                AND end_datetime > %(now)s)
+            OR (reference_doctype = 'Rental Agreement'
+                AND status IN %(agreement_statuses)s)
+        )
+        ORDER BY vehicle, start_datetime
+    """, {
+        "vehicles": tuple(vehicles),
+        "reservation_statuses": CONFLICT_RESERVATION_STATUSES,
+        "agreement_statuses": CONFLICT_AGREEMENT_STATUSES,
+        "now": now_dt,
+        "scan_end": scan_end,
+    }, as_dict=True)
+
+
+def get_window_conflicts(bookings, window_end):
+    """Overlapping pairs that involve a reservation picking up inside the window"""
+    def in_window(booking):
+        return booking.doctype == "Reservation" and booking.start < window_end
+
+    conflicts = []
+    for earlier, later in find_overlaps(bookings):
+        if earlier.doctype == "Rental Agreement" and later.doctype == "Rental Agreement":
+            continue
+        if not (in_window(earlier) or in_window(later)):
+            continue
+        conflicts.append((earlier, later))
+
+    return conflicts
+
+
+def publish_vehicle_conflicts(vehicle, conflicts):
+    """Send one grouped realtime event for all conflicts on a vehicle"""
+    reservations = sorted({
+        b.name for pair in conflicts for b in pair if b.doctype == "Reservation"
+    })
+
+    frappe.publish_realtime("reservation_conflict", {
+        "vehicle": vehicle,
+        "reservations": reservations,
+        "conflicts": [
+            {
+                "doctype": earlier.doctype,
+                "name": earlier.name,
+                "conflicts_with_doctype": later.doctype,
+                "conflicts_with": later.name,
+            }
+            for earlier, later in conflicts
+        ]
+    })
+
+    frappe.logger().warning(
+        f"Reservation conflict detected on vehicle {vehicle}: "
+        + ", ".join(f"{a.name} <> {b.name}" for a, b in conflicts)
     )
-    
-    for agreement in overdue_agreements:
-        try:
-            # Update status
-            doc = frappe.get_doc("Rental Agreement", agreement.name)
-            doc.agreement_status = "Due for Return"
-            doc.is_overdue = 1
-            doc.save(ignore_permissions=True)
-            
-            # Send notification
-            send_overdue_notification(doc)
-            
-            frappe.logger().info(f"Marked agreement {agreement.name} as overdue")
-        except Exception as e:
-            frappe.log_error(f"Failed to process overdue agreement {agreement.name}: {str(e)}")
-
-def send_overdue_notification(agreement):
+
+@instrumented()
+def check_overdue_returns(batch_size=None):
+    """Check for overdue vehicle returns
+
+    Flips every newly overdue Active agreement to Due for Return in one
+    guarded UPDATE, records a Version entry for each, and queues customer
+    notifications in batches. Agreements already flagged are not selected,
+    so a quiet hour costs a single indexed query.
+    """
+    batch_size = cint(batch_size) or OVERDUE_NOTIFICATION_BATCH_SIZE
+    timestamp = now()
+
+    # FOR UPDATE makes an overlapping run wait here and then see these rows as already flagged
+    overdue = frappe.db.sql("""
+        SELECT name, customer, vehicle, end_datetime
+        FROM `tabRental Agreement`
+        WHERE docstatus = 1
+        AND agreement_status = 'Active'
+        AND end_datetime < %(now)s
+        FOR UPDATE
+    """, {"now": timestamp}, as_dict=True)
+
+    if not overdue:
+        return 0
+
+    names = tuple(a.name for a in overdue)
+    frappe.db.sql("""
+        UPDATE `tabRental Agreement`
+        SET agreement_status = 'Due for Return', is_overdue = 1,
+            modified = %(now)s, modified_by = %(user)s
+        WHERE name IN %(names)s
+        AND docstatus = 1
+        AND agreement_status = 'Active'
+    """, {"names": names, "now": timestamp, "user": SCHEDULER_USER})
+
+    frappe.db.sql("""
+        UPDATE `tabVehicle Occupancy`
+        SET status = 'Due for Return', modified = %(now)s
+        WHERE reference_doctype = 'Rental Agreement'
+        AND reference_name IN %(names)s
+    """, {"names": names, "now": timestamp})
+
+    add_overdue_versions(names, timestamp)
+    invalidate_doctypes(["Rental Agreement"])
+    status_counts.refresh_status_counts(["Rental Agreement"])
+
+    batches = [overdue[offset:offset + batch_size] for offset in range(0, len(overdue), batch_size)]
+    run_chunked(
+        "overdue_notifications",
+        "right_hire.tasks.hourly.send_overdue_notifications",
+        [(f"{batch[0].name}..{batch[-1].name}", {"agreements": batch}) for batch in batches],
+        run_id=timestamp,
+    )
+
+    frappe.logger().info(f"Marked {len(overdue)} agreements as overdue")
+    return len(overdue)
+
+@instrumented()
+def reconcile_status_counts():
+    """Rebuild the status counters from the database, correcting any drift"""
+    return status_counts.reconcile_status_counts()
+
+@instrumented()
+def flush_vin_cache_hits():
+    """Add the VIN decode cache hits counted in Redis to the cache table"""
+    return vin_cache.flush_cache_hits()
+
+def add_overdue_versions(names, timestamp):
+    """Bulk insert the Version entries a document save would have written"""
+    user = SCHEDULER_USER
+    data = frappe.as_json({
+        "changed": [["agreement_status", "Active", "Due for Return"], ["is_overdue", 0, 1]],
+        "added": [],
+        "removed": [],
+        "row_changed": [],
+    })
+    frappe.db.bulk_insert(
+        "Version",
+        fields=["name", "creation", "modified", "owner", "modified_by", "ref_doctype", "docname", "data"],
+        values=[
+            (frappe.generate_hash(length=10), timestamp, timestamp, user, user, "Rental Agreement", name, data)
+            for name in names
+        ],
+    )
+
+def send_overdue_notifications(agreements):
+    """Background job: email customers for a batch of overdue agreements"""
+    agreements = [frappe._dict(a) for a in agreements]
+    customers = {
+        c.name: c
+        for c in frappe.get_all(
+            "Customer",
+            filters={"name": ["in", list({a.customer for a in agreements if a.customer})]},
+            fields=["name", "customer_name", "email"],
+        )
+    }
+
+    for agreement in agreements:
+        send_overdue_notification(agreement, customers.get(agreement.customer))
+
+    return len(agreements)
+
+def send_overdue_notification(agreement, customer=None):
     """Send overdue notification to customer and staff"""
     try:
-        customer = frappe.get_doc("Customer", agreement.customer)
+        customer = customer or frappe.get_doc("Customer", agreement.customer)
         
         if customer.email:
             frappe.sendmail(
@@ -0,0 +1,138 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+"""Scheduler job instrumentation.
+
+Wrap a task with `@instrumented()` to record a `Right Hire Job Run` for every
+execution: start / end, duration, rows processed, errors passed to
+`frappe.log_error`, and the number and total time of SQL queries issued.
+
+Rows processed come from the task's return value: an int, a list (its
+length), or a dict (its `rows` key, else the sum of its integer values, e.g.
+bulk_upsert's inserted / updated). Tasks can also add to the count
+explicitly with `record_rows`.
+
+Calls made while another instrumented job is already running (e.g. a task
+calling another task inline) are counted as part of the outer run.
+"""
+
+import functools
+import time
+
+import frappe
+from frappe.utils import cint, now_datetime
+
+
+def instrumented(job_name=None):
+    """Decorator recording a Right Hire Job Run for each call of the wrapped task."""
+    def decorator(fn):
+        name = job_name or f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if getattr(frappe.local, "right_hire_job_run", None) is not None:
+                return fn(*args, **kwargs)
+
+            run = frappe._dict(job_name=name, started_at=now_datetime(), rows=0, errors=0, query_count=0, query_time=0)
+            frappe.local.right_hire_job_run = run
+            restore = install_counters(run)
+            started = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                restore()
+                frappe.db.rollback()
+                save_job_run(run, started, status="Failed", traceback=frappe.get_traceback())
+                raise
+            else:
+                restore()
+                run.rows += get_row_count(result)
+                save_job_run(run, started, status="Success")
+                return result
+            finally:
+                frappe.local.right_hire_job_run = None
+
+        return wrapper
+
+    return decorator
+
+
+def record_rows(count):
+    """Add to the rows processed by the current instrumented job, if any."""
+    run = getattr(frappe.local, "right_hire_job_run", None)
+    if run is not None:
+        run.rows += cint(count)
+
+
+def get_row_count(result):
+    """Rows processed, read from a task's return value."""
+    if isinstance(result, bool) or result is None:
+        return 0
+    if isinstance(result, int):
+        return result
+    if isinstance(result, (list, tuple, set)):
+        return len(result)
+    if isinstance(result, dict):
+        if "rows" in result:
+            return cint(result["rows"])
+        return sum(v for v in result.values() if isinstance(v, int) and not isinstance(v, bool))
+    return 0
+
+
+def install_counters(run):
+    """Count queries and logged errors into `run`; returns a function undoing it.
+
+    `frappe.db.sql` is wrapped on the connection object, so get_value,
+    get_all and friends are counted too.
+    """
+    db = frappe.db
+    previous_sql = db.__dict__.get("sql")
+    sql = db.sql
+    log_error = frappe.log_error
+
+    def counted_sql(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return sql(*args, **kwargs)
+        finally:
+            run.query_count += 1
+            run.query_time += time.perf_counter() - started
+
+    def counted_log_error(*args, **kwargs):
+        run.errors += 1
+        return log_error(*args, **kwargs)
+
+    db.sql = counted_sql
+    frappe.log_error = counted_log_error
+
+    def restore():
+        if previous_sql is None:
+            db.__dict__.pop("sql", None)
+        else:
+            db.sql = previous_sql
+        frappe.log_error = log_error
+
+    return restore
+
+
+def save_job_run(run, started, status, traceback=None):
+    """Insert the Right Hire Job Run and commit it."""
+    try:
+        frappe.get_doc({
+            "doctype": "Right Hire Job Run",
+            "job_name": run.job_name,
+            "status": status,
+            "started_at": run.started_at,
+            "finished_at": now_datetime(),
+            "duration": round(time.monotonic() - started, 3),
+            "rows_processed": run.rows,
+            "errors": run.errors,
+            "query_count": run.query_count,
+            "query_time": round(run.query_time, 3),
+            "traceback": traceback,
+        }).insert(ignore_permissions=True)
+        frappe.db.commit()
+    except Exception:
+        # Never let bookkeeping fail the job itself
+        frappe.db.rollback()
+        frappe.log_error(f"Failed to record job run for {run.job_name}")
@@ -4,81 +4,20 @@
 import frappe
 from frappe.utils import getdate, nowdate, add_months, get_first_day, get_last_day, today
 
-def generate_lease_invoices():
-    """Generate monthly invoices for active lease contracts"""
-    current_date = getdate(today())
-    
-    # Get active lease contracts
-    leases = frappe.get_all(
-        "Lease Contract",
-        filters={
-            "lease_status": "Active",
-            "billing_cycle": "Monthly"
-        },
-        fields=["name", "billing_day"]
-    )
-    
-    for lease in leases:
-        try:
-            lease_doc = frappe.get_doc("Lease Contract", lease.name)
-            
-            # Check if invoice is due
-            if current_date.day == lease.billing_day:
-                # Find pending schedule line
-                for schedule in lease_doc.invoice_schedule:
-                    if schedule.status == "Pending" and getdate(schedule.period_start) <= current_date:
-                        invoice_name = lease_doc.create_monthly_invoice(
-                            schedule.period_start,
-                            schedule.period_end
-                        )
-                        frappe.logger().info(f"Created invoice {invoice_name} for lease {lease.name}")
-                        break
-        except Exception as e:
-            frappe.log_error(f"Failed to create invoice for lease {lease.name}: {str(e)}")
+from right_hire.right_hire.profitability import calculate_profitability_chunked
+from right_hire.tasks.instrumentation import instrumented
+
+@instrumented()
+def calculate_profitability(month=None):
+    """Calculate monthly profitability per vehicle
 
-def calculate_profitability():
-    """Calculate monthly profitability per vehicle"""
-    current_date = today()
-    start_date = get_first_day(current_date)
-    end_date = get_last_day(current_date)
-    
-    vehicles = frappe.get_all("Vehicle", 
-                             filters={"status": ["!=", "Deactivated"]},
-                             pluck="name")
-    
-    for vehicle in vehicles:
-        try:
-            # Get revenue
-            revenue = frappe.db.sql("""
-                SELECT SUM(grand_total) as total
-                FROM tabRental Agreement
-                WHERE vehicle = %s
-                AND DATE(start_datetime) >= %s
-                AND DATE(start_datetime) <= %s
-                AND agreement_status NOT IN ('Cancelled', 'Draft')
-            """, (vehicle, start_date, end_date), as_dict=True)
-            
-            # Get maintenance costs
-            maintenance_cost = frappe.db.sql("""
-                SELECT SUM(actual_cost) as total
-                FROM tabMaintenance Job
-                WHERE vehicle = %s
-                AND DATE(job_date) >= %s
-                AND DATE(job_date) <= %s
-                AND job_status = 'Completed'
-            """, (vehicle, start_date, end_date), as_dict=True)
-            
-            total_revenue = revenue[0].total if revenue and revenue[0].total else 0
-            total_cost = maintenance_cost[0].total if maintenance_cost and maintenance_cost[0].total else 0
-            net_profit = total_revenue - total_cost
-            
-            # Update vehicle
-            vehicle_doc = frappe.get_doc("Vehicle", vehicle)
-            vehicle_doc.total_revenue = total_revenue
-            vehicle_doc.total_maintenance_cost = total_cost
-            vehicle_doc.net_profit = net_profit
-            vehicle_doc.save(ignore_permissions=True)
-            
-            frappe.logger().info(f"Updated profitability for vehicle {vehicle}")
-        except Exception as e:
-            frappe.log_error(f"Failed to calculate profitability for {vehicle}: {str(e)}")
+    Writes the Vehicle Profitability ledger rows of the month that just
+    closed (or `month`) as resumable vehicle chunks on the long queue; the
+    lifetime totals on Vehicle are refreshed from the ledger once the last
+    chunk finishes.
+    """
+    result = calculate_profitability_chunked(month or add_months(today(), -1))
+    frappe.logger().info(
+        f"Profitability ledger: {result['queued']} chunks queued, {result['skipped']} already done"
+    )
+    return result
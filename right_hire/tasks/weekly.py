@@ -1,86 +1,149 @@
 # Copyright (c) 2024, Right Hire and contributors
 # For license information, please see license.txt
 
+import csv
+from io import StringIO
+
 import frappe
-from frappe.utils import add_days, today
+from frappe.utils import add_days, escape_html, flt, today
+
+from right_hire.tasks.instrumentation import instrumented
+
+REPORT_ROLES = ("Fleet Manager", "Right Hire Admin")
+# Fleets larger than twice this get only the top / bottom vehicles in the body
+SUMMARY_ROWS = 10
+CSV_COLUMNS = [
+    ("vehicle", "Vehicle"),
+    ("plate_no", "Plate No"),
+    ("branch", "Branch"),
+    ("days", "Days"),
+    ("avg_utilization", "Utilization %"),
+    ("total_revenue", "Revenue"),
+    ("total_hours", "Rented Hours"),
+]
 
+@instrumented()
 def generate_utilization_report():
     """Generate weekly utilization summary report"""
     end_date = today()
     start_date = add_days(end_date, -7)
-    
-    vehicles = frappe.get_all("Vehicle", 
-                             filters={"status": ["!=", "Deactivated"]},
-                             pluck="name")
-    
-    report_data = []
-    
-    for vehicle in vehicles:
-        snapshots = frappe.get_all(
-            "Utilization Snapshot",
-            filters={
-                "vehicle": vehicle,
-                "snapshot_date": ["between", [start_date, end_date]]
-            },
-            fields=["utilization_pct", "revenue", "rented_hours"]
-        )
-        
-        if snapshots:
-            avg_utilization = sum([s.utilization_pct for s in snapshots]) / len(snapshots)
-            total_revenue = sum([s.revenue for s in snapshots])
-            total_hours = sum([s.rented_hours for s in snapshots])
-            
-            report_data.append({
-                "vehicle": vehicle,
-                "avg_utilization": avg_utilization,
-                "total_revenue": total_revenue,
-                "total_hours": total_hours
-            })
-    
-    report_data.sort(key=lambda x: x["avg_utilization"], reverse=True)
+
+    report_data = get_weekly_utilization(start_date, end_date)
     send_weekly_report(report_data, start_date, end_date)
+    return len(report_data)
+
+def get_weekly_utilization(start_date, end_date):
+    """Per-vehicle utilization for the period from one grouped query, busiest first"""
+    return frappe.db.sql(
+        """
+        SELECT us.vehicle, v.plate_no, IFNULL(us.branch, v.branch) AS branch,
+            COUNT(*) AS days,
+            AVG(us.utilization_pct) AS avg_utilization,
+            SUM(us.revenue) AS total_revenue,
+            SUM(us.rented_hours) AS total_hours
+        FROM `tabUtilization Snapshot` us
+        INNER JOIN `tabVehicle` v ON v.name = us.vehicle
+        WHERE us.snapshot_date BETWEEN %(start_date)s AND %(end_date)s
+          AND v.status != 'Deactivated'
+        GROUP BY us.vehicle
+        ORDER BY avg_utilization DESC, us.vehicle
+        """,
+        {"start_date": start_date, "end_date": end_date},
+        as_dict=True,
+    )
+
+def get_branch_summary(data):
+    """Vehicle count, average utilization, revenue and hours per branch"""
+    branches = {}
+    for row in data:
+        branch = branches.setdefault(row.branch or "No Branch", frappe._dict(
+            branch=row.branch or "No Branch", vehicles=0, utilization=0, total_revenue=0, total_hours=0
+        ))
+        branch.vehicles += 1
+        branch.utilization += flt(row.avg_utilization)
+        branch.total_revenue += flt(row.total_revenue)
+        branch.total_hours += flt(row.total_hours)
+
+    for branch in branches.values():
+        branch.avg_utilization = branch.utilization / branch.vehicles
+    return sorted(branches.values(), key=lambda b: b.branch)
+
+def build_csv(data):
+    """The full per-vehicle table as CSV text"""
+    out = StringIO()
+    writer = csv.writer(out)
+    writer.writerow([label for _field, label in CSV_COLUMNS])
+    for row in data:
+        writer.writerow([
+            round(flt(row[field]), 2) if field in ("avg_utilization", "total_revenue", "total_hours") else row[field]
+            for field, _label in CSV_COLUMNS
+        ])
+    return out.getvalue()
+
+def render_table(title, rows, first_column, first_label):
+    """HTML table of utilization rows for the email body"""
+    body = "".join(
+        "<tr><td>{0}</td><td align='right'>{1:.2f}%</td><td align='right'>{2:,.2f}</td>"
+        "<td align='right'>{3:,.2f}</td></tr>".format(
+            escape_html(row[first_column] or ""),
+            flt(row.avg_utilization),
+            flt(row.total_revenue),
+            flt(row.total_hours),
+        )
+        for row in rows
+    )
+    return (
+        f"<h4>{title}</h4><table border='1' cellpadding='4' cellspacing='0'>"
+        f"<tr><th>{first_label}</th><th>Utilization %</th><th>Revenue</th><th>Hours</th></tr>"
+        f"{body}</table>"
+    )
+
+def render_report(data, start_date, end_date):
+    """Email body: branch summary plus all vehicles, or only the top / bottom for large fleets"""
+    sections = [
+        f"<p>Weekly Fleet Utilization Report<br>Period: {start_date} to {end_date}<br>"
+        f"Total Vehicles: {len(data)}</p>",
+        render_table("By Branch", get_branch_summary(data), "branch", "Branch"),
+    ]
+
+    if len(data) > SUMMARY_ROWS * 2:
+        sections.append(render_table(f"Top {SUMMARY_ROWS} Vehicles", data[:SUMMARY_ROWS], "vehicle", "Vehicle"))
+        sections.append(render_table(f"Bottom {SUMMARY_ROWS} Vehicles", data[-SUMMARY_ROWS:], "vehicle", "Vehicle"))
+    else:
+        sections.append(render_table("Vehicles", data, "vehicle", "Vehicle"))
+
+    sections.append("<p>The full per-vehicle table is attached.</p>")
+    return "".join(sections)
+
+def get_report_recipients():
+    """Enabled users holding a report role"""
+    return frappe.db.sql_list(
+        """
+        SELECT DISTINCT hr.parent
+        FROM `tabHas Role` hr
+        INNER JOIN `tabUser` u ON u.name = hr.parent
+        WHERE hr.role IN %(roles)s AND hr.parenttype = 'User' AND u.enabled = 1
+        """,
+        {"roles": REPORT_ROLES},
+    )
 
 def send_weekly_report(data, start_date, end_date):
     """Send weekly report to fleet managers"""
-    managers = frappe.get_all("Has Role",
-                             filters={"role": ["in", ["Fleet Manager", "Right Hire Admin"]], 
-                                     "parenttype": "User"},
-                             pluck="parent")
-    
+    managers = get_report_recipients()
+
     if not managers or not data:
         return
-    
-    # Build simple text report
-    message_lines = []
-    message_lines.append("Weekly Fleet Utilization Report")
-    message_lines.append("=" * 50)
-    message_lines.append("Period: {0} to {1}".format(start_date, end_date))
-    message_lines.append("")
-    message_lines.append("{:<20} {:>15} {:>15} {:>15}".format(
-        "Vehicle", "Utilization %", "Revenue", "Hours"
-    ))
-    message_lines.append("-" * 70)
-    
-    for row in data:
-        message_lines.append("{:<20} {:>14.2f}% {:>14.2f} {:>14.2f}".format(
-            row['vehicle'][:20],
-            row['avg_utilization'],
-            row['total_revenue'],
-            row['total_hours']
-        ))
-    
-    message_lines.append("-" * 70)
-    message_lines.append("")
-    message_lines.append("Total Vehicles: {0}".format(len(data)))
-    
-    message_text = "\n".join(message_lines)
-    
-    for manager in managers:
-        try:
-            frappe.sendmail(
-                recipients=[manager],
-                subject="Weekly Fleet Utilization Report - {0} to {1}".format(start_date, end_date),
-                message="<pre>{0}</pre>".format(message_text)
-            )
-        except Exception as e:
-            frappe.log_error("Failed to send weekly report to {0}: {1}".format(manager, str(e)))
+
+    try:
+        # One queued email for all managers, with the full table attached
+        frappe.sendmail(
+            recipients=managers,
+            subject="Weekly Fleet Utilization Report - {0} to {1}".format(start_date, end_date),
+            message=render_report(data, start_date, end_date),
+            attachments=[{
+                "fname": f"fleet-utilization-{start_date}-to-{end_date}.csv",
+                "fcontent": build_csv(data),
+            }],
+        )
+    except Exception as e:
+        frappe.log_error("Failed to send weekly utilization report: {0}".format(str(e)))
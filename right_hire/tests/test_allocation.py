@@ -0,0 +1,170 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+import random
+import unittest
+from datetime import date, datetime, timedelta
+
+import frappe
+
+from right_hire.right_hire.allocation import AllocationEngine
+
+DAY = datetime(2024, 3, 1)
+
+
+def make_fleet(rng, count=40):
+    return [
+        {
+            "name": f"V-{i:03d}",
+            "branch": rng.choice(["North", "South"]),
+            "make": rng.choice(["Toyota", "Nissan"]),
+            "model": None,
+            "odometer": rng.randint(0, 100000),
+            "next_service_due": date(2024, 3, 1) + timedelta(days=rng.randint(-5, 40)),
+        }
+        for i in range(count)
+    ]
+
+
+def make_bookings(rng, fleet):
+    """Non-overlapping existing bookings, a few per vehicle."""
+    bookings = []
+    for vehicle in fleet:
+        cursor = DAY - timedelta(days=3) + timedelta(hours=rng.randint(0, 48))
+        for _i in range(rng.randint(0, 4)):
+            end = cursor + timedelta(hours=rng.randint(4, 72))
+            bookings.append({"vehicle": vehicle["name"], "start": cursor, "end": end})
+            cursor = end + timedelta(hours=rng.randint(0, 60))
+    return bookings
+
+
+def make_reservations(rng, count, pickup_spread_hours):
+    reservations = []
+    for i in range(count):
+        pickup = DAY + timedelta(hours=rng.randint(0, pickup_spread_hours))
+        reservations.append(frappe._dict(
+            name=f"RES-{i:03d}",
+            branch=rng.choice(["North", "South"]),
+            preferred_make=rng.choice([None, "Toyota", "Nissan"]),
+            preferred_model=None,
+            pickup_datetime=pickup,
+            return_datetime=pickup + timedelta(hours=rng.randint(2, 120)),
+        ))
+    return reservations
+
+
+def brute_force_cost(engine, reservation, vehicle, timeline):
+    """Cost of a vehicle for a reservation by scanning its whole timeline; None if it is busy."""
+    start, end = reservation.pickup_datetime, reservation.return_datetime
+    slots = timeline.get(vehicle, [])
+    if any(s < end and e > start for s, e in slots):
+        return None
+    prev_end = max((e for _s, e in slots if e <= start), default=None)
+    next_start = min((s for s, _e in slots if s >= end), default=None)
+    return (
+        engine.gap_cost(start, end, prev_end, next_start)
+        + engine.odometer_cost(vehicle)
+        + engine.service_cost(vehicle, end.date())
+    )
+
+
+def brute_force_best(engine, reservation, fleet, timeline):
+    costs = [
+        cost
+        for v in fleet
+        if v["branch"] == reservation.branch
+        and (not reservation.preferred_make or v["make"] == reservation.preferred_make)
+        for cost in [brute_force_cost(engine, reservation, v["name"], timeline)]
+        if cost is not None
+    ]
+    return min(costs, default=None)
+
+
+def get_timeline(bookings):
+    timeline = {}
+    for b in bookings:
+        timeline.setdefault(b["vehicle"], []).append((b["start"], b["end"]))
+    return timeline
+
+
+class TestAllocationEngine(unittest.TestCase):
+    def test_best_vehicle_matches_brute_force(self):
+        rng = random.Random(7)
+        fleet = make_fleet(rng)
+        bookings = make_bookings(rng, fleet)
+        engine = AllocationEngine(fleet, bookings)
+        timeline = get_timeline(bookings)
+
+        for reservation in make_reservations(rng, 50, pickup_spread_hours=72):
+            vehicle, cost = engine.best_vehicle(reservation)
+            expected = brute_force_best(engine, reservation, fleet, timeline)
+            if expected is None:
+                self.assertIsNone(vehicle)
+            else:
+                self.assertAlmostEqual(cost, expected)
+                self.assertAlmostEqual(brute_force_cost(engine, reservation, vehicle, timeline), expected)
+
+    def test_touching_booking_is_feasible(self):
+        fleet = [{"name": "V-1", "branch": "North", "make": "Toyota", "model": None, "odometer": 0}]
+        engine = AllocationEngine(fleet, [{"vehicle": "V-1", "start": DAY, "end": DAY + timedelta(hours=10)}])
+        reservation = frappe._dict(
+            name="RES-1", branch="North", pickup_datetime=DAY + timedelta(hours=10),
+            return_datetime=DAY + timedelta(hours=20),
+        )
+
+        self.assertEqual(engine.best_vehicle(reservation)[0], "V-1")
+        reservation.pickup_datetime = DAY + timedelta(hours=9)
+        self.assertIsNone(engine.best_vehicle(reservation)[0])
+
+    def test_vehicle_with_overlapping_bookings_is_excluded(self):
+        fleet = [{"name": "V-1", "branch": "North", "make": "Toyota", "model": None, "odometer": 0}]
+        engine = AllocationEngine(fleet, [
+            {"vehicle": "V-1", "start": DAY, "end": DAY + timedelta(hours=10)},
+            {"vehicle": "V-1", "start": DAY + timedelta(hours=5), "end": DAY + timedelta(hours=15)},
+        ])
+        reservation = frappe._dict(
+            name="RES-1", branch="North", pickup_datetime=DAY + timedelta(days=5),
+            return_datetime=DAY + timedelta(days=6),
+        )
+
+        self.assertIsNone(engine.best_vehicle(reservation)[0])
+
+    def check_batch(self, seed, pickup_spread_hours):
+        rng = random.Random(seed)
+        fleet = make_fleet(rng)
+        bookings = make_bookings(rng, fleet)
+        reservations = make_reservations(rng, 60, pickup_spread_hours)
+        engine = AllocationEngine(fleet, bookings)
+        reference = AllocationEngine(fleet, bookings)
+
+        results = engine.assign_batch(reservations)
+
+        # Replay longest-first against a brute-force search on a growing timeline
+        timeline = get_timeline(bookings)
+        ordered = sorted(
+            reservations, key=lambda r: r.return_datetime - r.pickup_datetime, reverse=True
+        )
+        for reservation in ordered:
+            vehicle, cost = results[reservation.name]
+            expected = brute_force_best(reference, reservation, fleet, timeline)
+            if expected is None:
+                self.assertIsNone(vehicle)
+                continue
+            self.assertAlmostEqual(cost, expected)
+            self.assertIsNotNone(brute_force_cost(reference, reservation, vehicle, timeline))
+            timeline.setdefault(vehicle, []).append((reservation.pickup_datetime, reservation.return_datetime))
+
+        # No vehicle carries overlapping bookings after the batch
+        for slots in timeline.values():
+            slots.sort()
+            for (_s1, e1), (s2, _e2) in zip(slots, slots[1:]):
+                self.assertLessEqual(e1, s2)
+
+    def test_batch_within_one_day(self):
+        # Every pickup inside the gap horizon: assigned vehicles leave the far walk
+        for seed in range(5):
+            self.check_batch(seed, pickup_spread_hours=20)
+
+    def test_batch_over_several_days(self):
+        for seed in range(5):
+            self.check_batch(seed, pickup_spread_hours=24 * 6)
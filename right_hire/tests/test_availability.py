@@ -0,0 +1,74 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+import unittest
+from datetime import datetime, timedelta
+
+import frappe
+
+from right_hire.right_hire.availability import find_overlaps
+from right_hire.tasks.hourly import get_window_conflicts
+
+HOUR = timedelta(hours=1)
+
+
+def booking(name, start_hour, end_hour, doctype="Reservation"):
+    return frappe._dict(
+        name=name,
+        doctype=doctype,
+        start=datetime(2024, 3, 1) + start_hour * HOUR,
+        end=datetime(2024, 3, 1) + end_hour * HOUR,
+    )
+
+
+def names(pairs):
+    return {(earlier.name, later.name) for earlier, later in pairs}
+
+
+class TestFindOverlaps(unittest.TestCase):
+    def test_touching_bookings_do_not_overlap(self):
+        bookings = [booking("A", 0, 10), booking("B", 10, 20), booking("C", 20, 30)]
+
+        self.assertEqual(find_overlaps(bookings), [])
+
+    def test_overlapping_bookings(self):
+        bookings = [booking("A", 0, 10), booking("B", 9, 20), booking("C", 19, 21)]
+
+        self.assertEqual(names(find_overlaps(bookings)), {("A", "B"), ("B", "C")})
+
+    def test_contained_booking_overlaps_all_around_it(self):
+        bookings = [booking("A", 0, 48), booking("B", 5, 6), booking("C", 6, 7), booking("D", 40, 50)]
+
+        self.assertEqual(names(find_overlaps(bookings)), {("A", "B"), ("A", "C"), ("A", "D")})
+
+    def test_same_start_overlaps(self):
+        bookings = [booking("A", 0, 5), booking("B", 0, 1)]
+
+        self.assertEqual(names(find_overlaps(bookings)), {("A", "B")})
+
+    def test_matches_pairwise_check(self):
+        bookings = [
+            booking(str(i), start, start + length)
+            for i, (start, length) in enumerate([(0, 3), (1, 1), (2, 4), (4, 2), (6, 1), (6, 5), (8, 1), (11, 2)])
+        ]
+        expected = {
+            (a.name, b.name)
+            for i, a in enumerate(bookings)
+            for b in bookings[i + 1:]
+            if a.start < b.end and b.start < a.end
+        }
+
+        self.assertEqual(names(find_overlaps(bookings)), expected)
+
+
+class TestWindowConflicts(unittest.TestCase):
+    def test_agreement_pairs_and_reservations_outside_window_are_ignored(self):
+        bookings = [
+            booking("RA-1", 0, 30, "Rental Agreement"),
+            booking("RA-2", 5, 10, "Rental Agreement"),
+            booking("RES-1", 8, 12),
+            booking("RES-2", 25, 40),
+        ]
+
+        conflicts = get_window_conflicts(bookings, bookings[0].start + 24 * HOUR)
+        self.assertEqual(names(conflicts), {("RA-1", "RES-1"), ("RA-2", "RES-1")})
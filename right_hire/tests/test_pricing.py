@@ -0,0 +1,81 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+import unittest
+from datetime import datetime
+
+import frappe
+
+from right_hire.right_hire.pricing import compile_rate_plan, flatten_windows
+
+
+def d(day, hour=0):
+    return datetime(2024, 3, day, hour)
+
+
+def rate_plan(windows, rate_type="Daily", base_rate=100):
+    return frappe._dict(
+        name="Plan",
+        rate_type=rate_type,
+        base_rate=base_rate,
+        seasonal_windows=[
+            frappe._dict(start_date=start, end_date=end, multiplier=multiplier)
+            for start, end, multiplier in windows
+        ],
+    )
+
+
+class TestFlattenWindows(unittest.TestCase):
+    def test_highest_multiplier_wins_where_windows_overlap(self):
+        segments = flatten_windows(sorted([(d(1), d(10), 1.5), (d(5), d(15), 2.0), (d(12), d(20), 1.2)]))
+
+        self.assertEqual(segments, [(d(1), d(5), 1.5), (d(5), d(15), 2.0), (d(15), d(20), 1.2)])
+
+    def test_lower_window_inside_higher_is_absorbed(self):
+        segments = flatten_windows(sorted([(d(1), d(10), 2.0), (d(3), d(5), 1.5)]))
+
+        self.assertEqual(segments, [(d(1), d(10), 2.0)])
+
+    def test_gap_between_windows_is_left_out(self):
+        segments = flatten_windows(sorted([(d(1), d(3), 1.5), (d(5), d(7), 1.5)]))
+
+        self.assertEqual(segments, [(d(1), d(3), 1.5), (d(5), d(7), 1.5)])
+
+    def test_contiguous_windows_at_same_multiplier_merge(self):
+        segments = flatten_windows(sorted([(d(1), d(3), 1.5), (d(3), d(7), 1.5)]))
+
+        self.assertEqual(segments, [(d(1), d(7), 1.5)])
+
+
+class TestSeasonalDays(unittest.TestCase):
+    def test_window_end_date_is_inclusive(self):
+        pricing = compile_rate_plan(rate_plan([("2024-03-05", "2024-03-05", 2)]))
+
+        # The whole of 5 March is in the window, 6 March is not
+        self.assertAlmostEqual(pricing.seasonal_days(d(5), d(6)), 2)
+        self.assertAlmostEqual(pricing.seasonal_days(d(5, 12), d(6, 12)), 1.5)
+        self.assertAlmostEqual(pricing.seasonal_days(d(6), d(7)), 1)
+
+    def test_overlapping_windows_charge_highest_multiplier(self):
+        pricing = compile_rate_plan(rate_plan([
+            ("2024-03-01", "2024-03-10", 1.5),
+            ("2024-03-08", "2024-03-12", 3),
+        ]))
+
+        # 7 March at 1.5x, 8-9 March at 3x (not 4.5x or 1.5x), 13 March at 1x
+        self.assertAlmostEqual(pricing.seasonal_days(d(7), d(10)), 1.5 + 3 + 3)
+        self.assertAlmostEqual(pricing.seasonal_days(d(12), d(14)), 3 + 1)
+
+    def test_partial_days_and_rental_amount(self):
+        pricing = compile_rate_plan(rate_plan([("2024-03-02", "2024-03-02", 2)]))
+
+        self.assertAlmostEqual(pricing.seasonal_days(d(1, 18), d(2, 6)), 0.25 + 0.5)
+        self.assertAlmostEqual(pricing.rental_amount(d(1, 18), d(2, 6)), 75)
+        self.assertAlmostEqual(pricing.rental_amount(d(1, 18), d(2, 6), base_rate=40), 30)
+
+    def test_no_windows_and_empty_period(self):
+        pricing = compile_rate_plan(rate_plan([], rate_type="Weekly", base_rate=700))
+
+        self.assertAlmostEqual(pricing.seasonal_days(d(1), d(8)), 7)
+        self.assertAlmostEqual(pricing.rental_amount(d(1), d(8)), 700)
+        self.assertEqual(pricing.seasonal_days(d(8), d(1)), 0)
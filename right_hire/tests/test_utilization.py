@@ -0,0 +1,87 @@
+# Copyright (c) 2024, Right Hire and contributors
+# For license information, please see license.txt
+
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import frappe
+
+from right_hire.right_hire.utilization import clip_day, compute_utilization_rows
+
+
+def block(state, start, end, amount=0):
+    return frappe._dict(state=state, start=start, end=end, amount=amount)
+
+
+def job(status, start, end=None, hours=0):
+    return frappe._dict(vehicle="V-1", state="M", status=status, start=start, end=end, hours=hours)
+
+
+class TestClipDay(unittest.TestCase):
+    day_start = datetime(2024, 3, 1)
+    day_end = datetime(2024, 3, 2)
+
+    def test_block_across_midnight_is_clipped_to_each_day(self):
+        hire = block("H", datetime(2024, 3, 1, 18), datetime(2024, 3, 2, 6), amount=120)
+
+        hours, revenue = clip_day([hire], self.day_start, self.day_end)
+        self.assertEqual(hours["rented_hours"], 6)
+        self.assertAlmostEqual(revenue, 60)
+
+        hours, revenue = clip_day([hire], self.day_end, datetime(2024, 3, 3))
+        self.assertEqual(hours["rented_hours"], 6)
+        self.assertAlmostEqual(revenue, 60)
+
+    def test_block_outside_day_is_ignored(self):
+        hours, revenue = clip_day(
+            [block("H", datetime(2024, 2, 28), self.day_start, amount=100)], self.day_start, self.day_end
+        )
+        self.assertEqual(sum(hours.values()), 0)
+        self.assertEqual(revenue, 0)
+
+    def test_overlapping_hours_counted_once_under_highest_state(self):
+        blocks = [
+            block("H", datetime(2024, 2, 29), datetime(2024, 3, 3), amount=300),
+            block("M", datetime(2024, 3, 1, 10), datetime(2024, 3, 1, 14)),
+            block("W", datetime(2024, 3, 1, 12), datetime(2024, 3, 1, 16)),
+        ]
+
+        hours, revenue = clip_day(blocks, self.day_start, self.day_end)
+        self.assertEqual(hours["maintenance_hours"], 4)
+        self.assertEqual(hours["other_hours"], 2)
+        self.assertEqual(hours["rented_hours"], 18)
+        self.assertEqual(sum(hours.values()), 24)
+        self.assertAlmostEqual(revenue, 100)
+
+
+class TestUtilizationRows(unittest.TestCase):
+    vehicle = frappe._dict(name="V-1", branch="Main")
+
+    def get_rows(self, jobs):
+        def sql(query, *args, **kwargs):
+            return [frappe._dict(row) for row in jobs] if "tabMaintenance Job" in query else []
+
+        with patch.object(frappe, "db", MagicMock(sql=sql)):
+            return compute_utilization_rows([self.vehicle], "2024-03-01", "2024-03-03")
+
+    def test_completed_job_without_close_date_is_not_open_ended(self):
+        rows = self.get_rows([job("Completed", datetime(2024, 3, 1, 8))])
+
+        self.assertEqual([row["maintenance_hours"] for row in rows], [0, 0, 0])
+        self.assertEqual([row["availability_pct"] for row in rows], [100, 100, 100])
+
+    def test_completed_job_without_close_date_uses_downtime_hours(self):
+        rows = self.get_rows([job("Completed", datetime(2024, 3, 1, 20), hours=10)])
+
+        self.assertEqual([row["maintenance_hours"] for row in rows], [4, 6, 0])
+
+    def test_job_in_progress_runs_to_range_end(self):
+        rows = self.get_rows([job("In Progress", datetime(2024, 3, 2, 12))])
+
+        self.assertEqual([row["maintenance_hours"] for row in rows], [0, 12, 24])
+
+    def test_scheduled_job_is_not_counted(self):
+        rows = self.get_rows([job("Scheduled", datetime(2024, 3, 1))])
+
+        self.assertEqual([row["maintenance_hours"] for row in rows], [0, 0, 0])